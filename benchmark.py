@@ -0,0 +1,412 @@
+"""Offline benchmarks for NMM2CSV.
+
+Generates synthetic ROMs, NMMs and CSVs in a temporary folder and times
+ripping (n2c), compiling (c2ea), pointer searching (c2eaPfinder),
+comparing ROMs (romdiff) and finding free space (freespace) on them.
+
+Usage: python benchmark.py [-s 16,32] [-o results.json] [-c baseline.json] [--quick] [benchmark ...]
+Benchmarks: pointers, rip, compile, memory, diff, freespace (default: all of them)
+"""
+
+import csv, io, json, os, platform, random, tempfile, time, tracemalloc
+import c2ea, c2eaPfinder, freespace, n2c, pointercache, romdiff, romview, tablesnapshot
+
+# keys of result records that are measurements rather than what was measured
+METRICS = ('seconds', 'rowsPerSecond', 'mbPerSecond', 'peakBytes', 'perTarget', 'batched')
+
+# (name, rows) of the tables of a synthetic project, from a short list to a big animation table
+SYNTHETIC_TABLES = [
+    ("Small List", 64),
+    ("Class Table", 1000),
+    ("Item Table", 2000),
+    ("Animation Table", 20000),
+]
+
+# (description, length, type) of the columns of a synthetic item-like table
+SYNTHETIC_COLUMNS = [
+    ("Name", 2, "NEHU"),
+    ("Description", 2, "NEHU"),
+    ("Use text", 2, "NEHU"),
+    ("Number", 1, "NEHU"),
+    ("Type", 1, "NEDU"),
+    ("Ability 1", 1, "NEHU"),
+    ("Ability 2", 1, "NEHU"),
+    ("Stat bonuses", 4, "NEHU"),
+    ("Effectiveness", 4, "NEHU"),
+    ("Uses", 1, "NEDU"),
+    ("Might", 1, "NEDU"),
+    ("Hit", 1, "NEDS"),
+    ("Weight", 1, "NEDU"),
+    ("Crit", 1, "NEDU"),
+    ("Range", 1, "NEHU"),
+    ("Rank", 2, "NEHU"),
+    ("Odd", 3, "NEDS"),
+    ("Price", 3, "NEDU"),
+]
+
+def makeRom(path, size, seed = 0):
+    """writes a ROM of random words to path"""
+    rng = random.Random(seed)
+    with open(path, 'wb') as f:
+        f.write(rng.randbytes(size))
+
+def plantPointers(path, targets, count, seed = 1):
+    """writes count references to each target at random aligned offsets"""
+    rng = random.Random(seed)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        for target in targets:
+            for i in range(count):
+                f.seek(rng.randrange(0, size, 4))
+                f.write(target.to_bytes(4, 'little'))
+
+def layoutColumns(columns):
+    """gives (description, length, type) columns consecutive offsets, returns them as
+    (description, offset, length, type) columns and the row length"""
+    laidOut = []
+    position = 0
+    for description, length, dataType in columns:
+        laidOut.append((description, position, length, dataType))
+        position += length
+    return laidOut, position
+
+def makeColumns(rng, count):
+    """Returns random (description, offset, length, type) columns and the row length, mixing hex
+    and signed/unsigned decimal types, odd widths, overlapping columns and bytes no column describes."""
+    columns = []
+    position = 0
+    for i in range(count):
+        length = rng.choice((1, 1, 1, 1, 2, 2, 4, 3))
+        if length in (2, 4):
+            position += -position % length # most wide columns are aligned, like in real tables
+        if rng.random() < 0.1:
+            position += rng.randint(1, 3) # left to ##UNKNOWN## columns
+        if columns and rng.random() < 0.05:
+            offset = columns[-1][1] # overlaps the previous column
+        else:
+            offset = position
+            position += length
+        columns.append(("Column {}".format(i), offset, length, rng.choice(("HEXA", "NEHU", "NEDS", "NEDU"))))
+    rowLength = max([position] + [offset + length for description, offset, length, dataType in columns])
+    return columns, rowLength
+
+def writeNmm(path, offset, rowNum, columns = None, rowLength = None):
+    """writes an NMM with (description, offset, length, type) columns (default: the synthetic item table)"""
+    if columns is None:
+        columns, rowLength = layoutColumns(SYNTHETIC_COLUMNS)
+    lines = ["1", "Synthetic table", hex(offset), str(rowNum), str(rowLength), "NULL", "NULL", ""]
+    for description, position, length, dataType in columns:
+        lines.extend([description, str(position), str(length), dataType, "NULL", ""])
+    with open(path, 'w') as f:
+        f.write("\n".join(lines))
+
+def writeCsv(path, offset, rowNum, columns = None, symbolic = 0.05, seed = 2):
+    """writes a CSV for (description, offset, length, type) columns, a share of the cells being definitions instead of numbers"""
+    if columns is None:
+        columns = layoutColumns(SYNTHETIC_COLUMNS)[0]
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        wr = csv.writer(f, quoting = csv.QUOTE_ALL, lineterminator = '\n')
+        wr.writerow([hex(offset)] + [description for description, position, length, dataType in columns])
+        for row in range(rowNum):
+            cells = [hex(row)]
+            for description, position, length, dataType in columns:
+                if rng.random() < symbolic:
+                    cells.append("IsWeapon|IsMagic")
+                elif dataType[3] == 'S':
+                    cells.append(str(rng.randrange(-(1 << (8*length-1)), 1 << (8*length-1))))
+                elif dataType == 'HEXA' or dataType[2] == 'H':
+                    cells.append(hex(rng.randrange(1 << (8*length))))
+                else:
+                    cells.append(str(rng.randrange(1 << (8*length))))
+            wr.writerow(cells)
+
+def makeProject(directory, romSize, seed = 0):
+    """Writes a synthetic ROM of romSize bytes with an NMM for each of SYNTHETIC_TABLES.
+    Returns the ROM path and a list of (nmm path, rows, table bytes)."""
+    rng = random.Random(seed)
+    folder = os.path.join(directory, 'project{}'.format(romSize >> 20))
+    os.makedirs(folder, exist_ok = True)
+    romPath = os.path.join(folder, 'rom.gba')
+    makeRom(romPath, romSize, seed)
+    tables = []
+    offset = 0x100000
+    for name, rowNum in SYNTHETIC_TABLES:
+        columns, rowLength = makeColumns(rng, rng.randint(8, 24))
+        nmmPath = os.path.join(folder, name + '.nmm')
+        writeNmm(nmmPath, offset, rowNum, columns, rowLength)
+        tables.append((nmmPath, rowNum, rowNum*rowLength))
+        offset += (rowNum*rowLength + 0xFFF) & ~0xFFF
+    assert offset <= romSize, "ROM too small for the synthetic tables"
+    return romPath, tables
+
+def freshPointerCache(romPath):
+    """replaces the pointer cache by an empty in-memory one that already knows the ROM digest"""
+    c2eaPfinder.cache = pointercache.PointerCache(None)
+    c2eaPfinder.cache.digest(romPath)
+
+def timeIt(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def silently(func):
+    """runs func without letting it print"""
+    import contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func()
+
+def benchPointers(directory, sizes, quick):
+    """times the batched pointer search on each ROM size, and against the scan it replaced
+    (one pass of pointerIter over the ROM per target) on the first one"""
+    targetCounts = (1, 5) if quick else (1, 5, 10, 20, 40)
+    print("Pointer search (numpy {}):".format("enabled" if c2eaPfinder.numpy else "unavailable"))
+    print("{:>8} {:>8} {:>12} {:>12} {:>9} {:>10}".format("ROM", "targets", "per-target", "batched", "speedup", "MB/s"))
+
+    results = []
+    for sizeIndex, romSize in enumerate(sizes):
+        romPath = os.path.join(directory, 'pointers{}.gba'.format(romSize >> 20))
+        makeRom(romPath, romSize)
+        targets = [0x8000000 | (0x100000 + i*0x400) for i in range(max(targetCounts))]
+        plantPointers(romPath, targets, 3)
+        c2eaPfinder.readRom(romPath) # map the ROM up front so only the search is timed
+
+        for count in (targetCounts if sizeIndex == 0 else targetCounts[-1:]):
+            values = targets[:count]
+            record = {'romMB': romSize >> 20, 'targets': count}
+
+            freshPointerCache(romPath)
+            batched, found = timeIt(lambda: c2eaPfinder.pointerOffsetsMany(romPath, values))
+            record['batched'] = batched
+            record['mbPerSecond'] = (romSize >> 20)/batched
+
+            single = None
+            if sizeIndex == 0: # one scan per target is slow, only compare on the smallest ROM
+                single, expected = timeIt(lambda: {value: tuple(c2eaPfinder.pointerIter(romPath, value)) for value in values})
+                assert found == expected, "batched search disagrees with per-target search"
+                record['perTarget'] = single
+
+            print("{:>6}MB {:>8} {:>12} {:>11.3f}s {:>9} {:>10.1f}".format(
+                romSize >> 20, count,
+                "{:.3f}s".format(single) if single != None else "-",
+                batched,
+                "{:.1f}x".format(single/batched) if single != None else "-",
+                record['mbPerSecond']))
+            results.append(record)
+
+    c2eaPfinder.cache = None
+    return results
+
+def benchRip(directory, sizes, quick):
+    """times ripping every table of a synthetic project of each ROM size to CSV"""
+    print("NMM -> CSV (numpy {}):".format("enabled" if n2c.tabledecode.numpy else "unavailable"))
+    print("{:>8} {:>16} {:>8} {:>10} {:>12} {:>10}".format("ROM", "table", "rows", "time", "rows/s", "MB/s"))
+
+    results = []
+    for romSize in sizes:
+        romPath, tables = makeProject(directory, romSize)
+        romBytes = romview.openRom(romPath).data
+
+        for nmmPath, rowNum, size in tables:
+            seconds, ok = timeIt(lambda: silently(lambda: n2c.ripModule(nmmPath, romBytes, None)))
+            assert ok, "couldn't rip " + nmmPath
+            name = os.path.basename(nmmPath)[:-4]
+            print("{:>6}MB {:>16} {:>8} {:>9.3f}s {:>12.0f} {:>10.2f}".format(
+                romSize >> 20, name, rowNum, seconds, rowNum/seconds, size/seconds/(1 << 20)))
+            results.append({'romMB': romSize >> 20, 'table': name, 'rows': rowNum, 'seconds': seconds,
+                            'rowsPerSecond': rowNum/seconds, 'mbPerSecond': size/seconds/(1 << 20)})
+    return results
+
+def benchCompile(directory, sizes, quick):
+    """times compiling the CSVs ripped from a synthetic project to events, with macros and with #incbin,
+    then again from binary snapshots of the tables, and from CSVs with symbolic cells (definitions, not numbers)"""
+    print("CSV -> event:")
+    print("{:>16} {:>8} {:>12} {:>10} {:>12} {:>10}".format("table", "rows", "mode", "time", "rows/s", "MB/s"))
+
+    results = []
+    romPath, tables = makeProject(directory, sizes[0]) # the ROM isn't read for tables that aren't inlined
+    romBytes = romview.openRom(romPath).data
+    for nmmPath, rowNum, size in tables:
+        silently(lambda: n2c.ripModule(nmmPath, romBytes, None))
+        csvPath = nmmPath[:-4] + '.csv'
+        if os.path.exists(tablesnapshot.getSnapshotPath(csvPath)):
+            os.remove(tablesnapshot.getSnapshotPath(csvPath))
+        name = os.path.basename(nmmPath)[:-4]
+
+        # ripped CSVs are all numbers, so also compile one where some cells are definitions
+        nmm = c2ea.nightmare.loadTable(nmmPath)
+        symbolicPath = nmmPath[:-4] + ' symbolic.csv'
+        writeCsv(symbolicPath, nmm.offset, rowNum, [(column.description, column.offset, column.length, column.dataType) for column in nmm.columns])
+
+        modes = [(snapshot, incbin, False) for snapshot in (False, True) for incbin in (False, True)]
+        modes += [(False, incbin, True) for incbin in (False, True)]
+        for snapshot, incbin, symbolic in modes:
+            if snapshot and not os.path.exists(tablesnapshot.getSnapshotPath(csvPath)):
+                tablesnapshot.write(tablesnapshot.getSnapshotPath(csvPath), nmm, romBytes, [n2c.getRowName(nmm, row) for row in range(nmm.rowNum)], csvPath)
+            mode = ("incbin" if incbin else "macro") + ("+tbin" if snapshot else "") + ("+sym" if symbolic else "")
+            source = symbolicPath if symbolic else csvPath
+            csvSize = os.path.getsize(source)
+            seconds, _ = timeIt(lambda: silently(lambda: c2ea.process(source, nmmPath, source[:-4] + '.event', romPath, incbin = incbin)))
+            print("{:>16} {:>8} {:>12} {:>9.3f}s {:>12.0f} {:>10.2f}".format(
+                name, rowNum, mode, seconds, rowNum/seconds, csvSize/seconds/(1 << 20)))
+            results.append({'table': name, 'rows': rowNum, 'mode': mode, 'seconds': seconds,
+                            'rowsPerSecond': rowNum/seconds, 'mbPerSecond': csvSize/seconds/(1 << 20)})
+    return results
+
+def benchMemory(directory, sizes, quick):
+    """times c2ea.process on growing tables, and its peak memory"""
+    rowCounts = (10000,) if quick else (10000, 100000)
+    print("CSV -> event, {} columns:".format(len(SYNTHETIC_COLUMNS)))
+    print("{:>8} {:>7} {:>10} {:>12} {:>12}".format("rows", "mode", "time", "rows/s", "peak memory"))
+
+    results = []
+    for rowNum in rowCounts:
+        base = os.path.join(directory, 'Synthetic{}'.format(rowNum))
+        writeNmm(base + '.nmm', 0x100000, rowNum)
+        writeCsv(base + '.csv', 0x100000, rowNum)
+
+        for incbin in (False, True):
+            quiet = lambda: c2ea.process(base + '.csv', base + '.nmm', base + '.event', None, incbin = incbin)
+            seconds, _ = timeIt(lambda: silently(quiet))
+
+            tracemalloc.start()
+            silently(quiet)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            mode = "incbin" if incbin else "macro"
+            print("{:>8} {:>7} {:>9.3f}s {:>12.0f} {:>9.0f} KB".format(rowNum, mode, seconds, rowNum/seconds, peak/1024))
+            results.append({'rows': rowNum, 'mode': mode, 'seconds': seconds, 'rowsPerSecond': rowNum/seconds, 'peakBytes': peak})
+    return results
+
+def benchDiff(directory, sizes, quick):
+    """times comparing each synthetic ROM with a copy where a few rows of every table changed"""
+    print("ROM diff:")
+    print("{:>8} {:>8} {:>10} {:>10}".format("ROM", "changed", "time", "MB/s"))
+
+    results = []
+    for romSize in sizes:
+        romPath, tables = makeProject(directory, romSize)
+        rng = random.Random(3)
+        data = bytearray(romview.openRom(romPath).data)
+        changed = 0
+        offset = 0x100000
+        for nmmPath, rowNum, size in tables:
+            for i in range(max(1, rowNum // 100)):
+                data[offset + rng.randrange(size)] ^= 0xFF
+                changed += 1
+            offset += (size + 0xFFF) & ~0xFFF
+        newPath = romPath[:-4] + '.new.gba'
+        with open(newPath, 'wb') as f:
+            f.write(data)
+
+        folder = os.path.dirname(romPath)
+        seconds, (diff, failures) = timeIt(lambda: romdiff.diffFolder(folder, romPath, newPath))
+        assert failures == 0 and diff, "the changes weren't found"
+        print("{:>6}MB {:>8} {:>9.3f}s {:>10.2f}".format(romSize >> 20, changed, seconds, romSize/seconds/(1 << 20)))
+        results.append({'romMB': romSize >> 20, 'changed': changed, 'seconds': seconds, 'mbPerSecond': romSize/seconds/(1 << 20)})
+    return results
+
+def benchFreeSpace(directory, sizes, quick):
+    """times finding the free space of each ROM size, with padding planted at random and at the end"""
+    print("Free space (numpy {}):".format("enabled" if freespace.numpy else "unavailable"))
+    print("{:>8} {:>8} {:>10} {:>10}".format("ROM", "runs", "time", "MB/s"))
+
+    results = []
+    for romSize in sizes:
+        romPath = os.path.join(directory, 'freespace{}.gba'.format(romSize >> 20))
+        makeRom(romPath, romSize)
+        rng = random.Random(4)
+        with open(romPath, 'r+b') as f:
+            for i in range(1000):
+                f.seek(rng.randrange(romSize - 0x1000))
+                f.write(bytes([rng.choice(freespace.FILL_BYTES)]) * rng.randrange(1, 0x1000))
+            f.seek(romSize - romSize // 8)
+            f.write(b'\xff' * (romSize // 8))
+        data = romview.openRom(romPath).data
+        seconds, runs = timeIt(lambda: freespace.findRuns(data))
+        assert runs[-1] == (romSize - romSize // 8, romSize), "the padding at the end wasn't found"
+        print("{:>6}MB {:>8} {:>9.3f}s {:>10.1f}".format(romSize >> 20, len(runs), seconds, romSize/seconds/(1 << 20)))
+        results.append({'romMB': romSize >> 20, 'runs': len(runs), 'seconds': seconds, 'mbPerSecond': romSize/seconds/(1 << 20)})
+    return results
+
+BENCHMARKS = {
+    'pointers': benchPointers,
+    'rip': benchRip,
+    'compile': benchCompile,
+    'memory': benchMemory,
+    'diff': benchDiff,
+    'freespace': benchFreeSpace,
+}
+
+def getMeta():
+    """what the results were measured on"""
+    import subprocess
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': c2eaPfinder.numpy.__version__ if c2eaPfinder.numpy else None,
+    }
+
+def recordKey(record):
+    """what a result record measured, to match it with the same measurement of another run"""
+    return tuple(sorted((key, value) for key, value in record.items() if key not in METRICS))
+
+def compareResults(baseline, results):
+    """prints how much every measurement changed since the baseline run"""
+    print("Compared to {} ({}):".format(baseline['meta'].get('commit'), baseline['meta'].get('time')))
+    for name, records in results.items():
+        old = {recordKey(record): record for record in baseline['results'].get(name, [])}
+        for record in records:
+            before = old.get(recordKey(record))
+            if before is None:
+                continue
+            label = ' '.join('{}={}'.format(key, value) for key, value in recordKey(record))
+            for metric in METRICS:
+                if before.get(metric) and metric in record:
+                    print("{:>9} {:<46} {:>14} {:>+8.1%}".format(name, label, metric, record[metric]/before[metric] - 1))
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Benchmarks NMM2CSV on synthetic ROMs, NMMs and CSVs.')
+    parser.add_argument('benchmarks', nargs = '*', help = 'benchmarks to run: {} (default: all).'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('-s', '--sizes', default = '16,32', help = 'sizes of the synthetic ROMs in MB (default: 16,32).')
+    parser.add_argument('-o', '--output', help = 'write the results and what they were measured on to this JSON file.')
+    parser.add_argument('-c', '--compare', help = 'JSON results of an earlier run to compare with.')
+    parser.add_argument('--quick', action = 'store_true', help = 'smaller runs, only on the first ROM size.')
+
+    args = parser.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark `{}`".format(name))
+    sizes = [int(size) << 20 for size in args.sizes.split(',')]
+    if args.quick:
+        sizes = sizes[:1]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            results[name] = BENCHMARKS[name](directory, sizes, args.quick)
+            print()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compareResults(json.load(f), results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': getMeta(), 'results': results}, f, indent = 1)
+        print("Wrote results to `{}`".format(args.output))
+
+if __name__ == '__main__':
+    main()
@@ -1,146 +1,723 @@
-import nightmare, sys, csv, glob, os
+import nightmare, manifest, stats, sys, csv, os, re
 
 TABLE_INLINED = False
+INTERACTIVE = True # False never waits for the user: no "Press Enter" and no ROM dialog
+USE_POINTER_MAP = False # True builds the pointer map of the ROM (see pointermap) on the first INLINE table
+AUTO_REPOINT = False # True moves tables whose csv has more rows than their NMM to free space of the ROM (see freespace)
+FREE_SPACE = (0, None) # ROM offsets [start, end) tables are moved to
+
+# references into INLINE tables listed in their warning
+MAX_INNER_POINTERS_SHOWN = 8
+
+# bump whenever the generated events change, so incremental builds redo every table
+C2EA_VERSION = "1.2"
+MANIFEST_NAME = ".c2ea-manifest"
+
+class BlankCellError(Exception):
+    """Raised by process when it finds a blank cell but isn't allowed to ask what to do"""
+
+class CellError(Exception):
+    """Raised by process when cells hold numbers that don't fit their columns, lists every such cell"""
+
+class MissingRomError(Exception):
+    """Raised when an INLINE table needs the reference ROM but it wasn't given and can't be asked for"""
+
+class FreeSpaceError(Exception):
+    """Raised when a table that grew doesn't fit in the free space of the ROM"""
+
+# mistakes in the input files rather than in c2ea, reported without a traceback
+INPUT_ERRORS = (BlankCellError, CellError, MissingRomError, FreeSpaceError)
+
+def showInputError(exc_value):
+    print("ERROR: " + str(exc_value))
 
 def showExceptionAndExit(exc_type, exc_value, tb):
-    import traceback
-    traceback.print_exception(exc_type, exc_value, tb)
-    input("Press Enter key to exit.")
+    if issubclass(exc_type, INPUT_ERRORS):
+        showInputError(exc_value)
+    else:
+        import traceback
+        traceback.print_exception(exc_type, exc_value, tb)
+    if INTERACTIVE:
+        input("Press Enter key to exit.")
     sys.exit(-1)
 
 def getArgLength(nmmentry):
     """takes the nmm entry object and returns the appropriate EA marker"""
-    if (nmmentry.length==4) & (nmmentry.offset%4==0):
-        return "WORD "
-    elif (nmmentry.length==2) & (nmmentry.offset%2==0):
-        return "SHORT "
-    else:
-        return "BYTE "
+    return nmmentry.eaWidth + " "
 
 def addToInstaller(csvList,installername):
-    """Takes a list of csv files and adds them to the EA installer"""
-    with open(installername,"w") as myfile:
-        myfile.write("//EA Table Installation file generated by c2ea.exe\n\n")
-        myfile.write('#include "Table Definitions.txt"\n\n')
+    """Takes a list of csv files and adds them to the EA installer. Leaves the installer untouched if it wouldn't change."""
+    lines = ["//EA Table Installation file generated by c2ea.exe\n\n", '#include "Table Definitions.txt"\n\n']
 
     for csv in csvList:
-        nmpath = csv.replace(".csv",".nmm")
-        nmm = nightmare.NightmareTable(nmpath)
         filename = csv.replace(".csv",".event") #I don't wanna use .txt because it conflicts, but this is supposed to be a text file!
         filename = os.path.relpath(filename, os.path.dirname(installername)) # filename.replace(os.getcwd()+'\\','')
-        with open(installername,'a') as myfile:
-            #myfile.write("ORG " + hex(nmm.offset) + '\n') Don't put the offset here, have it in the dmp.
-            myfile.write('#include "' + filename + '"\n\n')
+        #lines.append("ORG " + hex(nmm.offset) + '\n') Don't put the offset here, have it in the dmp.
+        lines.append('#include "' + filename + '"\n\n')
 
-def process(inputCSV, inputNMM, filename, rom):
-    """Takes a csv and spits out an EA macro file (.event, but actually text). Requires a nmm with the same name in the same folder.""" #is it possible to tell if it's inline?
-    global TABLE_INLINED
+    text = ''.join(lines)
+    if os.path.exists(installername):
+        with open(installername,"r") as myfile:
+            if myfile.read() == text:
+                return
 
-    macroName = "_C2EA_{}".format(os.path.split(os.path.splitext(inputCSV)[0])[1].replace(' ', '_'))
+    with open(installername,"w") as myfile:
+        myfile.write(text)
 
-    nmm = nightmare.NightmareTable(inputNMM)
-    rompath = rom
+def getTableInputs(inputCSV, rom, incbin, blank, defs = None, placement = None):
+    """Returns what the event of a csv depends on: the tool version, output mode and blank cell policy, the csv and nmm contents,
+    the definitions cells are worked out with (if any), (for INLINE and moved tables, pass rom) the contents of the ROM searched for pointers
+    and where a moved table goes"""
+    inputs = {
+        'tool': C2EA_VERSION,
+        'incbin': incbin,
+        'blank': blank,
+        'csv': manifest.fileDigest(inputCSV),
+        'nmm': manifest.fileDigest(inputCSV.replace(".csv",".nmm")),
+    }
+    if defs != None:
+        inputs['defs'] = defs.digest()
+    if placement != None:
+        inputs['placement'] = placement
+    if rom != None:
+        from c2eaPfinder import getCache
+        with stats.phase('rom'):
+            inputs['rom'] = getCache().digest(rom).hex()
+    return inputs
+
+# numbers EA reads the same way as int(x, 0)
+EA_NUMBER = re.compile(r'-?(0x[0-9a-fA-F]+|0|[1-9][0-9]*)')
+
+# distinct cells remembered per column, so memory doesn't grow with the table
+ENCODER_CACHE_SIZE = 1024
+
+# shorter runs of numeric rows stay macros with -incbin, rather than making lots of tiny .dmp files
+MIN_DUMP_ROWS = 16
+
+def getRangeError(entry, data):
+    """message for a cell whose number doesn't fit its column"""
+    return "{} doesn't fit in {} {}-byte {} (range {} to {})".format(
+        data, entry.eaWidth, entry.length, "signed" if entry.signed else "unsigned", entry.minValue, entry.maxValue)
+
+def compileEncoder(entry, defs = None):
+    """Returns a function encoding the cells of a column. It returns the cell's macro argument and,
+    if the cell is a number, the bytes EA assembles it to (else None, the cell is left for EA to resolve).
+    With defs (a definitions.Definitions), symbols and expressions of them are worked out too.
+    It raises OverflowError for a number that doesn't fit the column, and LookupError for an undefined symbol."""
+    length = entry.length
+    low, high = entry.minValue, entry.maxValue
+    mask = (1 << 8*length) - 1
+    isByte = entry.eaWidth == "BYTE"
+    cache = {}
+
+    def parse(data):
+        if data.isdigit() and data.isascii() and (data[0] != '0' or len(data) == 1):
+            return int(data) # plain decimal, the most common cell
+        if EA_NUMBER.fullmatch(data) != None:
+            return int(data, 0)
+        if isByte:
+            # the BYTE arguments are converted here, and always were with int(x, 0)
+            try:
+                return int(data, 0)
+            except ValueError:
+                pass
+        if defs != None:
+            return defs.evaluate(data)
+        return None
+
+    def encode(data):
+        result = cache.get(data)
+        if result != None:
+            return result
+        value = parse(data)
+        if value == None:
+            result = (data, None)
+        else:
+            if not (low <= value <= high):
+                raise OverflowError(getRangeError(entry, data))
+            raw = (value & mask).to_bytes(length, 'little')
+            # symbols go to EA as their value, so the event and any .dmp agree
+            result = (' '.join(map(hex, raw)) if isByte else (data if defs == None or EA_NUMBER.fullmatch(data) != None else str(value)), raw)
+        if len(cache) < ENCODER_CACHE_SIZE:
+            cache[data] = result
+        return result
+
+    return encode
+
+def getDumpName(filename, index):
+    """.dmp file holding the index-th run of encoded rows of an event"""
+    return os.path.splitext(filename)[0] + ('.dmp' if index == 0 else '.{}.dmp'.format(index))
+
+def getDumpFiles(filename):
+    """.dmp files of an event that exist, as getDumpName names them"""
+    folder, name = os.path.split(os.path.splitext(filename)[0])
+    pattern = re.compile(re.escape(name) + r'(\.[1-9][0-9]*)?\.dmp')
+    try:
+        names = [other for other in os.listdir(folder or '.') if pattern.fullmatch(other)]
+    except OSError:
+        return []
+    # Item.1.dmp is the .dmp of Item.1.csv if there is one
+    return sorted(os.path.join(folder, other) for other in names if other == name + '.dmp' or not os.path.exists(os.path.join(folder, other[:-4] + '.csv')))
+
+def getTableOutputs(inputCSV):
+    """files written for a csv: its event and .dmp files"""
+    filename = inputCSV.replace(".csv",".event")
+    return [filename] + getDumpFiles(filename)
+
+def askRomPath():
+    """asks the user for the ROM to use for pointer searching"""
+    if not INTERACTIVE:
+        raise MissingRomError("INLINE tables need the reference ROM, pass it as the first argument")
+    import tkinter as tk
+    root = tk.Tk()
+    root.withdraw()
+    from tkinter import filedialog
+    return filedialog.askopenfilename(filetypes=[("GBA files",".gba"),("All files",".*")],initialdir=os.getcwd(),title="Select ROM to use for repointing")
+
+def getInlineTargets(csvList):
+    """Returns a dict mapping each csv whose table is INLINE to the pointer value of its original table"""
+    targets = {}
+    for inputCSV in csvList:
+        with open(inputCSV, 'r') as myfile:
+            firstRow = next(csv.reader(myfile), [''])
+        if firstRow and firstRow[0].strip()[0:6]=="INLINE":
+            nmm = nightmare.loadTable(inputCSV.replace(".csv",".nmm"))
+            targets[inputCSV] = nmm.offset | 0x8000000
+    return targets
+
+def getInlineLabel(inputCSV):
+    """label of an INLINE table, from the first cell of its csv"""
+    with open(inputCSV, 'r') as myfile:
+        firstRow = next(csv.reader(myfile), [''])
+    return firstRow[0].replace("INLINE",'').strip()
+
+def loadDefinitions(paths, defines):
+    """Definitions cells are worked out with, from the files and the NAME[=VALUE] defines (like EA's -D).
+    They are cached between runs, and read again only when one of their files changes."""
+    import definitions, pointercache
+    with stats.phase('parse'):
+        return definitions.loadDefinitions(paths, [definitions.parseDefine(define) for define in defines],
+            os.path.join(pointercache.cacheDirectory(), definitions.CACHE_FILE))
+
+def getGrownTables(tables):
+    """Returns a dict mapping each csv (of the (csv, nmm) pairs) whose table is still at the offset of its NMM
+    but has more rows than it to its NMM, for the csvs to move to free space"""
+    grown = {}
+    for inputCSV, inputNMM in tables:
+        with open(inputCSV, 'r') as myfile:
+            table = csv.reader(myfile)
+            tableOffset = next(table, [''])[0].strip()
+            if not EA_NUMBER.fullmatch(tableOffset):
+                continue # INLINE, or a definition: the table was already moved
+            nmm = nightmare.loadTable(inputNMM)
+            if int(tableOffset, 0) == nmm.offset and sum(1 for row in dropTrailingBlankRows(table)) > nmm.rowNum:
+                grown[inputCSV] = nmm
+    return grown
+
+def countRows(inputCSV):
+    """rows of a csv past its header, as genCells yields them"""
+    with open(inputCSV, 'r') as myfile:
+        return sum(1 for row in dropTrailingBlankRows(csv.reader(myfile))) - 1
+
+def placeTables(grown, tables, rom):
+    """Returns a dict mapping each grown table (see getGrownTables) to the offset of the free space of the ROM it's moved to.
+    Tables are placed in csv order, away from the tables of every (csv, nmm) pair, so the same inputs place them the same way."""
+    import freespace, pointercache
+    from c2eaPfinder import getCache
+    with stats.phase('rom'):
+        runs = freespace.getRuns(rom, getCache().digest(rom), os.path.join(pointercache.cacheDirectory(), freespace.CACHE_FILE))
+    reserved = []
+    for inputCSV, inputNMM in tables:
+        nmm = grown[inputCSV] if inputCSV in grown else nightmare.loadTable(inputNMM)
+        reserved.append((nmm.offset, nmm.offset + nmm.size))
+    space = freespace.FreeSpace(runs, reserved, *FREE_SPACE)
+    placements = {}
+    for inputCSV in sorted(grown):
+        nmm = grown[inputCSV]
+        size = countRows(inputCSV) * nmm.rowLength
+        placements[inputCSV] = space.allocate(size)
+        if placements[inputCSV] == None:
+            raise FreeSpaceError("{} grew to {} bytes, but the ROM has no free space that big left".format(inputCSV, size))
+    return placements
+
+def getInnerPointers(rom, nmm):
+    """(offset, target) of the pointers of the ROM into the table past its start (e.g. to its rows),
+    which aren't repointed when the table is INLINE or moved. Empty unless the ROM has a pointer map."""
+    from c2eaPfinder import getPointerMap
+    romMap = getPointerMap(rom, build = USE_POINTER_MAP)
+    if romMap is None:
+        return []
+    return romMap.references(nmm.offset + 1, nmm.offset + nmm.size)
+
+def warnInnerPointers(rom, nmm, inputCSV):
+    inner = getInnerPointers(rom, nmm)
+    if inner:
+        print("Warning: {} pointer(s) into {} past its start aren't repointed: {}".format(len(inner), inputCSV,
+            ', '.join("${:X} -> ${:X}".format(offset, pointer) for offset, pointer in inner[:MAX_INNER_POINTERS_SHOWN]) +
+            (", ..." if len(inner) > MAX_INNER_POINTERS_SHOWN else "")))
+
+def getMacroDefinition(macroName, columns):
+    """#define line of the macro writing one row, e.g. BYTE arg000 arg001 ;WORD arg002"""
     macroArgs = [] #params for macro
-    macroOutput = '' #expanded macro form
-    outputlines = []
-    originalOffset = nmm.offset
-    tableOffset = originalOffset #this gets changed to whatever is in the first cell of the csv actually
+    macroOutput = [] #expanded macro form
     currlen = '' #because we start with BYTE
-    fillwithzero = None
 
-    for x in range(nmm.colNum):
+    for x, entry in enumerate(columns):
         argx = "arg"+'{0:03d}'.format(x)
         macroArgs.append(argx) #arg000, arg001, arg002 etc up to 1000 columns.
-        arglen = getArgLength(nmm.columns[x]) #this gets the appropriate length string.
+        arglen = getArgLength(entry) #this gets the appropriate length string.
         if arglen!=currlen: #only append if needed else just add arg.
             if currlen!='': #this should only be on the first line
-                macroOutput+=';'
+                macroOutput.append(';')
             #assuming arglen does not equal currlen
-            macroOutput+=(arglen + argx + ' ')
+            macroOutput.append(arglen + argx + ' ')
             currlen = arglen
         else:
-            macroOutput+=(argx + ' ')
+            macroOutput.append(argx + ' ')
 
-    with open(inputCSV, 'r') as myfile:
-        table = csv.reader(myfile)
-        tableOffset = next(table)[0]
-        for row in table:
-            outputline = "{}(".format(macroName)
-            items = zip(nmm.columns, row[1:])
-            for entry, data in items:
-                thisentry = ''
-                #output.extend(int(data, 0).to_bytes(entry.length, 'little', signed=entry.signed))
-                if data=='':
-                    if fillwithzero == None:
-                        fillwithzero = input("Warning: "+ inputCSV + " has a blank cell.\nContinue anyway? Fills cells with '0' (y/n)").strip().lower()=='y'
-                    if fillwithzero==True:
-                        data = '0'
-                    else:
-                        input("Press Enter to quit.")
-                        sys.exit(-1)
-                try:
-                    arglen = getArgLength(entry)
-                    if (arglen=="WORD ")|(arglen=="SHORT "):
-                        outputline += data + ','
-                    else:
-                        dt = int(data, 0).to_bytes(entry.length, 'little', signed=entry.signed) #this is a string i guess
-                        for byte in dt:
-                            thisentry += (hex(byte)+' ')
-                        outputline += thisentry[:-1] + ','
-                except ValueError: #if it's not a number, just add it directly
-                    outputline += (data+',')
-            outputline = outputline[:-1] + ')'
-            outputlines.append(outputline)
-
-    with open(filename, 'w') as dumpfile:
-        inline = False
-        dumpfile.write("#define {}(".format(macroName))
-        dumpfile.write(','.join(macroArgs)) #turns list into 'arg000,arg001' etc
-        dumpfile.write(') "')
-        dumpfile.write(macroOutput + '"\n\n') #e.g. BYTE arg000, WORD arg001, etc
-        if tableOffset.strip()[0:6]=="INLINE":
-            from c2eaPfinder import pointerOffsets
-            TABLE_INLINED = True
-            if rompath == None:
-                import tkinter as tk
-                root = tk.Tk()
-                root.withdraw()
-                from tkinter import filedialog
-                rompath = filedialog.askopenfilename(filetypes=[("GBA files",".gba"),("All files",".*")],initialdir=os.getcwd(),title="Select ROM to use for repointing")
-            label = tableOffset.replace("INLINE",'').strip()
-
-            # Here we do *not* want to use PFinder
-
-            dumpfile.write("PUSH\n")
-
-            for offset in pointerOffsets(rompath, originalOffset | 0x8000000):
-                dumpfile.write("ORG ${:X}\n".format(offset))
-                dumpfile.write("POIN {}\n".format(label))
-
-            dumpfile.write("POP\n")
-
-            # There, much better :)
-
-            dumpfile.write("ALIGN 4\n{}:\n".format(label))
-
-            inline = True
-        else:
-            dumpfile.write("PUSH\nORG "+tableOffset+"\n")
-        dumpfile.write('\n'.join(outputlines))
-        if not inline:
-                dumpfile.write("\nPOP")
-        #dumpfile.write('\n}\n')
+    #turns list into 'arg000,arg001' etc
+    return '#define {}({}) "{}"\n\n'.format(macroName, ','.join(macroArgs), ''.join(macroOutput))
+
+def dropTrailingBlankRows(rows):
+    """Yields the rows of a csv reader but the blank ones at its end, which spreadsheets often export"""
+    blankRows = []
+    for row in rows:
+        if all(cell.strip() == '' for cell in row):
+            blankRows.append(row) # part of the table only if a row follows
+            continue
+        yield from blankRows
+        blankRows = []
+        yield row
+
+def genCells(table, columns, inputCSV, blank):
+    """Yields the name and cells of each row of a csv reader (but blank rows at the end), after dealing with blank cells:
+    blank 'zero' fills them with 0, 'error' raises BlankCellError and 'ask' asks the user once per csv"""
+    fillwithzero = True if blank == 'zero' else None
+    rowCount = 0
+    for row in dropTrailingBlankRows(table):
+        rowCount += 1
+        cells = row[1:len(columns)+1]
+        if '' in cells:
+            if (fillwithzero == None) and blank != 'ask':
+                # csv line numbers and spreadsheet columns, counting the name column
+                raise BlankCellError("{}: row {}, column {} ({}) is blank".format(inputCSV, rowCount+1, cells.index('')+2, columns[cells.index('')].description))
+            if fillwithzero == None:
+                fillwithzero = input("Warning: "+ inputCSV + " has a blank cell.\nContinue anyway? Fills cells with '0' (y/n)").strip().lower()=='y'
+            if fillwithzero==True:
+                cells = [data if data != '' else '0' for data in cells]
+            else:
+                input("Press Enter to quit.")
+                sys.exit(-1)
+        yield (row[0] if row else ''), cells
+    stats.count('rows', rowCount)
+    stats.count('cells', rowCount * len(columns))
+    stats.count('bytes', rowCount * sum(entry.length for entry in columns))
+
+def getMacroCall(macroName, encoded):
+    """macro call writing one row, from the encoded cells"""
+    return "{}({})".format(macroName, ','.join([text for text, raw in encoded]))
+
+def genTableLines(rows, columns, macroName, filename, incbin, inputCSV, defs = None, dumps = None):
+    """Yields the event lines of the table rows. With incbin, runs of at least MIN_DUMP_ROWS numeric rows
+    are written straight to .dmp files as they come, and only their #incbin lines are yielded.
+    The .dmp files are written as .tmp files, whose final names are appended to dumps for process to rename.
+    Raises CellError once all rows are done if any number didn't fit its column or (with defs) any symbol is undefined."""
+    encoders = [compileEncoder(entry, defs) for entry in columns]
+    errors = []
+    dumpfile = None
+    dumpCount = 0
+    pending = [] #numeric rows (macro line, bytes) not yet known to be part of a long enough run
+    try:
+        for index, (name, cells) in enumerate(rows):
+            try:
+                encoded = [encode(data) for encode, data in zip(encoders, cells)]
+            except (OverflowError, LookupError):
+                # go through the row again to find every bad cell
+                encoded = []
+                for column, (encode, data) in enumerate(zip(encoders, cells)):
+                    try:
+                        encoded.append(encode(data))
+                    except (OverflowError, LookupError) as e:
+                        # csv line numbers and spreadsheet columns, counting the name column
+                        errors.append("row {} ({}), column {} ({}): {}".format(index+2, name, column+2, columns[column].description, e))
+            if errors:
+                continue # only looking for more errors now
+            if incbin and len(encoded) == len(columns) and all(raw != None for text, raw in encoded):
+                raw = b''.join(raw for text, raw in encoded)
+                if dumpfile != None:
+                    dumpfile.write(raw)
+                    continue
+                pending.append((encoded, raw))
+                if len(pending) < MIN_DUMP_ROWS:
+                    continue
+                # long enough, start a .dmp file with the rows so far
+                dumpname = getDumpName(filename, dumpCount)
+                dumpCount += 1
+                dumps.append(dumpname)
+                dumpfile = open(dumpname + '.tmp', 'wb')
+                yield '#incbin "{}"'.format(os.path.basename(dumpname))
+                dumpfile.write(b''.join(raw for encoded, raw in pending))
+                pending = []
+                continue
+            if dumpfile != None:
+                dumpfile.close()
+                dumpfile = None
+            for pendingEncoded, raw in pending:
+                yield getMacroCall(macroName, pendingEncoded)
+            pending = []
+            yield getMacroCall(macroName, encoded)
+        for pendingEncoded, raw in pending:
+            yield getMacroCall(macroName, pendingEncoded)
+    finally:
+        if dumpfile != None:
+            dumpfile.close()
+    if errors:
+        raise CellError("{}: {} bad cell(s):\n  ".format(inputCSV, len(errors)) + "\n  ".join(errors))
+
+def getSnapshotArguments(snapshot, index, entry):
+    """macro arguments of the cells of a column of a snapshot, as compileEncoder makes them"""
+    if entry.eaWidth != "BYTE":
+        return snapshot.cells(index)
+    if entry.length == 1:
+        return [HEX_BYTES[value] for value in snapshot.raw(index)]
+    raw = snapshot.raw(index)
+    return [' '.join([HEX_BYTES[value] for value in raw[i:i+entry.length]]) for i in range(0, len(raw), entry.length)]
+
+HEX_BYTES = [hex(value) for value in range(256)]
+
+def genSnapshotLines(snapshot, columns, macroName, filename, incbin, dumps = None):
+    """Yields the event lines of the rows of a table snapshot (see tablesnapshot), the same genTableLines makes of its csv.
+    Every cell is a number, so with incbin a long enough table goes to one .dmp file straight from the columns
+    (written like those of genTableLines)."""
+    stats.count('rows', snapshot.rowNum)
+    stats.count('cells', snapshot.rowNum * len(columns))
+    stats.count('bytes', snapshot.rowNum * sum(entry.length for entry in columns))
+    if incbin and snapshot.rowNum >= MIN_DUMP_ROWS:
+        dumpname = getDumpName(filename, 0)
+        dumps.append(dumpname)
+        with open(dumpname + '.tmp', 'wb') as dumpfile:
+            dumpfile.write(snapshot.rowBytes())
+        yield '#incbin "{}"'.format(os.path.basename(dumpname))
+    else:
+        for arguments in zip(*[getSnapshotArguments(snapshot, index, entry) for index, entry in enumerate(columns)]):
+            yield "{}({})".format(macroName, ','.join(arguments))
+
+def process(inputCSV, inputNMM, filename, rom, pointers = None, blank = 'ask', incbin = False, defs = None, placement = None):
+    """Takes a csv and spits out an EA macro file (.event, but actually text). Requires a nmm with the same name in the same folder.
+    pointers optionally maps pointer values to the offsets of their references, as returned by c2eaPfinder.pointerOffsetsMany.
+    placement optionally moves the table to that offset and repoints it there (see placeTables).
+    blank says what to do with blank cells (see genCells).
+    With incbin, runs of rows with only numeric cells are written to .dmp files next to the event and #incbin'd.
+    With defs (a definitions.Definitions), symbolic cells are worked out here and undefined symbols are errors.
+    Rows are streamed from the csv to the event, which (with its .dmp files) only replaces the old one once complete.
+    The binary snapshot n2c wrote along with the csv is read instead while the csv is unchanged.""" #is it possible to tell if it's inline?
+    global TABLE_INLINED
+
+    macroName = "_C2EA_{}".format(os.path.split(os.path.splitext(inputCSV)[0])[1].replace(' ', '_'))
+
+    nmm = nightmare.loadTable(inputNMM)
+    rompath = rom
+    originalOffset = nmm.offset
+    temp = filename + '.tmp'
+    dumps = [] # .dmp files written, as .tmp files until the event is complete
+    lines = None
+
+    import tablesnapshot
+
+    with stats.phase('read'):
+        snapshot = tablesnapshot.loadFresh(inputCSV, nmm)
+
+    with open(inputCSV, 'r') as myfile, open(temp, 'w', buffering = 1 << 16) as dumpfile:
+        try:
+            if snapshot != None:
+                tableOffset = hex(snapshot.offset) # what n2c wrote in the first cell
+            else:
+                table = csv.reader(myfile)
+                tableOffset = next(table)[0] #the offset is whatever is in the first cell of the csv actually
+
+            inline = False
+            dumpfile.write(getMacroDefinition(macroName, nmm.columns))
+            if tableOffset.strip()[0:6]=="INLINE":
+                from c2eaPfinder import pointerOffsets, getPointerMap
+                TABLE_INLINED = True
+                target = originalOffset | 0x8000000
+                if (pointers != None) and (target in pointers):
+                    offsets = pointers[target]
+                else:
+                    if rompath == None:
+                        rompath = askRomPath()
+                    if USE_POINTER_MAP:
+                        getPointerMap(rompath) # the lookup below then uses it
+                    offsets = pointerOffsets(rompath, target)
+                label = tableOffset.replace("INLINE",'').strip()
+
+                if rompath != None:
+                    warnInnerPointers(rompath, nmm, inputCSV)
+
+                if defs != None:
+                    defs.declare(label) # only EA knows where the table goes
+
+                # Here we do *not* want to use PFinder
+
+                dumpfile.write("PUSH\n")
+
+                for offset in offsets:
+                    dumpfile.write("ORG ${:X}\n".format(offset))
+                    dumpfile.write("POIN {}\n".format(label))
+
+                dumpfile.write("POP\n")
+
+                # There, much better :)
+
+                dumpfile.write("ALIGN 4\n{}:\n".format(label))
+
+                inline = True
+            elif placement != None:
+                from c2eaPfinder import pointerOffsets
+                target = originalOffset | 0x8000000
+                offsets = pointers[target] if (pointers != None) and (target in pointers) else pointerOffsets(rompath, target)
+                warnInnerPointers(rompath, nmm, inputCSV)
+                print("Moved {} to free space at ${:X}, repointing {} pointer(s)".format(inputCSV, placement, len(offsets)))
+
+                # same as INLINE, but the table goes where we say
+                dumpfile.write("PUSH\n")
+                for offset in offsets:
+                    dumpfile.write("ORG ${:X}\n".format(offset))
+                    dumpfile.write("POIN ${:X}\n".format(placement))
+                dumpfile.write("ORG ${:X}\n".format(placement))
+            else:
+                dumpfile.write("PUSH\nORG "+tableOffset+"\n")
+            # the time spent reading and encoding rows is timed apart from writing them
+            if snapshot != None:
+                lines = genSnapshotLines(snapshot, nmm.columns, macroName, filename, incbin, dumps)
+            else:
+                rows = stats.timed(genCells(table, nmm.columns, inputCSV, blank), 'read')
+                lines = genTableLines(rows, nmm.columns, macroName, filename, incbin, inputCSV, defs, dumps)
+            with stats.phase('write'):
+                for i, line in enumerate(stats.timed(lines, 'encode')):
+                    if i > 0:
+                        dumpfile.write('\n')
+                    dumpfile.write(line)
+            if not inline:
+                    dumpfile.write("\nPOP")
+            #dumpfile.write('\n}\n')
+        except BaseException:
+            dumpfile.close()
+            os.remove(temp)
+            if lines != None:
+                lines.close() # closes the .dmp file being written
+            for dumpname in dumps:
+                if os.path.exists(dumpname + '.tmp'):
+                    os.remove(dumpname + '.tmp')
+            raise
+        finally:
+            if snapshot != None:
+                snapshot.close()
+    # the old event and .dmp files stay until the new ones are all written
+    for dumpname in dumps:
+        os.replace(dumpname + '.tmp', dumpname)
+    os.replace(temp, filename)
+    for dumpname in getDumpFiles(filename):
+        if dumpname not in dumps:
+            os.remove(dumpname) # from a run with more runs of numeric rows
     print("Wrote to " + filename)
     return rompath
 
+def processJob(inputCSV, rom, pointers, incbin = False, blank = 'ask', defs = None, placement = None):
+    """Runs process for a csv of a folder in a worker.
+    Returns what it printed (None if the csv has blank cells and the user needs to be asked about them) and its stats."""
+    import io, contextlib
+    
+    out = io.StringIO()
+    
+    with contextlib.redirect_stdout(out), stats.table(inputCSV):
+        try:
+            process(
+                inputCSV,
+                inputCSV.replace(".csv",".nmm"),
+                inputCSV.replace(".csv",".event"),
+                rom,
+                pointers,
+                blank = 'error' if blank == 'ask' else blank,
+                incbin = incbin,
+                defs = defs,
+                placement = placement
+            )
+        
+        except BlankCellError:
+            if blank != 'ask':
+                raise
+            
+            return None, stats.take()
+    
+    return out.getvalue(), stats.take()
+
+def processFolder(folder, installer, rom, jobs = 1, force = False, incbin = False, blank = 'ask', only = None, defs = None):
+    """Processes the csvs of a folder whose inputs changed since the last run and writes the installer.
+    only optionally limits the csvs checked for changes to those paths (the others are reused as they are).
+    defs optionally works out symbolic cells (see process).
+    With AUTO_REPOINT, tables that grew are moved to free space (see placeTables).
+    Returns the ROM (asked for if INLINE or moved tables need it), the csvs processed and the offsets moved tables went to."""
+    global TABLE_INLINED
+    
+    import projectindex
+    
+    with stats.phase('scan'):
+        tables = projectindex.findTables(folder)
+    
+    for nmmFile, csvFile in tables:
+        if nmmFile == None:
+            print("Skipping `{}`: there's no NMM next to it.".format(csvFile))
+    
+    # sorted so that the installer doesn't depend on the file system order
+    csvList = sorted(csvFile for nmmFile, csvFile in tables if nmmFile != None and csvFile != None)
+    
+    inlineTargets = getInlineTargets(csvList)
+    
+    if inlineTargets:
+        TABLE_INLINED = True
+        
+        if rom == None:
+            rom = askRomPath()
+    
+    if defs != None:
+        # the labels of INLINE tables can be used in the cells of any table
+        for filename in inlineTargets:
+            defs.declare(getInlineLabel(filename))
+    
+    grown = {}
+    placements = {}
+    
+    if AUTO_REPOINT:
+        tables = [(filename, filename.replace(".csv",".nmm")) for filename in csvList]
+        grown = getGrownTables(tables)
+        
+        if grown:
+            TABLE_INLINED = True # uses the pointer cache too
+            
+            if rom == None:
+                rom = askRomPath()
+            
+            placements = placeTables(grown, tables, rom)
+    
+    # Only regenerate the tables whose inputs changed since the last run
+    buildManifest = manifest.BuildManifest(os.path.join(folder, MANIFEST_NAME), C2EA_VERSION)
+    
+    tableInputs = {}
+    buildList = []
+    
+    for filename in csvList:
+        key = os.path.relpath(filename, folder)
+        
+        # moved tables are always checked: another table growing can move them
+        if (only != None) and (os.path.normpath(filename) not in only) and (filename not in placements):
+            buildManifest.keep(key)
+            continue
+        
+        with stats.table(filename), stats.phase('check'):
+            needsRom = (filename in inlineTargets) or (filename in placements)
+            tableInputs[filename] = getTableInputs(filename, rom if needsRom else None, incbin, blank, defs, placements.get(filename))
+            
+            if force or not buildManifest.isUpToDate(key, tableInputs[filename], getTableOutputs(filename)):
+                buildList.append(filename)
+    
+    # Search the ROM for the pointers to every INLINE or moved table at once,
+    # so that processing the tables never needs to ask for the ROM
+    pointers = None
+    buildTargets = set(inlineTargets[filename] for filename in buildList if filename in inlineTargets)
+    buildTargets.update(grown[filename].offset | 0x8000000 for filename in buildList if filename in placements)
+    
+    if buildTargets:
+        from c2eaPfinder import pointerOffsetsMany, getPointerMap
+        
+        if USE_POINTER_MAP:
+            getPointerMap(rom) # the lookups below then use it
+        
+        pointers = pointerOffsetsMany(rom, buildTargets)
+    
+    if jobs > 1 and len(buildList) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        with ProcessPoolExecutor(max_workers = jobs, initializer = stats.enable, initargs = (stats.enabled(),)) as pool:
+            # map yields results in csv order, whichever worker finishes first
+            outputs = list(pool.map(processJob, buildList, [rom] * len(buildList), [pointers] * len(buildList), [incbin] * len(buildList), [blank] * len(buildList), [defs] * len(buildList), [placements.get(filename) for filename in buildList]))
+        
+        for filename, (output, tableStats) in zip(buildList, outputs):
+            stats.merge(tableStats)
+            
+            if output == None:
+                # has blank cells, ask about them here
+                with stats.table(filename):
+                    process(filename, filename.replace(".csv",".nmm"), filename.replace(".csv",".event"), rom, pointers, blank, incbin, defs, placements.get(filename))
+            
+            else:
+                sys.stdout.write(output)
+    
+    else:
+        for filename in buildList:
+            with stats.table(filename):
+                rom = process(
+                    filename,
+                    filename.replace(".csv",".nmm"),
+                    filename.replace(".csv",".event"),
+                    rom,
+                    pointers,
+                    blank,
+                    incbin,
+                    defs,
+                    placements.get(filename)
+                )
+    
+    for filename in buildList:
+        buildManifest.record(os.path.relpath(filename, folder), tableInputs[filename], getTableOutputs(filename))
+    
+    buildManifest.write()
+    
+    print("Rebuilt {} tables, reused {}.".format(len(buildList), len(csvList) - len(buildList)))
+    
+    addToInstaller(csvList, installer)
+    
+    if TABLE_INLINED:
+        # save the pointers found so far, a watching c2ea never exits
+        from c2eaPfinder import writeCache
+        writeCache()
+    
+    return rom, buildList, placements
+
+def getChangedTables(changed):
+    """csvs affected by the changed files (normalized paths), None if they all are (the ROM changed)"""
+    tables = set()
+    
+    for path in changed:
+        base, ext = os.path.splitext(path)
+        
+        if ext.lower() in ('.csv', '.nmm'):
+            tables.add(base + '.csv')
+        
+        else:
+            return None
+    
+    return tables
 
 def main():
+    global INTERACTIVE, USE_POINTER_MAP, AUTO_REPOINT, FREE_SPACE, TABLE_INLINED
+    
     sys.excepthook = showExceptionAndExit
     
     doSingleFile = False
 
     folder    = os.getcwd()
     installer = "Table Installer.event"
+    jobs      = 1
+    force     = False
+    incbin    = False
+    blank     = 'ask'
+    watchMode = False
+    interval  = 0.5
+    statsJson = None
+    profile   = None
+    defsFiles = None
+    defines   = []
     
     rom       = None
     
@@ -166,14 +743,75 @@ def main():
         # Arguments for folder processing
         parser.add_argument('-folder', help = 'folder to look for csvs in')
         parser.add_argument('-installer', help = 'output installer event (default: [Folder]/Table Installer.event)')
+        parser.add_argument('-include', '--include', action = 'append', default = [], metavar = 'PATTERN', help = 'only look at csvs whose path in the folder (or name) matches PATTERN, e.g. "tables/*", can be given more than once')
+        parser.add_argument('-exclude', '--exclude', action = 'append', default = [], metavar = 'PATTERN', help = 'never look in folders or at files matching PATTERN, e.g. graphics, can be given more than once')
+        parser.add_argument('-rescan', '--rescan', action = 'store_true', help = 'list every folder again instead of trusting the project index (.nmm2csv-index)')
+        parser.add_argument('-jobs', '--jobs', type = int, default = 1, help = 'number of csvs to process in parallel (0: one per CPU)')
+        parser.add_argument('-force', '--force', action = 'store_true', help = 'regenerate every table, even those whose inputs did not change')
+        parser.add_argument('-incbin', '--incbin', action = 'store_true', help = 'write rows with only numeric cells to .dmp files included with #incbin (faster to assemble)')
+        parser.add_argument('-schemacache', '--schema-cache', action = 'store_true', help = 'keep parsed NMMs in a cache file between runs')
+        parser.add_argument('-pointermap', '--pointer-map', action = 'store_true', help = 'index every pointer of the ROM once (kept between runs) to find the pointers to INLINE tables, and warn about pointers into them')
+        parser.add_argument('-autorepoint', '--auto-repoint', action = 'store_true', help = 'move tables whose csv has more rows than their NMM to free space (runs of 0x00 or 0xFF) of the ROM, and repoint them')
+        parser.add_argument('-freespace', '--free-space', metavar = 'START[-END]', help = '(use with -autorepoint) only move tables to ROM offsets in this range, e.g. 0xB2A610-0x1000000 (default: anywhere)')
+        
+        # Arguments for working out symbolic cells
+        parser.add_argument('-defs', '--defs', nargs = '?', action = 'append', const = '', metavar = 'FILE', help = 'work out symbolic cells with the #defines of FILE (default: [Folder]/Table Definitions.txt) and report undefined symbols, can be given more than once')
+        parser.add_argument('-define', '--define', action = 'append', default = [], metavar = 'NAME[=VALUE]', help = '(use with -defs) define a symbol before reading the definitions, e.g. _FE8_')
+        parser.add_argument('-watch', '--watch', action = 'store_true', help = 'keep running and regenerate the tables whose csv, nmm or ROM changed (implies -nopause)')
+        parser.add_argument('-interval', '--interval', type = float, default = 0.5, help = '(use with -watch) seconds between checks for changes (default: 0.5)')
+        
+        # Arguments for unattended runs
+        parser.add_argument('-nopause', '--no-pause', action = 'store_true', help = 'never wait for the user: exit without "Press Enter", and fail instead of asking for the ROM')
+        parser.add_argument('-blank', '--blank', choices = ['ask', 'zero', 'error'], help = 'what to do with blank cells: ask, fill with zero or stop with an error (default: ask, error with -nopause)')
+        
+        # Profiling arguments
+        parser.add_argument('-stats', '--stats', action = 'store_true', help = 'print the time spent on each table, by phase, and what was compiled')
+        parser.add_argument('-statsjson', '--stats-json', metavar = 'FILE', help = 'also write those stats to FILE as JSON')
+        parser.add_argument('-profile', '--profile', metavar = 'FILE', help = 'process the slowest table again under cProfile and save the profile to FILE')
         
         args = parser.parse_args()
         
         rom = args.rom
+        jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        force = args.force
+        incbin = args.incbin
+        watchMode = args.watch
+        interval = args.interval
+        statsJson = args.stats_json
+        profile = args.profile
+        defsFiles = args.defs
+        defines = args.define
+        
+        INTERACTIVE = not (args.no_pause or args.watch)
+        USE_POINTER_MAP = args.pointer_map
+        AUTO_REPOINT = args.auto_repoint
+        blank = args.blank if args.blank != None else ('ask' if INTERACTIVE else 'error')
+        
+        stats.enable(args.stats or statsJson != None or profile != None)
+        
+        import projectindex
+        projectindex.INCLUDE = args.include
+        projectindex.EXCLUDE = args.exclude
+        projectindex.RESCAN = args.rescan
+        
+        if args.free_space != None:
+            if not AUTO_REPOINT:
+                sys.exit("ERROR: -freespace argument specified without -autorepoint, aborting.")
+            
+            start, dash, end = args.free_space.partition('-')
+            
+            try:
+                FREE_SPACE = (int(start, 0) if start else 0, int(end, 0) if end else None)
+            except ValueError:
+                sys.exit("ERROR: -freespace `{}` isn't START[-END], aborting.".format(args.free_space))
+        
+        if args.schema_cache:
+            import pointercache
+            nightmare.useSchemaCache(os.path.join(pointercache.cacheDirectory(), nightmare.SCHEMA_CACHE_FILE))
         
         if args.csv != None:
-            if (args.folder != None) or (args.installer != None):
-                sys.exit("ERROR: -folder or -installer argument specified with -csv, aborting.")
+            if (args.folder != None) or (args.installer != None) or args.watch:
+                sys.exit("ERROR: -folder, -installer or -watch argument specified with -csv, aborting.")
             
             doSingleFile = True
             
@@ -189,6 +827,17 @@ def main():
                 folder = args.folder
             
             installer = args.installer if args.installer != None else (folder + '/Table Installer.event')
+    
+    defs = None
+    
+    if defsFiles != None:
+        defsFiles = [path if path != '' else os.path.join(folder if not doSingleFile else os.path.dirname(os.path.abspath(csvFile)), 'Table Definitions.txt') for path in defsFiles]
+        
+        for path in defsFiles:
+            if not os.path.exists(path):
+                sys.exit("ERROR: definitions file `{}` doesn't exist!".format(path))
+        
+        defs = loadDefinitions(defsFiles, defines)
 
     if doSingleFile:
         if not os.path.exists(csvFile):
@@ -197,27 +846,64 @@ def main():
         if not os.path.exists(nmmFile):
             sys.exit("ERROR: NMM File `{}` doesn't exist!".format(nmmFile))
         
-        process(csvFile, nmmFile, outFile, rom)
+        placement = None
+        
+        if AUTO_REPOINT:
+            grown = getGrownTables([(csvFile, nmmFile)])
+            
+            if grown:
+                TABLE_INLINED = True # uses the pointer cache too
+                
+                if rom == None:
+                    rom = askRomPath()
+                
+                placement = placeTables(grown, [(csvFile, nmmFile)], rom)[csvFile]
+        
+        with stats.table(csvFile):
+            rom = process(csvFile, nmmFile, outFile, rom, blank = blank, incbin = incbin, defs = defs, placement = placement)
+        
+        buildList = [csvFile]
     
     else: # not doSingleFile
-        csvList = glob.glob(folder + '/**/*.csv', recursive = True)
-        
-        for filename in csvList:
-            rom = process(
-                filename,
-                filename.replace(".csv",".nmm"),
-                filename.replace(".csv",".event"),
-                rom
-            )
+        rom, buildList, placements = processFolder(folder, installer, rom, jobs, force, incbin, blank, defs = defs)
+    
+    if watchMode:
+        import watch
+        
+        def rebuild(changed):
+            # read again, in case the definitions changed (the cache makes it cheap otherwise)
+            defs = loadDefinitions(defsFiles, defines) if defsFiles != None else None
+            processFolder(folder, installer, rom, jobs, False, incbin, blank, getChangedTables(changed), defs)
+            nightmare.writeSchemaCache()
         
-        addToInstaller(csvList, installer)
+        # the ROM is only watched for INLINE tables, whose pointers depend on it
+        watcher = watch.FolderWatcher(folder, ('.csv', '.nmm'), ([rom] if rom != None else []) + (list(defs.files) if defs != None else []))
+        watch.watch(watcher, rebuild, interval, INPUT_ERRORS, showInputError)
+    
+    nightmare.writeSchemaCache()
+    
+    stats.report(statsJson)
+    
+    if profile != None and buildList:
+        slowest = stats.slowest(buildList)
+        print("Profiling `{}`:".format(slowest))
+        # same inputs and options as the first time, so it writes the same event again
+        if doSingleFile:
+            stats.profile(lambda: process(csvFile, nmmFile, outFile, rom, blank = blank, incbin = incbin, defs = defs, placement = placement), profile)
+        
+        else:
+            stats.profile(lambda: processJob(slowest, rom, None, incbin, blank, defs, placements.get(slowest)), profile)
     
     if TABLE_INLINED:
         # If we ran successfully and used pfinder, save the pfinder cache.
         from c2eaPfinder import writeCache
         writeCache()
     
-    input("Press Enter to continue")
+    if INTERACTIVE:
+        input("Press Enter to continue")
 
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support() # needed by frozen (PyInstaller) executables
+    
     main()
@@ -1,90 +1,119 @@
-import struct
-caches = {}
+import os, romview, pointercache, pointermap, stats
 
-def getOrSetNew(dicToCheck, key, newFunc):
-    if key not in dicToCheck:
-        dicToCheck[key] = newFunc()
-    return dicToCheck[key]
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def memoize(name = None):
-    def decorator(f):
-        global caches
-        # If we are given a valid name for the function, associate it with that entry in the cache.
-        if name is not None:
-            cache = getOrSetNew(caches, name, lambda: {})
-        else:
-            cache = {}
-        def g(*args):
-            return getOrSetNew(cache, args, lambda: f(*args))
-        # Set the cache as a function attribute so we can access it later (say for serialization)
-        g.cache = cache
-        return g
-    return decorator
-
-def hash(obj):
-    if type(obj) is dict:
-        sortedDict = sorted(obj)
-        return tuple(map(
-            lambda elem: (elem, hash(obj[elem])),
-            sortedDict)).__hash__()
-        # Use sorted so we get the same order for dicts whose
-        # keys may have been added in other orders
-    if type(obj) is list:
-        return tuple(map(hash, obj)).__hash__()
-    else:
-        return obj.__hash__()
+# number of words looked up per step of a vectorized search, bounds the size of temporary arrays
+SEARCH_CHUNK = 0x40000
 
+CACHE_FILE = 'pointers.cache'
+cache = None
 
-cachesLoaded = False
-initialHash = None
-def loadCache():
-    global cachesLoaded
-    global initialHash
-    global caches
-    
-    if not cachesLoaded:
-        import os, pickle
-        if os.path.exists("./.cache"):
-            try:
-                with open("./.cache", 'rb') as f:
-                    caches = pickle.load(f)
-                    if type(caches) != dict: raise Exception
-            except Exception:
-                caches = {}
-        initialHash = hash(caches)
-        cachesLoaded = True
+pointerMaps = {} # ROM digest -> PointerMap loaded in this run
 
-loadCache()
+def getCache():
+    """returns the persistent pointer cache, loading it on first use"""
+    global cache
+    if cache is None:
+        cache = pointercache.PointerCache(os.path.join(pointercache.cacheDirectory(), CACHE_FILE))
+    return cache
 
 def writeCache():
-    if initialHash != hash(caches):
-        import pickle
-        with open("./.cache", 'wb') as f:
-            pickle.dump(caches, f, pickle.HIGHEST_PROTOCOL)
+    if cache is not None:
+        cache.write()
 
 def deleteCache():
-    global caches
-    
-    for name in caches:
-        caches[name] = {}
+    getCache().clear()
     writeCache()
 
-@memoize()
+def cacheStats():
+    """returns the pointer cache hit/miss counts of this run"""
+    return getCache().stats()
+
 def readRom(romFileName):
-    words = []
-    with open(romFileName, 'rb') as rom:
-        while True:
-            word = rom.read(4)
-            if word == b'':
-                break
-            words.append(struct.unpack('<I', word)[0]) #Use the raw data;
-            # <I is little-endian 32 bit unsigned integer
-    return words
+    """returns the memory-mapped ROM as a sequence of 32 bit words"""
+    return romview.openRom(romFileName).words()
 
-@memoize(name = 'pointerOffsets')
 def pointerOffsets(romFileName, value):
-    return tuple(pointerIter(romFileName, value))
+    return pointerOffsetsMany(romFileName, (value,))[value]
 
 def pointerIter(romFileName, value):
     words = readRom(romFileName)
     return (i<<2 for i,x in enumerate(words) if x==value)
+
+def getPointerMap(romFileName, build = True):
+    """Returns the map of every pointer in the ROM (see pointermap), saved next to the pointer cache.
+    It is built and saved if there is none yet, unless build is False (then None is returned)."""
+    with stats.phase('rom'):
+        digest = getCache().digest(romFileName)
+    if digest not in pointerMaps:
+        path = pointermap.getMapPath(pointercache.cacheDirectory(), digest)
+        with stats.phase('pointers'):
+            found = pointermap.load(path)
+            if found is not None:
+                os.utime(path) # recently used, evicted last
+            elif build:
+                found = pointermap.build(romFileName)
+                found.write(path)
+                pointermap.evict(pointercache.cacheDirectory())
+        if found is None:
+            return None
+        pointerMaps[digest] = found
+    return pointerMaps[digest]
+
+def pointerOffsetsMany(romFileName, values):
+    """Returns a dict mapping each value to a tuple of the offsets of the words equal to it.
+    Values missing from the cache are looked up in the pointer map of the ROM if it was built,
+    else all searched for in a single pass over the ROM."""
+    store = getCache()
+    with stats.phase('rom'):
+        digest = store.digest(romFileName)
+    result = {}
+    missing = set()
+    for value in values:
+        offsets = store.lookup(digest, value)
+        if offsets is not None:
+            result[value] = offsets
+        else:
+            missing.add(value)
+    stats.count('cacheHits', len(result))
+    stats.count('cacheMisses', len(missing))
+    if missing:
+        romMap = None
+        if all(pointermap.ROM_START <= value < pointermap.ROM_END for value in missing):
+            romMap = getPointerMap(romFileName, build = False)
+        if romMap is not None:
+            with stats.phase('pointers'):
+                found = {value: romMap.offsetsOf(value) for value in missing}
+        else:
+            with stats.phase('rom'):
+                words = readRom(romFileName)
+            with stats.phase('pointers'):
+                found = searchWords(words, missing)
+        for value in missing:
+            result[value] = tuple(found.get(value, ()))
+            store.store(digest, value, result[value])
+    return result
+
+def searchWords(words, targets):
+    """Returns a dict mapping each target found in words to a list of its byte offsets."""
+    found = {}
+    if numpy is not None:
+        view = numpy.frombuffer(words, dtype = numpy.uint32)
+        keys = numpy.array(sorted(targets), dtype = numpy.uint32)
+        pairs = []
+        # one pass: look every word up in the sorted targets, a chunk at a time
+        for start in range(0, len(view), SEARCH_CHUNK):
+            chunk = view[start:start+SEARCH_CHUNK]
+            index = numpy.searchsorted(keys, chunk)
+            index[index == len(keys)] = 0
+            hits = numpy.flatnonzero(keys[index] == chunk)
+            pairs.extend(zip((hits + start).tolist(), chunk[hits].tolist()))
+    else:
+        targets = set(targets)
+        pairs = ((i, x) for i, x in enumerate(words) if x in targets)
+    for i, x in pairs:
+        found.setdefault(x, []).append(i<<2)
+    return found
@@ -0,0 +1,290 @@
+"""Writes the tables of CSVs straight into a ROM, without going through Event Assembler.
+
+The rows are encoded like c2ea encodes them, symbolic cells are resolved with the
+#defines of the table definitions, and the result is written as a patched copy of
+the ROM or as an IPS/UPS patch. Only the bytes that changed are written.
+"""
+
+import nightmare, c2ea, definitions, patches, projectindex, romview, sys, csv, os
+
+def readTable(inputCSV, nmm, blank):
+    """Returns the first cell of a csv (the table offset) and its (name, cells) rows"""
+    with open(inputCSV, 'r') as myfile:
+        table = csv.reader(myfile)
+        tableOffset = next(table, [''])[0].strip()
+        rows = list(c2ea.genCells(table, nmm.columns, inputCSV, blank))
+    return tableOffset, rows
+
+def getOverlaps(columns):
+    """(column, earlier column) pairs of columns sharing bytes of a row"""
+    overlaps = []
+    last = None
+
+    for entry in columns: # sorted by offset
+        if last != None and entry.length > 0 and entry.offset < last.offset + last.length:
+            overlaps.append((entry, last))
+
+        if last == None or entry.offset + entry.length > last.offset + last.length:
+            last = entry
+
+    return overlaps
+
+def encodeRows(inputCSV, nmm, rows, defs):
+    """Returns the bytes of the rows of a table.
+    Raises CellError listing every cell that doesn't fit its column or uses an undefined symbol,
+    or if columns overlap: c2ea writes the cells of a row one after the other, which this can't match."""
+    columns = nmm.columns
+    overlaps = getOverlaps(columns)
+
+    if overlaps:
+        raise c2ea.CellError("{}: columns overlap ({}), use c2ea for this table".format(inputCSV,
+            ", ".join("`{}` and `{}`".format(entry.description, other.description) for entry, other in overlaps)))
+
+    encoders = [c2ea.compileEncoder(entry, defs) for entry in columns]
+    data = bytearray(len(rows) * nmm.rowLength)
+    errors = []
+
+    for index, (name, cells) in enumerate(rows):
+        base = index * nmm.rowLength
+
+        # csv line numbers and spreadsheet columns, counting the name column
+        if len(cells) < len(columns):
+            errors.append("row {} ({}): {} cell(s), the table has {} columns".format(index+2, name, len(cells), len(columns)))
+            continue
+
+        for column, (entry, encode, cell) in enumerate(zip(columns, encoders, cells)):
+            try:
+                text, raw = encode(cell)
+
+                if raw == None:
+                    raise LookupError("`{}` can't be worked out without EA (it uses a macro or a label)".format(cell))
+
+            except (OverflowError, LookupError) as e:
+                errors.append("row {} ({}), column {} ({}): {}".format(index+2, name, column+2, entry.description, e))
+                continue
+
+            data[base+entry.offset:base+entry.offset+entry.length] = raw
+
+    if errors:
+        raise c2ea.CellError("{}: {} bad cell(s):\n  ".format(inputCSV, len(errors)) + "\n  ".join(errors))
+
+    return data
+
+def getTableOffset(inputCSV, tableOffset, defs):
+    """ROM offset of a table that isn't INLINE, from the first cell of its csv"""
+    value = defs.resolve(tableOffset)
+
+    if value == None:
+        raise c2ea.CellError("{}: table offset `{}` isn't a number or a defined symbol".format(inputCSV, tableOffset))
+
+    # like EA, take both offsets and GBA addresses
+    return value & 0x1FFFFFF if value >= 0x8000000 else value
+
+def patchTables(csvList, romPath, defs, blank = 'ask', freeSpace = None):
+    """Writes the tables of the csvs into a copy of the ROM.
+    INLINE tables go to freeSpace (default: the end of the ROM) and the pointers to their original table are changed.
+    Raises FreeSpaceError if freeSpace isn't all padding (see freespace) where they go.
+    Returns the patched ROM and the (start, end) regions written."""
+    from c2eaPfinder import pointerOffsetsMany, getCache
+
+    rom = bytearray(romview.openRom(romPath).data)
+    cursor = freeSpace if freeSpace != None else len(rom)
+    tables = []
+    errors = []
+
+    # Place every table first, so that the labels of INLINE tables can be used in any cell
+    for inputCSV in csvList:
+        nmm = nightmare.loadTable(inputCSV.replace(".csv",".nmm"))
+        tableOffset, rows = readTable(inputCSV, nmm, blank)
+
+        if tableOffset[0:6] == "INLINE":
+            offset = (cursor + 3) & ~3 # ALIGN 4
+            cursor = offset + len(rows) * nmm.rowLength
+            label = tableOffset.replace("INLINE", '').strip()
+
+            if label != '':
+                defs.define(label, offset)
+
+            tables.append((inputCSV, nmm, rows, offset, nmm.offset | 0x8000000))
+
+        else:
+            try:
+                tables.append((inputCSV, nmm, rows, getTableOffset(inputCSV, tableOffset, defs), None))
+
+            except c2ea.CellError as e:
+                errors.append(str(e))
+
+    if freeSpace != None and any(target != None for inputCSV, nmm, rows, offset, target in tables):
+        import freespace, pointercache
+
+        runs = freespace.getRuns(romPath, getCache().digest(romPath), os.path.join(pointercache.cacheDirectory(), freespace.CACHE_FILE))
+
+        for inputCSV, nmm, rows, offset, target in tables:
+            end = offset + len(rows) * nmm.rowLength
+
+            if target != None and not freespace.isFree(runs, offset, end, len(rom)):
+                raise c2ea.FreeSpaceError("{} would go to ${:X}-${:X}, which isn't free space (it isn't all 0x00 or 0xFF)".format(inputCSV, offset, end))
+
+    targets = set(target for inputCSV, nmm, rows, offset, target in tables if target != None)
+    pointers = pointerOffsetsMany(romPath, targets) if targets else {}
+
+    regions = []
+
+    for inputCSV, nmm, rows, offset, target in tables:
+        try:
+            data = encodeRows(inputCSV, nmm, rows, defs)
+
+        except c2ea.CellError as e:
+            errors.append(str(e))
+            continue
+
+        if offset + len(data) > len(rom):
+            rom.extend(bytes(offset + len(data) - len(rom)))
+
+        rom[offset:offset+len(data)] = data
+        regions.append((offset, offset + len(data)))
+
+        if target != None:
+            if not pointers[target]:
+                print("Warning: nothing in the ROM points to the original table of {}, so nothing points to it at ${:X}".format(inputCSV, offset))
+
+            # repoint the references to the original table
+            for pointer in pointers[target]:
+                rom[pointer:pointer+4] = (offset | 0x8000000).to_bytes(4, 'little')
+                regions.append((pointer, pointer + 4))
+
+    if errors:
+        raise c2ea.CellError("\n".join(errors))
+
+    return rom, regions
+
+def getChangedRuns(original, rom, regions):
+    """(offset, bytes) runs that differ between the ROMs in the written regions"""
+    runs = []
+    end = 0
+
+    for start, regionEnd in sorted(regions):
+        start = max(start, end) # overlapping regions are only compared once
+        if start < regionEnd:
+            runs.extend(patches.diffRuns(original, rom, start, regionEnd))
+            end = max(end, regionEnd)
+
+    return patches.mergeRuns(runs)
+
+def writeFile(path, data):
+    temp = path + '.tmp'
+
+    with open(temp, 'wb') as f:
+        f.write(data)
+
+    os.replace(temp, path)
+
+def main():
+    import argparse
+
+    sys.excepthook = c2ea.showExceptionAndExit
+
+    parser = argparse.ArgumentParser(description = 'Write the tables of CSV files straight into a ROM (or an IPS/UPS patch), without Event Assembler.')
+
+    parser.add_argument('rom', help = 'ROM to patch (INLINE tables are also searched for in it)')
+
+    # Input arguments
+    parser.add_argument('-folder', help = 'folder to look for csvs in (default: current directory)')
+    parser.add_argument('-csv', help = 'only write this csv')
+    parser.add_argument('-defs', action = 'append', help = 'file with the #defines used in the csvs (default: [Folder]/Table Definitions.txt), can be given more than once')
+    parser.add_argument('-define', action = 'append', default = [], metavar = 'NAME[=VALUE]', help = 'define a symbol before reading the definitions, e.g. _FE8_')
+    parser.add_argument('-include', '--include', action = 'append', default = [], metavar = 'PATTERN', help = 'only look at csvs whose path in the folder (or name) matches PATTERN, can be given more than once')
+    parser.add_argument('-exclude', '--exclude', action = 'append', default = [], metavar = 'PATTERN', help = 'never look in folders or at files matching PATTERN, can be given more than once')
+    parser.add_argument('-rescan', '--rescan', action = 'store_true', help = 'list every folder again instead of trusting the project index (.nmm2csv-index)')
+    parser.add_argument('-freespace', help = 'offset to write INLINE tables at, checked to be 0x00 or 0xFF padding (default: end of the ROM)')
+
+    # Output arguments
+    parser.add_argument('-out', help = 'patched ROM to write (can be the ROM itself, then only the changed bytes are written)')
+    parser.add_argument('-ips', help = 'IPS patch to write')
+    parser.add_argument('-ups', help = 'UPS patch to write')
+
+    parser.add_argument('-nopause', '--no-pause', action = 'store_true', help = 'never wait for the user')
+    parser.add_argument('-blank', '--blank', choices = ['ask', 'zero', 'error'], help = 'what to do with blank cells (default: ask, error with -nopause)')
+
+    args = parser.parse_args()
+
+    c2ea.INTERACTIVE = not args.no_pause
+    blank = args.blank if args.blank != None else ('ask' if c2ea.INTERACTIVE else 'error')
+
+    if (args.out, args.ips, args.ups) == (None, None, None):
+        sys.exit("ERROR: nothing to write, give -out, -ips or -ups.")
+
+    folder = args.folder if args.folder != None else os.getcwd()
+
+    projectindex.INCLUDE = args.include
+    projectindex.EXCLUDE = args.exclude
+    projectindex.RESCAN = args.rescan
+
+    if args.csv != None:
+        if not os.path.exists(args.csv.replace(".csv",".nmm")):
+            sys.exit("ERROR: NMM File `{}` doesn't exist!".format(args.csv.replace(".csv",".nmm")))
+
+        csvList = [args.csv]
+
+    else:
+        tables = projectindex.findTables(folder)
+
+        for nmmFile, csvFile in tables:
+            if nmmFile == None:
+                print("Skipping `{}`: there's no NMM next to it.".format(csvFile))
+
+        csvList = sorted(csvFile for nmmFile, csvFile in tables if nmmFile != None and csvFile != None)
+
+    defsFiles = args.defs if args.defs != None else [os.path.join(folder, 'Table Definitions.txt')]
+
+    for path in args.defs or []:
+        if not os.path.exists(path):
+            sys.exit("ERROR: definitions file `{}` doesn't exist!".format(path))
+
+    defs = c2ea.loadDefinitions([path for path in defsFiles if os.path.exists(path)], args.define)
+
+    freeSpace = definitions.parseNumber(args.freespace) if args.freespace != None else None
+
+    if args.out != None and os.path.exists(args.out) and os.path.samefile(args.out, args.rom) and c2ea.getInlineTargets(csvList):
+        # the next run would look for the pointers to the original tables in the repointed ROM, and add the tables again
+        sys.exit("ERROR: INLINE tables can't be written into the ROM they are repointed from, keep a clean ROM and give another -out (or -ips/-ups).")
+
+    original = romview.openRom(args.rom).data
+    rom, regions = patchTables(csvList, args.rom, defs, blank, freeSpace)
+    runs = getChangedRuns(original, rom, regions)
+
+    if args.out != None:
+        if os.path.exists(args.out) and os.path.samefile(args.out, args.rom):
+            with open(args.out, 'r+b') as f:
+                for offset, data in runs:
+                    f.seek(offset)
+                    f.write(data)
+
+        else:
+            writeFile(args.out, rom)
+
+        print("Wrote to `{}`".format(args.out))
+
+    if args.ips != None:
+        try:
+            writeFile(args.ips, patches.makeIps(rom, runs))
+
+        except ValueError as e:
+            sys.exit("ERROR: " + str(e))
+
+        print("Wrote to `{}`".format(args.ips))
+
+    if args.ups != None:
+        writeFile(args.ups, patches.makeUps(original, rom, runs))
+        print("Wrote to `{}`".format(args.ups))
+
+    print("Patched {} tables: {} bytes changed in {} places.".format(len(csvList), sum(len(data) for offset, data in runs), len(runs)))
+
+    from c2eaPfinder import writeCache
+    writeCache()
+
+    if c2ea.INTERACTIVE:
+        input("Press Enter to continue")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""#define symbols of EA definition files (e.g. Table Definitions.txt), for the
+tools that work out table cells without going through EA.
+
+The files are preprocessed like EA does: #include, #ifdef/#ifndef/#if/#else/#endif
+and #undef are followed, so game guards such as #ifdef _FE8_ pick the right
+symbols, and definitions can be expressions like IsWeapon|IsMagic. An #if whose
+condition can't be worked out here is taken as true, with a warning.
+"""
+
+import hashlib, os, re, sys
+
+DIRECTIVE = re.compile(r'#(\w+)\s*(.*)$')
+DEFINE = re.compile(r'(\w+)(\()?\s*(.*)$')
+TOKEN = re.compile(r'\s*(?:(0x[0-9a-fA-F]+|\$[0-9a-fA-F]+|0b[01]+|[0-9]+)|([A-Za-z_]\w*)|(<<|>>|[-+*/%&|^~()]))')
+
+# binary operators from the loosest to the tightest, as in C
+BINARY = (('|',), ('^',), ('&',), ('<<', '>>'), ('+', '-'), ('*', '/', '%'))
+
+CACHE_FILE = 'definitions.cache'
+MAX_INCLUDE_DEPTH = 32
+
+def parseNumber(text):
+  """value of a number as EA reads it (0x or $ for hex, 0b for binary), raises ValueError if it isn't one"""
+  if text.startswith('$'):
+    return int(text[1:], 16)
+  return int(text, 0)
+
+def tokenize(text):
+  """(number, symbol, operator) tuples of an expression, raises ValueError if it isn't one"""
+  tokens = []
+  pos = 0
+  text = text.rstrip()
+  while pos < len(text):
+    match = TOKEN.match(text, pos)
+    if match == None:
+      raise ValueError("can't read `{}`".format(text))
+    number, symbol, operator = match.groups()
+    tokens.append((parseNumber(number) if number != None else None, symbol, operator))
+    pos = match.end()
+  if not tokens:
+    raise ValueError("empty expression")
+  return tokens
+
+def applyOperator(operator, a, b):
+  if a == None or b == None:
+    return None # depends on a symbol only EA knows
+  if operator in ('/', '%'):
+    if b == 0:
+      raise ValueError("division by zero")
+    quotient = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1) # rounded toward zero like EA
+    return quotient if operator == '/' else a - b * quotient
+  return {
+    '|': lambda: a | b, '^': lambda: a ^ b, '&': lambda: a & b,
+    '<<': lambda: a << b, '>>': lambda: a >> b,
+    '+': lambda: a + b, '-': lambda: a - b, '*': lambda: a * b,
+  }[operator]()
+
+def evaluateTokens(tokens, lookup):
+  """value of a tokenized expression, lookup returns the value of a symbol.
+  None if it depends on a symbol whose value is None. Raises ValueError on syntax errors."""
+  pos = 0
+
+  def unary():
+    nonlocal pos
+    if pos >= len(tokens):
+      raise ValueError("incomplete expression")
+    number, symbol, operator = tokens[pos]
+    pos += 1
+    if number != None:
+      return number
+    if symbol != None:
+      return lookup(symbol)
+    if operator in ('-', '~', '+'):
+      value = unary()
+      return None if value == None else {'-': -value, '~': ~value, '+': value}[operator]
+    if operator == '(':
+      value = binary(0)
+      if pos >= len(tokens) or tokens[pos][2] != ')':
+        raise ValueError("missing )")
+      pos += 1
+      return value
+    raise ValueError("unexpected `{}`".format(operator))
+
+  def binary(level):
+    nonlocal pos
+    if level == len(BINARY):
+      return unary()
+    value = binary(level + 1)
+    while pos < len(tokens) and tokens[pos][2] in BINARY[level]:
+      operator = tokens[pos][2]
+      pos += 1
+      value = applyOperator(operator, value, binary(level + 1))
+    return value
+
+  value = binary(0)
+  if pos != len(tokens):
+    raise ValueError("unexpected tokens after the expression")
+  return value
+
+def getDigest(path):
+  """sha1 of a file's contents as hex, None if it doesn't exist"""
+  try:
+    with open(path, 'rb') as f:
+      return hashlib.sha1(f.read()).hexdigest()
+  except OSError:
+    return None
+
+def findInclude(name, directory):
+  """path of an included file, relative to the including file like EA, None if it isn't there"""
+  path = os.path.normpath(os.path.join(directory, name))
+  return path if os.path.isfile(path) else None
+
+class Definitions:
+  """Symbols defined to numbers, expressions or other symbols.
+  A symbol defined to None is only known to EA (e.g. a label), cells using it are left to EA.
+  Macros (#define Name(args) ...) are remembered as such and never evaluated."""
+
+  def __init__(self):
+    self.values = {} # name -> definition text, None if only EA knows its value
+    self.files = {} # path -> digest of every file read, None for includes that weren't found
+    self.resolved = {} # name -> value, cleared when a symbol changes
+
+  def load(self, path, depth = 0):
+    """preprocesses a definitions file and the files it includes"""
+    path = os.path.normpath(os.path.abspath(path))
+    self.files[path] = getDigest(path)
+    self.resolved = {}
+    skipping = [] # per open #if: whether its lines are skipped
+    with open(path, 'r') as f:
+      for line in f:
+        match = DIRECTIVE.match(line.split('//')[0].strip())
+        if match == None:
+          continue
+        directive, rest = match.groups()
+        if directive in ('ifdef', 'ifndef'):
+          skip = any(skipping) or ((rest.strip() in self.values) != (directive == 'ifdef'))
+          skipping.append(skip)
+        elif directive == 'if':
+          skipping.append(any(skipping) or not self.condition(rest, path))
+        elif directive == 'else' and skipping:
+          skipping[-1] = any(skipping[:-1]) or not skipping[-1]
+        elif directive == 'endif' and skipping:
+          skipping.pop()
+        elif any(skipping):
+          continue
+        elif directive == 'define':
+          define = DEFINE.match(rest)
+          if define != None:
+            name, isMacro, value = define.groups()
+            self.values[name] = None if isMacro else value.strip().strip('"')
+        elif directive == 'undef':
+          self.values.pop(rest.strip(), None)
+        elif directive == 'include' and depth < MAX_INCLUDE_DEPTH:
+          name = rest.strip().strip('"')
+          include = findInclude(name, os.path.dirname(path))
+          if include == None:
+            self.files[os.path.normpath(os.path.join(os.path.dirname(path), name))] = None
+          else:
+            self.load(include, depth + 1)
+
+  def condition(self, text, path):
+    """whether the lines after #if text are read; true if it can't be worked out"""
+    value = self.resolve(text)
+    if value == None:
+      print("Warning: can't work out `#if {}` in {}, reading what it guards".format(text.strip(), path), file = sys.stderr)
+      return True
+    return value != 0
+
+  def define(self, name, value):
+    self.values[name] = str(value)
+    self.resolved = {}
+
+  def declare(self, name):
+    """makes name a symbol only EA knows the value of, such as a label"""
+    self.values[name] = None
+    self.resolved = {}
+
+  def lookup(self, name, seen = ()):
+    if name in self.resolved:
+      return self.resolved[name]
+    if name not in self.values:
+      raise LookupError("`{}` isn't defined".format(name))
+    if name in seen:
+      raise LookupError("`{}` is defined in terms of itself".format(name))
+    text = self.values[name]
+    try:
+      value = None if not text else evaluateTokens(tokenize(text), lambda symbol: self.lookup(symbol, seen + (name,)))
+    except ValueError:
+      value = None # not an expression, leave it to EA
+    self.resolved[name] = value
+    return value
+
+  def evaluate(self, text):
+    """Value of a number, symbol or expression of them. None if EA has to work it out
+    (it uses labels or macros, or isn't an expression). Raises LookupError for undefined symbols."""
+    try:
+      tokens = tokenize(text.strip())
+      evaluateTokens(tokens, lambda symbol: None) # syntax first, so `Iron Sword` isn't an undefined `Iron`
+      return evaluateTokens(tokens, self.lookup)
+    except ValueError:
+      return None
+
+  def resolve(self, text):
+    """value of a number, symbol or expression, None if it can't be worked out"""
+    try:
+      return self.evaluate(text)
+    except LookupError:
+      return None
+
+  def digest(self):
+    """hex digest of the symbols, changes whenever a cell could be worked out differently"""
+    return hashlib.sha1(repr(sorted(self.values.items(), key = lambda item: item[0])).encode('utf-8')).hexdigest()
+
+class DefinitionsCache:
+  """Preprocessed definitions pickled to disk, reused while the digests of every file they were read from
+  (including the includes that were missing) stay the same."""
+  FORMAT_VERSION = 1
+  MAX_ENTRIES = 16
+
+  def __init__(self, path):
+    self.path = path
+    self.entries = {} # (paths, predefined symbols) -> (files, values)
+    self.dirty = False
+    try:
+      import pickle
+      with open(path, 'rb') as f:
+        version, entries = pickle.load(f)
+      if version == self.FORMAT_VERSION:
+        self.entries = entries
+    except Exception: # missing, corrupt or from an older version: start over
+      pass
+
+  def get(self, key):
+    if key not in self.entries:
+      return None
+    files, values = self.entries[key]
+    if any(getDigest(path) != digest for path, digest in files.items()):
+      return None
+    defs = Definitions()
+    defs.files, defs.values = dict(files), dict(values)
+    return defs
+
+  def put(self, key, defs):
+    self.entries.pop(key, None)
+    while len(self.entries) >= self.MAX_ENTRIES:
+      del self.entries[next(iter(self.entries))] # the oldest one
+    self.entries[key] = (dict(defs.files), dict(defs.values))
+    self.dirty = True
+
+  def write(self):
+    if not self.dirty:
+      return
+    import pickle
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+    temp = self.path + '.tmp'
+    with open(temp, 'wb') as f:
+      pickle.dump((self.FORMAT_VERSION, self.entries), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, self.path)
+    self.dirty = False
+
+def parseDefine(text):
+  """(name, value) of a NAME or NAME=VALUE command line definition, like EA's -D"""
+  name, equals, value = text.partition('=')
+  return name.strip(), value.strip() if equals else ''
+
+def loadDefinitions(paths, predefined = (), cachePath = None):
+  """Definitions of the files (and what they include), read after defining the predefined
+  (name, value) symbols, e.g. ('_FE8_', ''). With cachePath, unchanged files aren't preprocessed again."""
+  key = (tuple(os.path.normpath(os.path.abspath(path)) for path in paths), tuple(predefined))
+  cache = DefinitionsCache(cachePath) if cachePath != None else None
+  if cache != None:
+    defs = cache.get(key)
+    if defs != None:
+      return defs
+  defs = Definitions()
+  for name, value in predefined:
+    defs.values[name] = value
+  for path in paths:
+    defs.load(path)
+  if cache != None:
+    cache.put(key, defs)
+    cache.write()
+  return defs
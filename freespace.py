@@ -0,0 +1,140 @@
+"""Free space of a ROM: runs of 0x00 or 0xFF padding, for placing tables that outgrew their space.
+
+Runs are found with vectorized run-length detection over the memory-mapped ROM
+(a regex scan without numpy) and cached per ROM content, so later runs only
+look them up.
+"""
+
+import os, re
+import romview
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+FILL_BYTES = (0x00, 0xFF)
+MIN_RUN = 16 # shorter runs are never free space worth keeping
+
+CACHE_FILE = 'freespace.cache'
+MAX_ROMS = 8
+
+def findRuns(data, minLength = MIN_RUN):
+  """(start, end) of every run of at least minLength bytes that are all 0x00 or all 0xFF, sorted"""
+  runs = []
+  if numpy is not None:
+    rom = numpy.frombuffer(data, dtype = numpy.uint8)
+    for fill in FILL_BYTES:
+      # a run starts and ends where the mask changes
+      mask = numpy.concatenate(([False], rom == fill, [False]))
+      edges = numpy.flatnonzero(mask[1:] != mask[:-1])
+      starts, ends = edges[0::2], edges[1::2]
+      keep = ends - starts >= minLength
+      runs.extend(zip(starts[keep].tolist(), ends[keep].tolist()))
+  else:
+    pattern = re.compile(b'|'.join(re.escape(bytes([fill])) + b'{%d,}' % minLength for fill in FILL_BYTES))
+    runs.extend(match.span() for match in pattern.finditer(data))
+  return sorted(runs)
+
+def subtract(runs, reserved):
+  """parts of the runs outside the reserved (start, end) regions"""
+  pieces = []
+  reserved = sorted(reserved)
+  for start, end in runs:
+    for low, high in reserved:
+      if high <= start or low >= end:
+        continue
+      if low > start:
+        pieces.append((start, low))
+      start = max(start, high)
+      if start >= end:
+        break
+    if start < end:
+      pieces.append((start, end))
+  return pieces
+
+def isFree(runs, start, end, size = None):
+  """whether the bytes [start, end) are all in runs, or past the end of a ROM of size bytes"""
+  if size != None:
+    end = min(end, size)
+  for low, high in runs:
+    if low <= start < high:
+      start = high
+    if start >= end:
+      return True
+  return start >= end
+
+class FreeSpace:
+  """Hands out free space from runs, never giving the same bytes twice.
+  Space comes from the largest run that fits, where it's least likely that padding is really data."""
+
+  def __init__(self, runs, reserved = (), start = 0, end = None):
+    self.runs = [(max(low, start), min(high, end) if end != None else high) for low, high in subtract(runs, reserved)]
+    self.runs = [(low, high) for low, high in self.runs if low < high]
+
+  def allocate(self, size, alignment = 4):
+    """offset of size free bytes at a multiple of alignment, None if no run is big enough"""
+    best = None
+    for index, (low, high) in enumerate(self.runs):
+      aligned = -(-low // alignment) * alignment
+      if aligned + size <= high and (best == None or high - low > self.runs[best][1] - self.runs[best][0]):
+        best = index
+    if best == None:
+      return None
+    low, high = self.runs[best]
+    offset = -(-low // alignment) * alignment
+    self.runs[best:best+1] = [run for run in ((low, offset), (offset + size, high)) if run[0] < run[1]]
+    return offset
+
+class RunCache:
+  """runs of the last ROMs, pickled to disk under their content digest"""
+  FORMAT_VERSION = 1
+
+  def __init__(self, path):
+    self.path = path
+    self.entries = {} # digest -> runs, most recently used last
+    self.dirty = False
+    try:
+      import pickle
+      with open(path, 'rb') as f:
+        version, entries = pickle.load(f)
+      if version == self.FORMAT_VERSION:
+        self.entries = entries
+    except Exception: # missing, corrupt or from an older version: start over
+      pass
+
+  def get(self, digest):
+    runs = self.entries.pop(digest, None)
+    if runs is not None:
+      self.entries[digest] = runs
+    return runs
+
+  def put(self, digest, runs):
+    self.entries.pop(digest, None)
+    self.entries[digest] = runs
+    while len(self.entries) > MAX_ROMS:
+      del self.entries[next(iter(self.entries))]
+    self.dirty = True
+
+  def write(self):
+    if not self.dirty:
+      return
+    import pickle
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+    temp = self.path + '.tmp'
+    with open(temp, 'wb') as f:
+      pickle.dump((self.FORMAT_VERSION, self.entries), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, self.path)
+    self.dirty = False
+
+def getRuns(romFileName, digest, cachePath = None):
+  """free space runs of a ROM whose content digest is given, from the cache at cachePath if it has them"""
+  cache = RunCache(cachePath) if cachePath != None else None
+  runs = cache.get(digest) if cache != None else None
+  if runs is None:
+    runs = findRuns(romview.openRom(romFileName).data)
+    if cache != None:
+      cache.put(digest, runs)
+  if cache != None:
+    cache.write()
+  return runs
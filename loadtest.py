@@ -0,0 +1,118 @@
+"""Load test of tableserver.py.
+
+Starts the server on a synthetic project (see benchmark.py), or connects to a
+running one, and times cell, row and batched requests from one or more
+clients, printing the requests per second and latency percentiles.
+
+Usage: python loadtest.py [-n 5000] [--clients 4] [--connect 127.0.0.1:8765 --table "Item Table"]
+"""
+
+import os, random, socket, subprocess, sys, tempfile, time
+import benchmark, n2c, romview, tableserver
+
+BATCH_SIZE = 50
+
+def parseAddress(text):
+    """(host, port) of host:port, else a Unix socket path"""
+    host, colon, port = text.rpartition(':')
+    return (host or '127.0.0.1', int(port)) if colon and port.isdigit() else text
+
+def makeProject(directory):
+    """synthetic project with ripped CSVs, returns the ROM and its folder"""
+    romPath, tables = benchmark.makeProject(directory, 16 << 20)
+    romBytes = romview.openRom(romPath).data
+    for nmmPath, rowNum, size in tables:
+        benchmark.silently(lambda: n2c.ripModule(nmmPath, romBytes, None))
+    return romPath, os.path.dirname(romPath)
+
+def startServer(romPath, folder):
+    """runs the server in another process (so clients don't share its GIL), returns it and its address"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tableserver.py'),
+        romPath, '-f', folder, '-p', str(port)], stdout = subprocess.DEVNULL)
+    address = ('127.0.0.1', port)
+    for attempt in range(200):
+        try:
+            socket.create_connection(address).close()
+            return server, address
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("the server didn't start")
+
+def runClient(address, table, count, seed):
+    """Times count requests of each kind, returns {kind: [seconds per request]}"""
+    client = tableserver.Client(address)
+    rng = random.Random(seed)
+    info = [t for t in client.call('tables') if t['name'] == table][0]
+    rows, columns = info['rows'], info['columns']
+    cells = [(rng.randrange(rows), rng.randrange(len(columns))) for i in range(count)]
+    client.call('getRow', table = table, row = 0) # loads the table before timing
+
+    kinds = {
+        'getCell': lambda row, column: client.call('getCell', table = table, row = row, column = column),
+        'getRow': lambda row, column: client.call('getRow', table = table, row = row),
+        'setCell': lambda row, column: client.call('setCell', table = table, row = row, column = column,
+            value = client.call('getCell', table = table, row = row, column = column)),
+        'batch{}'.format(BATCH_SIZE): lambda row, column: client.batch(
+            [('getCell', {'table': table, 'row': (row + i) % rows, 'column': column}) for i in range(BATCH_SIZE)]),
+    }
+
+    times = {}
+    for kind, request in kinds.items():
+        times[kind] = []
+        for row, column in cells[:count if not kind.startswith('batch') else max(1, count // BATCH_SIZE)]:
+            start = time.perf_counter()
+            request(row, column)
+            times[kind].append(time.perf_counter() - start)
+    client.call('revert', table = table) # setCell wrote the same values, but the table counts as changed
+    client.close()
+    return times
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def main():
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description = 'Load test of the table server.')
+    parser.add_argument('-n', '--requests', type = int, default = 5000, help = 'requests of each kind per client (default: 5000)')
+    parser.add_argument('--clients', type = int, default = 1, help = 'clients making requests at the same time, each in its own process (default: 1)')
+    parser.add_argument('--connect', metavar = 'ADDRESS', help = 'host:port or Unix socket of a running server (default: start one on a synthetic project)')
+    parser.add_argument('--table', default = 'Item Table', help = 'table to query (default: Item Table)')
+    args = parser.parse_args()
+
+    server = None
+    directory = tempfile.TemporaryDirectory()
+    try:
+        if args.connect != None:
+            address = parseAddress(args.connect)
+        else:
+            server, address = startServer(*makeProject(directory.name))
+
+        with ProcessPoolExecutor(max_workers = args.clients) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(runClient, [address] * args.clients, [args.table] * args.clients,
+                [args.requests] * args.clients, range(args.clients)))
+            elapsed = time.perf_counter() - start
+
+        print("{} client(s), {:.1f}s:".format(args.clients, elapsed))
+        print("{:>10} {:>9} {:>12} {:>10} {:>10} {:>10}".format("request", "count", "requests/s", "p50", "p99", "max"))
+        for kind in results[0]:
+            times = [t for result in results for t in result[kind]]
+            # requests/s of all clients together, each spending sum(times) on its requests
+            rate = sum(len(result[kind]) / sum(result[kind]) for result in results)
+            print("{:>10} {:>9} {:>12.0f} {:>8.0f}us {:>8.0f}us {:>8.0f}us".format(
+                kind, len(times), rate, percentile(times, 0.5)*1e6, percentile(times, 0.99)*1e6, max(times)*1e6))
+    finally:
+        if server != None:
+            server.terminate()
+            server.wait()
+        directory.cleanup()
+
+if __name__ == '__main__':
+    main()
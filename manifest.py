@@ -0,0 +1,73 @@
+import hashlib, json, os
+
+def fileDigest(path):
+  """sha1 of a file's contents as hex, None if it doesn't exist"""
+  try:
+    with open(path, 'rb') as f:
+      return hashlib.sha1(f.read()).hexdigest()
+  except FileNotFoundError:
+    return None
+
+def bytesDigest(data):
+  return hashlib.sha1(data).hexdigest()
+
+def outputStamp(path):
+  """[size, mtime] of an output file, None if it doesn't exist"""
+  try:
+    stat = os.stat(path)
+  except FileNotFoundError:
+    return None
+  return [stat.st_size, stat.st_mtime_ns]
+
+class BuildManifest:
+  """Remembers what each generated file was built from, so unchanged ones can be skipped.
+  Entries are keyed by name, and hold the digests of their inputs and the size and mtime
+  their outputs had when written (so outputs that were edited or deleted get rebuilt)."""
+
+  def __init__(self, path, version):
+    self.path = path
+    self.version = version # changing this invalidates every entry
+    self.entries = {}
+    self.used = set()
+    try:
+      with open(path, 'r') as f:
+        data = json.load(f)
+      if data.get('version') == version:
+        self.entries = data['entries']
+    except (FileNotFoundError, ValueError, KeyError, AttributeError):
+      pass
+
+  def isUpToDate(self, key, inputs, outputs, allowEdits = False):
+    """whether the outputs of key exist unchanged and were built from these inputs.
+    With allowEdits, outputs only need to exist (for files users edit by hand)."""
+    self.used.add(key)
+    entry = self.entries.get(key)
+    if entry is None or entry['inputs'] != inputs:
+      return False
+    if allowEdits:
+      return all(os.path.exists(output) for output in outputs)
+    # outputs recorded but gone count as deleted
+    if set(entry['outputs']) != set(self.relative(output) for output in outputs):
+      return False
+    return all(entry['outputs'].get(self.relative(output)) == outputStamp(output) != None for output in outputs)
+
+  def record(self, key, inputs, outputs):
+    """stores the inputs of key, call after its outputs were written"""
+    self.used.add(key)
+    self.entries[key] = {'inputs': inputs, 'outputs': {self.relative(output): outputStamp(output) for output in outputs}}
+
+  def keep(self, key):
+    """keeps the entry of key as it is, for inputs that weren't checked this run"""
+    self.used.add(key)
+
+  def relative(self, path):
+    """paths are stored relative to the manifest, so the project can be moved"""
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(self.path)))
+
+  def write(self):
+    """saves the entries used in this run, dropping the ones of inputs that went away"""
+    data = {'version': self.version, 'entries': {key: self.entries[key] for key in sorted(self.used) if key in self.entries}}
+    temp = self.path + '.tmp'
+    with open(temp, 'w') as f:
+      json.dump(data, f, indent = 1, sort_keys = True)
+    os.replace(temp, self.path)
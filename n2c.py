@@ -1,9 +1,16 @@
-import nightmare, csv, sys, glob, os, re
+import nightmare, romview, tabledecode, manifest, stats, copy, csv, sys, glob, os, re
+
+# bump whenever the generated CSVs change, so incremental rips redo every module
+N2C_VERSION = "1.1"
+MANIFEST_NAME = ".n2c-manifest"
+
+INTERACTIVE = True # False never waits for the user: no "Press Enter" and no ROM dialog
 
 def showExceptionAndExit(exc_type, exc_value, tb):
     import traceback
     traceback.print_exception(exc_type, exc_value, tb)
-    input("Press Enter key to exit.")
+    if INTERACTIVE:
+        input("Press Enter key to exit.")
     sys.exit(-1)
 
 def genIdentifierEntries(names):
@@ -33,6 +40,16 @@ def genIdentifierEntries(names):
         
         yield newName
 
+def getRowName(nmm, row):
+    """First cell of a row is row/entry name"""
+    try:
+        name = nmm.entryNames[row]
+    
+    except IndexError:
+        name = ""
+    
+    return name if name != "" else hex(row)
+
 def genTableRows(nmm, rom):
     # First cell is offset of table in ROM
     headers = [hex(nmm.offset)]
@@ -42,20 +59,27 @@ def genTableRows(nmm, rom):
         headers.append(col.description)
     
     yield headers
+    
+    # Decode all columns at once if we can, else fall back to decoding cell by cell
+    columns = tabledecode.decodeTable(nmm, rom)
+    
+    if columns != None:
+        for row, cells in enumerate(zip(*columns)):
+            thisRow = [getRowName(nmm, row)]
+            thisRow.extend(cells)
+            
+            yield thisRow
+    
+    else:
+        yield from genTableRowsSlow(nmm, rom)
 
+def genTableRowsSlow(nmm, rom):
+    """Decodes the table rows cell by cell"""
     for row in range(nmm.rowNum):
         # rowOffset is the offset in ROM of the row data
         rowOffset = nmm.offset + row*nmm.rowLength
         
-        # First cell is row/entry name
-        try:
-            thisRow = [nmm.entryNames[row]]
-            
-            if thisRow[0] == "":
-                thisRow[0] = hex(row)
-        
-        except IndexError:
-            thisRow = [hex(row)]
+        thisRow = [getRowName(nmm, row)]
         
         for entry in nmm.columns:
             # currentOffset is offset in ROM of current field data
@@ -98,25 +122,478 @@ def genEntryDefinitions(nmm, getEntryDefinition):
         
         yield getEntryDefinition(name, i)
 
+def ripModule(nmmFile, romBytes, entryListMode, snapshot = False, csvFile = None):
+    """Rips one NMM to CSV (and an entry list file if entryListMode is 'enums', 'defines' or 'assigns',
+    and a binary snapshot of the table with snapshot, see tablesnapshot). Returns False if the NMM couldn't be parsed.
+    The CSV goes next to the NMM unless csvFile says where, the other files go next to the CSV."""
+    if csvFile == None:
+        csvFile = nmmFile.replace(".nmm", ".csv") #let's just keep the same file name for now
+
+    try:
+        nmm = nightmare.loadTable(nmmFile)
+            
+    except (AssertionError, ValueError, IndexError) as e:
+        # NMM is malformed
+        print("Couldn't parse NMM `{}`:\n  {}".format(nmmFile, str(e)))
+        return False
+    
+    if nmm.entryNamesMissing:
+        print("File not found, ignoring: " + nmm.entryNamesPath)
+
+    if entryListMode != None:
+        # Regen entry names to make them suitable as C/EA identifers (on a copy, the loaded table is shared)
+        nmm = copy.copy(nmm)
+        nmm.entryNames = [x for x in genIdentifierEntries(nmm.entryNames)]
+        
+        entryFile = csvFile.replace('.csv', '.def')
+        
+        # Write entry list file
+        with stats.phase('write'), open(entryFile, 'w') as f:
+            if entryListMode == 'enums':
+                f.write('enum {\n')
+                f.writelines(genEntryDefinitions(nmm, getEnumEntryDefinition))
+                f.write('};\n')
+            
+            elif entryListMode == 'defines':
+                f.writelines(genEntryDefinitions(nmm, getDefineEntryDefinition))
+                
+            elif entryListMode == 'assigns':
+                f.writelines(genEntryDefinitions(nmm, getAssignEntryDefinition))
+            
+            print("Wrote to `{}`".format(entryFile))
+    
+    # Write CSV (the time spent making the rows counts as decoding)
+    with stats.phase('write'), open(csvFile, 'w') as f:
+        wr = csv.writer(f, quoting = csv.QUOTE_ALL, lineterminator = '\n')
+        wr.writerows(stats.timed(genTableRows(nmm, romBytes), 'decode'))
+
+        print("Wrote to `{}`".format(csvFile))
+    
+    if snapshot:
+        import tablesnapshot
+        
+        snapshotFile = tablesnapshot.getSnapshotPath(csvFile)
+        
+        with stats.phase('write'):
+            if tablesnapshot.write(snapshotFile, nmm, romBytes, [getRowName(nmm, row) for row in range(nmm.rowNum)], csvFile):
+                print("Wrote to `{}`".format(snapshotFile))
+    
+    stats.count('rows', nmm.rowNum)
+    stats.count('cells', nmm.rowNum * nmm.colNum)
+    stats.count('bytes', nmm.size)
+    
+    return True
+
+def getModuleOutputs(nmmFile, entryListMode, snapshot = False):
+    """Files written when ripping a module"""
+    outputs = [nmmFile.replace(".nmm", ".csv")]
+    
+    if entryListMode != None:
+        outputs.append(nmmFile.replace('.nmm', '.def'))
+    
+    if snapshot:
+        import tablesnapshot
+        outputs.append(tablesnapshot.getSnapshotPath(outputs[0]))
+    
+    return outputs
+
+def getModuleInputs(nmmFile, romBytes, entryListMode):
+    """Returns what the CSV of a module depends on: the tool version and options, the nmm and
+    entry name file contents and the bytes of the table region in the ROM.
+    Raises the same errors as parsing the NMM does."""
+    nmm = nightmare.loadTable(nmmFile)
+    
+    return {
+        'tool': N2C_VERSION,
+        'entryList': entryListMode,
+        'nmm': manifest.fileDigest(nmmFile),
+        'names': manifest.fileDigest(nmm.entryNamesPath) if nmm.entryNamesPath != None else None,
+        'table': manifest.bytesDigest(romBytes[nmm.offset:nmm.offset+nmm.size]),
+    }
+
+workerRom = None
+
+def initWorker(romPath, collectStats = False):
+    """Maps the ROM once per worker process, the OS shares the mapped pages between workers"""
+    global workerRom
+    stats.enable(collectStats)
+    
+    with stats.phase('rom'):
+        workerRom = romview.openRom(romPath).data
+
+def ripModuleJob(nmmFile, entryListMode, snapshot = False):
+    """Rips a module with workerRom, returns whether it succeeded, what it printed and its stats"""
+    import io, contextlib
+    
+    out = io.StringIO()
+    
+    with contextlib.redirect_stdout(out), stats.table(nmmFile):
+        try:
+            ok = ripModule(nmmFile, workerRom, entryListMode, snapshot)
+        
+        except Exception as e:
+            # Keep going with the other modules
+            print("Couldn't rip NMM `{}`:\n  {}: {}".format(nmmFile, type(e).__name__, str(e)))
+            ok = False
+    
+    return ok, out.getvalue(), stats.take()
+
+def findModules(searchFolder):
+    """NMMs under searchFolder (None: the current directory), sorted so output order doesn't depend on the file system.
+    They come from the project index, which only lists the folders that changed (see projectindex)."""
+    import projectindex
+    
+    with stats.phase('scan'):
+        return projectindex.findFiles(searchFolder, '.nmm')
+
+def ripFolder(searchFolder, romPath, entryListMode, jobs = 1, force = False, snapshot = False):
+    """Rips the NMMs under searchFolder (None: the current directory) whose inputs changed since the last run.
+    With snapshot, binary snapshots of the tables are written next to the CSVs.
+    Returns the modules ripped and how many of them failed."""
+    moduleList = findModules(searchFolder)
+    
+    # Only rip the modules whose inputs changed since the last run
+    folder = searchFolder if searchFolder != None else os.getcwd()
+    buildManifest = manifest.BuildManifest(os.path.join(folder, MANIFEST_NAME), N2C_VERSION)
+    
+    with stats.phase('rom'):
+        romBytes = romview.openRom(romPath).data
+    
+    results = {}
+    moduleInputs = {}
+    buildList = []
+    
+    for nmmFile in moduleList:
+        key = os.path.relpath(nmmFile, folder)
+        
+        with stats.table(nmmFile), stats.phase('check'):
+            try:
+                moduleInputs[nmmFile] = getModuleInputs(nmmFile, romBytes, entryListMode)
+            
+            except (AssertionError, ValueError, IndexError):
+                # Malformed, let ripping it report why
+                buildList.append(nmmFile)
+                continue
+            
+            # CSVs edited since they were ripped are kept, only changed inputs cause a rip
+            if force or not buildManifest.isUpToDate(key, moduleInputs[nmmFile], getModuleOutputs(nmmFile, entryListMode, snapshot), allowEdits = True):
+                buildList.append(nmmFile)
+            
+            else:
+                results[nmmFile] = (True, "", {})
+    
+    if jobs > 1 and len(buildList) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        with ProcessPoolExecutor(max_workers = jobs, initializer = initWorker, initargs = (romPath, stats.enabled())) as pool:
+            # map yields results in module order, whichever worker finishes first
+            results.update(zip(buildList, pool.map(ripModuleJob, buildList, [entryListMode] * len(buildList), [snapshot] * len(buildList))))
+    
+    else:
+        initWorker(romPath)
+        
+        for nmmFile in buildList:
+            results[nmmFile] = ripModuleJob(nmmFile, entryListMode, snapshot)
+    
+    failures = 0
+    
+    for nmmFile in moduleList:
+        ok, output, moduleStats = results[nmmFile]
+        sys.stdout.write(output)
+        stats.merge(moduleStats)
+        
+        if not ok:
+            failures += 1
+        
+        elif nmmFile in buildList:
+            buildManifest.record(os.path.relpath(nmmFile, folder), moduleInputs[nmmFile], getModuleOutputs(nmmFile, entryListMode, snapshot))
+    
+    buildManifest.write()
+    nightmare.writeSchemaCache()
+    
+    print("Regenerated {} modules, skipped {} unchanged.".format(len(buildList) - failures, len(moduleList) - len(buildList)))
+    
+    if failures > 0:
+        print("{} of {} modules failed.".format(failures, len(moduleList)))
+    
+    return buildList, failures
+
+batchRoms = {} # ROM path -> mapped ROM, in a batch worker
+
+def initBatchWorker(tables, collectStats = False):
+    """Takes the tables the main process compiled, so workers never parse an NMM"""
+    stats.enable(collectStats)
+    nightmare.preloadTables(tables)
+
+def ripBatchJob(romPath, nmmFile, csvFile, entryListMode, snapshot = False):
+    """Rips a module from one ROM of a batch to csvFile, returns whether it succeeded, what it printed and its stats"""
+    import io, contextlib
+    
+    out = io.StringIO()
+    
+    with contextlib.redirect_stdout(out), stats.table(csvFile):
+        try:
+            if romPath not in batchRoms:
+                with stats.phase('rom'):
+                    batchRoms[romPath] = romview.openRom(romPath).data # mapped once per worker
+            
+            os.makedirs(os.path.dirname(csvFile) or '.', exist_ok = True)
+            ok = ripModule(nmmFile, batchRoms[romPath], entryListMode, snapshot, csvFile)
+        
+        except Exception as e:
+            # Keep going with the other modules and ROMs
+            print("Couldn't rip NMM `{}` from `{}`:\n  {}: {}".format(nmmFile, romPath, type(e).__name__, str(e)))
+            ok = False
+    
+    return ok, out.getvalue(), stats.take()
+
+def getBatchFolders(romPaths, outputFolder):
+    """folder of each ROM of a batch, named after the ROM file; raises ValueError if two ROMs would share one"""
+    folders = {}
+    owners = {}
+    
+    for romPath in romPaths:
+        folder = os.path.join(outputFolder, os.path.splitext(os.path.basename(romPath))[0])
+        
+        if folder in owners:
+            raise ValueError("`{}` and `{}` would both be ripped to `{}`, rename one of them".format(owners[folder], romPath, folder))
+        
+        folders[romPath] = folder
+        owners[folder] = romPath
+    
+    return folders
+
+def writeLongTable(path, romFolders, csvFiles):
+    """Writes the cells of every ripped table as rows of ROM, table, row, entry name, column and value,
+    for comparing values across ROMs. csvFiles maps (ROM, module) to the CSV it was ripped to."""
+    with open(path, 'w') as f:
+        wr = csv.writer(f, quoting = csv.QUOTE_ALL, lineterminator = '\n')
+        wr.writerow(["ROM", "Table", "Row", "Name", "Column", "Value"])
+        
+        for (romPath, nmmFile), csvFile in csvFiles.items():
+            romName = os.path.basename(romFolders[romPath])
+            table = os.path.splitext(os.path.basename(nmmFile))[0]
+            
+            with open(csvFile, 'r') as tableFile:
+                rows = csv.reader(tableFile)
+                header = next(rows)
+                
+                for index, row in enumerate(rows):
+                    wr.writerows([romName, table, index, row[0], column, value] for column, value in zip(header[1:], row[1:]))
+    
+    print("Wrote to `{}`".format(path))
+
+def ripBatch(romPaths, searchFolder, outputFolder, entryListMode, jobs = 1, snapshot = False, longFile = None):
+    """Rips the NMMs under searchFolder from every ROM, each ROM to its own folder under outputFolder
+    (with the same layout as searchFolder). Every NMM is parsed once, here, and the (ROM, module) pairs
+    are shared out to jobs worker processes. With longFile, also writes every cell to one long-format CSV.
+    Returns the CSVs written and how many (ROM, module) pairs failed."""
+    import projectindex
+    
+    romFolders = getBatchFolders(romPaths, outputFolder)
+    
+    # keeps c2ea (and the next batch) from taking the ripped CSVs for tables of the project
+    os.makedirs(outputFolder, exist_ok = True)
+    
+    with open(os.path.join(outputFolder, projectindex.IGNORE_NAME), 'w') as f:
+        f.write("Ripped by n2c from several ROMs, not part of the project.\n")
+    folder = searchFolder if searchFolder != None else os.getcwd()
+    allModules = findModules(searchFolder)
+    moduleList = []
+    failures = 0
+    
+    for nmmFile in allModules:
+        try:
+            nightmare.loadTable(nmmFile)
+            moduleList.append(nmmFile)
+        
+        except (AssertionError, ValueError, IndexError) as e:
+            # Malformed, the same for every ROM: report it once
+            print("Couldn't parse NMM `{}`:\n  {}".format(nmmFile, str(e)))
+            failures += len(romPaths)
+    
+    # ROM by ROM, so that consecutive jobs (and chunks of them) use the same ROM
+    pairs = [(romPath, nmmFile) for romPath in romPaths for nmmFile in moduleList]
+    csvFiles = {(romPath, nmmFile): os.path.join(romFolders[romPath], os.path.relpath(nmmFile, folder)).replace(".nmm", ".csv") for romPath, nmmFile in pairs}
+    arguments = ([romPath for romPath, nmmFile in pairs], [nmmFile for romPath, nmmFile in pairs], [csvFiles[pair] for pair in pairs],
+        [entryListMode] * len(pairs), [snapshot] * len(pairs))
+    
+    if jobs > 1 and len(pairs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        tables = {os.path.abspath(nmmFile): nightmare.loadedTables[os.path.abspath(nmmFile)] for nmmFile in moduleList}
+        
+        with ProcessPoolExecutor(max_workers = jobs, initializer = initBatchWorker, initargs = (tables, stats.enabled())) as pool:
+            results = list(pool.map(ripBatchJob, *arguments, chunksize = max(1, len(pairs) // (4*jobs))))
+    
+    else:
+        results = list(map(ripBatchJob, *arguments))
+    
+    for pair, (ok, output, moduleStats) in zip(pairs, results):
+        sys.stdout.write(output)
+        stats.merge(moduleStats)
+        
+        if not ok:
+            failures += 1
+            del csvFiles[pair]
+    
+    nightmare.writeSchemaCache()
+    
+    print("Ripped {} modules from {} ROMs.".format(len(moduleList), len(romPaths)))
+    
+    if failures > 0:
+        print("{} of {} modules failed.".format(failures, len(romPaths) * len(allModules)))
+    
+    if longFile != None:
+        writeLongTable(longFile, romFolders, csvFiles)
+    
+    return list(csvFiles.values()), failures
+
+def parseRowList(text, view):
+    """Table indices of a comma separated list of rows: indices (0x3A), inclusive ranges (0x10-0x1F) or entry names"""
+    rows = []
+    
+    for item in text.split(','):
+        item = item.strip()
+        
+        if not item: # e.g. a trailing comma
+            continue
+        
+        try:
+            rows.append(view.rowIndex(nightmare.parseNum(item)))
+            continue
+        
+        except ValueError:
+            pass
+        
+        first, dash, last = item.partition('-')
+        
+        try:
+            rows.extend(view.rowIndex(row) for row in range(nightmare.parseNum(first), nightmare.parseNum(last) + 1))
+            continue
+        
+        except (ValueError, IndexError):
+            pass
+        
+        rows.append(view.rowIndex(item)) # an entry name
+    
+    return rows
+
+def exportRows(nmmFile, romPath, rowList, columnList, output):
+    """Writes some rows and columns of a table as CSV to output (None: the standard output), decoding only those cells"""
+    import tableview
+    
+    view = tableview.open(nmmFile, romPath)
+    
+    try:
+        if columnList != None:
+            view = view.select(*[column.strip() for column in columnList.split(',') if column.strip()])
+        
+        rows = parseRowList(rowList, view) if rowList != None else view.rows
+    
+    except (KeyError, IndexError) as e:
+        sys.exit("ERROR: `{}` has no row or column {}".format(nmmFile, e))
+    
+    f = open(output, 'w') if output != None else sys.stdout
+    
+    try:
+        wr = csv.writer(f, quoting = csv.QUOTE_ALL, lineterminator = '\n')
+        wr.writerow([hex(view.nmm.offset)] + [entry.description for entry in view.columns])
+        
+        for index in rows:
+            row = tableview.Row(view, index)
+            wr.writerow([row.name] + row.cells())
+    
+    finally:
+        if output != None:
+            f.close()
+
 def main():
     import argparse
+    global INTERACTIVE
 
     sys.excepthook = showExceptionAndExit
 
     parser = argparse.ArgumentParser(description = 'Convert NMM files to CSV files using a ROM as reference.')
     
     # Input options
-    parser.add_argument('rom', nargs='?', help = 'reference ROM.')
+    parser.add_argument('rom', nargs='*', help = 'reference ROM, or several ROMs (or wildcards) to rip in a batch.')
     parser.add_argument('-f', '--folder', help = 'folder to search for NMMs in.')
+    parser.add_argument('--include', action = 'append', default = [], metavar = 'PATTERN', help = 'only look at NMMs whose path in the folder (or name) matches PATTERN, e.g. "tables/*". Can be given more than once.')
+    parser.add_argument('--exclude', action = 'append', default = [], metavar = 'PATTERN', help = 'never look in folders or at files matching PATTERN, e.g. graphics. Can be given more than once.')
+    parser.add_argument('--rescan', action = 'store_true', help = 'list every folder again instead of trusting the project index (.nmm2csv-index).')
+    
+    # Batch options
+    parser.add_argument('--batch-dir', metavar = 'DIR', help = 'rip each ROM to DIR/[ROM name]/, with the layout of the NMM folder (default with several ROMs: rips).')
+    parser.add_argument('--long', metavar = 'FILE', help = '(batch) also write the cells of every ROM to FILE, one per row of ROM, table, row, name, column and value.')
     
     # Entry List output options
     parser.add_argument('-e', '--enums', action = 'store_true', help = 'translates entry lists to C enums.')
     parser.add_argument('-d', '--defines', action = 'store_true', help = 'translates entry lists to defines.')
     parser.add_argument('-a', '--assigns', action = 'store_true', help = 'translates entry lists to `name = id` expressions.')
+    parser.add_argument('--snapshot', action = 'store_true', help = 'also write a binary snapshot of each table (.tbin), which c2ea reads instead of an unchanged CSV.')
+    
+    # Partial export options
+    parser.add_argument('--table', metavar = 'NMM', help = 'only export the table of this NMM, as CSV to the standard output (or --output), without touching the CSVs.')
+    parser.add_argument('--rows', help = '(with --table) rows to export: comma separated indices, inclusive ranges (0x10-0x1F) or entry names.')
+    parser.add_argument('--columns', help = '(with --table) columns to export: comma separated descriptions.')
+    parser.add_argument('-o', '--output', help = '(with --table) file to write the CSV to.')
+    
+    # Performance options
+    parser.add_argument('-j', '--jobs', type = int, default = 1, help = 'number of modules to rip in parallel (0: one per CPU).')
+    parser.add_argument('--force', action = 'store_true', help = 'rip every module, even those whose table, nmm and entry names did not change.')
+    parser.add_argument('--schema-cache', action = 'store_true', help = 'keep parsed NMMs in a cache file between runs.')
+    parser.add_argument('--watch', action = 'store_true', help = 'keep running and rip the modules whose nmm, entry names or table in the ROM changed (implies --no-pause).')
+    parser.add_argument('--interval', type = float, default = 0.5, help = '(with --watch) seconds between checks for changes (default: 0.5).')
+    
+    # Unattended runs
+    parser.add_argument('--no-pause', action = 'store_true', help = 'never wait for the user: exit without "Press Enter", and fail instead of asking for the ROM.')
+    
+    # Profiling options
+    parser.add_argument('--stats', action = 'store_true', help = 'print the time spent on each module, by phase, and what was ripped.')
+    parser.add_argument('--stats-json', metavar = 'FILE', help = 'also write those stats to FILE as JSON.')
+    parser.add_argument('--profile', metavar = 'FILE', help = 'rip the slowest module again under cProfile and save the profile to FILE.')
     
     args = parser.parse_args()
     
+    INTERACTIVE = not (args.no_pause or args.watch or args.table != None)
+    
+    if args.table == None and (args.rows != None or args.columns != None or args.output != None):
+        sys.exit("ERROR: --rows, --columns or --output given without --table.")
+    
+    roms = []
+    
+    for pattern in args.rom:
+        # expanded here too, Windows shells don't
+        roms.extend(sorted(glob.glob(pattern)) if any(c in pattern for c in '*?[') else [pattern])
+    
+    batch = len(roms) > 1 or args.batch_dir != None or args.long != None
+    
+    if batch:
+        if args.table != None or args.watch or args.profile != None:
+            sys.exit("ERROR: --table, --watch or --profile given with a batch of ROMs.")
+        
+        for romPath in roms:
+            if not os.path.isfile(romPath):
+                sys.exit("ERROR: ROM `{}` doesn't exist.".format(romPath))
+    
+    args.rom = roms[0] if roms else None
+    
+    stats.enable(args.stats or args.stats_json != None or args.profile != None)
+    
+    import projectindex
+    projectindex.INCLUDE = args.include
+    projectindex.EXCLUDE = args.exclude
+    projectindex.RESCAN = args.rescan
+    
+    if args.schema_cache:
+        import pointercache
+        nightmare.useSchemaCache(os.path.join(pointercache.cacheDirectory(), nightmare.SCHEMA_CACHE_FILE))
+    
     if args.rom == None:
+        if not INTERACTIVE:
+            sys.exit("ERROR: no ROM given, pass it as the first argument.")
+        
         import tkinter as tk
         from tkinter import filedialog
 
@@ -132,59 +609,67 @@ def main():
             ]
         )
 
-    # generating module list
-    if args.folder == None:
-        moduleList = glob.glob('**/*.nmm', recursive = True)
+    if args.table != None:
+        exportRows(args.table, args.rom, args.rows, args.columns, args.output)
+        return
     
-    else:
-        moduleList = glob.glob(args.folder + '/**/*.nmm', recursive = True)
+    entryListMode = None
     
-    enableGenerateEntryLists = args.enums or args.defines or args.assigns
+    if args.enums:
+        entryListMode = 'enums'
     
-    # read ROM bytes
-    with open(args.rom, 'rb') as f:
-        romBytes = bytes(f.read())
+    elif args.defines:
+        entryListMode = 'defines'
     
-    for nmmFile in moduleList:
-        csvFile = nmmFile.replace(".nmm", ".csv") #let's just keep the same file name for now
-
+    elif args.assigns:
+        entryListMode = 'assigns'
+    
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    
+    if batch:
+        outputFolder = args.batch_dir if args.batch_dir != None else 'rips'
+        
         try:
-            nmm = nightmare.NightmareTable(nmmFile)
-                
-        except AssertionError as e:
-            # NMM is malformed
-            print("Couldn't parse NMM `{}`:\n  {}".format(nmmFile, str(e)))
-            continue
-
-        if enableGenerateEntryLists:
-            # Regen entry names to make them suitable as C/EA identifers
-            nmm.entryNames = [x for x in genIdentifierEntries(nmm.entryNames)]
-            
-            entryFile = nmmFile.replace('.nmm', '.def')
-            
-            # Write entry list file
-            with open(entryFile, 'w') as f:
-                if args.enums:
-                    f.write('enum {\n')
-                    f.writelines(genEntryDefinitions(nmm, getEnumEntryDefinition))
-                    f.write('};\n')
-                
-                elif args.defines:
-                    f.writelines(genEntryDefinitions(nmm, getDefineEntryDefinition))
-                    
-                elif args.assigns:
-                    f.writelines(genEntryDefinitions(nmm, getAssignEntryDefinition))
-                
-                print("Wrote to `{}`".format(entryFile))
+            getBatchFolders(roms or [args.rom], outputFolder)
         
-        # Write CSV
-        with open(csvFile, 'w') as f:
-            wr = csv.writer(f, quoting = csv.QUOTE_ALL, lineterminator = '\n')
-            wr.writerows(genTableRows(nmm, romBytes))
-
-            print("Wrote to `{}`".format(csvFile))
+        except ValueError as e:
+            sys.exit("ERROR: " + str(e))
+        
+        buildList, failures = ripBatch(roms or [args.rom], args.folder, outputFolder, entryListMode, jobs, args.snapshot, args.long)
+        
+        stats.report(args.stats_json)
+        
+        if INTERACTIVE:
+            input("Press Enter to continue.")
+        
+        sys.exit(1 if failures > 0 else 0)
+    
+    buildList, failures = ripFolder(args.folder, args.rom, entryListMode, jobs, args.force, args.snapshot)
+    
+    if args.watch:
+        import watch
+        
+        def rebuild(changed):
+            # checking every module is cheap, the manifest only rips those whose nmm, names or table bytes changed
+            ripFolder(args.folder, args.rom, entryListMode, jobs, snapshot = args.snapshot)
+        
+        watcher = watch.FolderWatcher(args.folder if args.folder != None else '.', ('.nmm',), [args.rom], entryNames = True)
+        watch.watch(watcher, rebuild, args.interval)
+    
+    stats.report(args.stats_json)
+    
+    if args.profile != None and buildList:
+        slowest = stats.slowest(buildList)
+        print("Profiling `{}`:".format(slowest))
+        stats.profile(lambda: ripModuleJob(slowest, entryListMode, args.snapshot), args.profile)
 
-    input("Press Enter to continue.")
+    if INTERACTIVE:
+        input("Press Enter to continue.")
+    
+    sys.exit(1 if failures > 0 else 0)
 
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support() # needed by frozen (PyInstaller) executables
+    
     main()
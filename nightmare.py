@@ -17,9 +17,10 @@
 # Line 3: Length in bytes
 # Line 4: Type of data (Only care about H or DU/DS imo)
 # Line 5: Text file for descriptions, ignore it for now.
-import os
+import os, stats
 
 class NightmareTable:
+  """Compiled NMM schema. Use loadTable to share one parse of each NMM per run."""
 
   def __init__(self, path):
     rawFile = open(path, 'r')
@@ -36,16 +37,19 @@ class NightmareTable:
     self.columns = self.getColumns(stripped)
     self.colNum = len(self.columns)
     self.entryNames = []
+    self.entryNamesPath = None
+    self.entryNamesMissing = False # n2c reports missing entry name files
     directory = os.path.dirname(path)
 
     if str(stripped[5]) != "NULL":
       path = os.path.join(directory, str(stripped[5]))
+      self.entryNamesPath = path
       try:
-        with open(path,'r') as textfile:
+        with stats.phase('names'), open(path,'r') as textfile:
           self.entryNames = self.getEntryNames(textfile.readlines())
       except FileNotFoundError:
         self.entryNames = []
-        print("File not found, ignoring: "+path)
+        self.entryNamesMissing = True
 
   def getEntryNames(self,lines):
     """receives an array of lines from a txt file and returns an array of entry names"""
@@ -98,33 +102,61 @@ class NightmareTable:
     for fillerEntry in fillerEntries:
       columns.append(NightmareEntry(fillerEntry))
     columns.sort(key=lambda col: col.offset) #sort columns by offset
-    return columns
+    return tuple(columns)
 
 class NightmareEntry:
-  description = ''
-  offset = 0
-  length = 0
-  base = 10
-  signed = False
-  txtfile = None
+  """Immutable column descriptor with its EA width and codec worked out up front."""
+  __slots__ = ('description', 'offset', 'length', 'dataType', 'base', 'signed', 'txtfile',
+               'eaWidth', 'minValue', 'maxValue')
 
   def __init__(self,list):
     assert len(list)==5, "Error: Wrong number of lines in entry"
-    self.description = list[0]
-    self.offset = parseNum(list[1])
-    self.length = parseNum(list[2])
-    self.checkDataType(list[3])
-    if list[4] != "NULL":
-      self.txtfile = list[4]
+    init = super().__setattr__
+    init('description', list[0])
+    init('offset', parseNum(list[1]))
+    init('length', parseNum(list[2]))
+    init('dataType', list[3])
+    init('txtfile', list[4] if list[4] != "NULL" else None)
+    base, signed = self.checkDataType(list[3])
+    init('base', base)
+    init('signed', signed)
+    # EA code used to write this column: WORD and SHORT only when aligned
+    if (self.length==4) & (self.offset%4==0):
+      init('eaWidth', "WORD")
+    elif (self.length==2) & (self.offset%2==0):
+      init('eaWidth', "SHORT")
+    else:
+      init('eaWidth', "BYTE")
+    bits = 8*self.length
+    init('minValue', -(1 << (bits-1)) if signed and bits else 0)
+    init('maxValue', (1 << (bits-1)) - 1 if signed and bits else (1 << bits) - 1)
+
+  def __setattr__(self, name, value):
+    raise AttributeError("NightmareEntry is immutable")
+
+  def __reduce__(self):
+    return (NightmareEntry, ([self.description, self.offset, self.length, self.dataType, self.txtfile or "NULL"],))
 
   def checkDataType(self,str):
-    """sets base and signed/unsigned."""
+    """returns base and signed/unsigned."""
     accepted_vals = ["HEXA","NEHU","NEDS","NEDU","NDHU","NDDU"]
     assert str in accepted_vals, "Error: Data Type not accepted: " + str
+    base = 10
     if (str == 'HEXA') | (str[2] == 'H'):
-      self.base = 16
-    if str[3] == 'S':
-      self.signed = True
+      base = 16
+    return base, str[3] == 'S'
+
+  def decode(self, data):
+    """int stored in the bytes of a cell"""
+    return int.from_bytes(data, 'little', signed = self.signed)
+
+  def encode(self, value):
+    """bytes of a cell holding value, raises OverflowError if it doesn't fit"""
+    return value.to_bytes(self.length, 'little', signed = self.signed)
+
+  def format(self, value):
+    """cell value as written to CSV"""
+    return hex(value) if self.base == 16 else value
 
 def parseNum(num):
   """0x is hex, 0b is binary, 0 is octal. Otherwise assume decimal."""
@@ -143,3 +175,111 @@ def chunkify(list,size):
   """splits a list into a list of smaller lists"""
   for i in range (0, len(list), size):
     yield list[i:i+size]
+
+SCHEMA_CACHE_FILE = 'schemas.cache'
+
+loadedTables = {} # abspath -> (stamp, NightmareTable)
+schemaCache = None # optional on-disk copy of loadedTables, see useSchemaCache
+
+def getStamp(path):
+  """(size, mtime) of a file, None if it doesn't exist"""
+  try:
+    stat = os.stat(path)
+  except FileNotFoundError:
+    return None
+  return (stat.st_size, stat.st_mtime_ns)
+
+def getDigest(path):
+  import hashlib
+  try:
+    with open(path, 'rb') as f:
+      return hashlib.sha1(f.read()).hexdigest()
+  except FileNotFoundError:
+    return None
+
+def getTableFiles(table):
+  """files a table was compiled from"""
+  if table.entryNamesPath is None:
+    return (table.path,)
+  return (table.path, table.entryNamesPath)
+
+def loadTable(path):
+  """Returns the NightmareTable of an nmm, parsing it only if it (or its entry name file) changed
+  since it was last loaded. The table is shared: copy it before changing it."""
+  key = os.path.abspath(path)
+  with stats.phase('parse'):
+    if key in loadedTables:
+      stamp, table = loadedTables[key]
+      if stamp == tuple(map(getStamp, getTableFiles(table))):
+        return table
+    if schemaCache is not None:
+      table = schemaCache.get(key)
+      if table is not None:
+        loadedTables[key] = (tuple(map(getStamp, getTableFiles(table))), table)
+        return table
+    table = NightmareTable(key)
+    stamp = tuple(map(getStamp, getTableFiles(table)))
+    loadedTables[key] = (stamp, table)
+    if schemaCache is not None:
+      schemaCache.put(key, table)
+    return table
+
+def preloadTables(tables):
+  """adds tables loaded by another process (items of its loadedTables), so loadTable doesn't parse them again"""
+  loadedTables.update(tables)
+
+class SchemaCache:
+  """Compiled tables pickled to disk, checked against the size and mtime of their files
+  and, when those changed, against the contents."""
+  FORMAT_VERSION = 1
+
+  def __init__(self, path):
+    self.path = path
+    self.entries = {} # abspath -> (stamps, digests, table)
+    self.dirty = False
+    try:
+      import pickle
+      with open(path, 'rb') as f:
+        version, entries = pickle.load(f)
+      if version == self.FORMAT_VERSION:
+        self.entries = entries
+    except Exception: # missing, corrupt or from an older version: start over
+      pass
+
+  def get(self, key):
+    if key not in self.entries:
+      return None
+    stamps, digests, table = self.entries[key]
+    files = getTableFiles(table)
+    newStamps = tuple(map(getStamp, files))
+    if newStamps != stamps:
+      if tuple(map(getDigest, files)) != digests:
+        return None
+      self.entries[key] = (newStamps, digests, table) # only touched
+      self.dirty = True
+    return table
+
+  def put(self, key, table):
+    files = getTableFiles(table)
+    self.entries[key] = (tuple(map(getStamp, files)), tuple(map(getDigest, files)), table)
+    self.dirty = True
+
+  def write(self):
+    if not self.dirty:
+      return
+    import pickle
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+    temp = self.path + '.tmp'
+    with open(temp, 'wb') as f:
+      pickle.dump((self.FORMAT_VERSION, self.entries), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, self.path)
+    self.dirty = False
+
+def useSchemaCache(path):
+  """makes loadTable keep compiled tables in the file at path across runs"""
+  global schemaCache
+  schemaCache = SchemaCache(path)
+
+def writeSchemaCache():
+  if schemaCache is not None:
+    schemaCache.write()
@@ -0,0 +1,83 @@
+"""Differences between two ROMs, as runs of changed bytes or as IPS/UPS patches."""
+
+import re, struct, zlib
+
+BLOCK = 64 # bytes compared at once before looking for the exact changed bytes
+
+def diffRuns(old, new, start = 0, end = None):
+  """Returns (offset, bytes) runs of new that differ from old between start and end.
+  Bytes past the end of old count as changed."""
+  if end is None:
+    end = len(new)
+  runs = []
+  runStart = None
+  for block in range(start, end, BLOCK):
+    blockEnd = min(block + BLOCK, end)
+    if runStart is None and old[block:blockEnd] == new[block:blockEnd]:
+      continue
+    for i in range(block, blockEnd):
+      changed = i >= len(old) or old[i] != new[i]
+      if changed and runStart is None:
+        runStart = i
+      elif not changed and runStart is not None:
+        runs.append((runStart, bytes(new[runStart:i])))
+        runStart = None
+  if runStart is not None:
+    runs.append((runStart, bytes(new[runStart:end])))
+  return runs
+
+IPS_MAX_OFFSET = 0xFFFFFF
+IPS_MAX_SIZE = 0xFFFF
+IPS_EOF = 0x454F46 # reads as "EOF", can't start a record
+
+def makeIps(new, runs):
+  """IPS patch writing the (offset, bytes) runs of new, raises ValueError if they go past 16 MB"""
+  out = [b'PATCH']
+  for offset, data in mergeRuns(runs):
+    if offset == IPS_EOF: # start a byte earlier, writing it as it is
+      offset, data = offset - 1, bytes(new[offset-1:offset]) + data
+    for i in range(0, len(data), IPS_MAX_SIZE):
+      chunk = data[i:i+IPS_MAX_SIZE]
+      if offset + i + len(chunk) - 1 > IPS_MAX_OFFSET:
+        raise ValueError("IPS patches can't change bytes past 16 MB (at 0x{:X}), use UPS".format(offset + i))
+      out.append(struct.pack('>I', offset + i)[1:] + struct.pack('>H', len(chunk)) + chunk)
+  out.append(b'EOF')
+  return b''.join(out)
+
+def upsNumber(value):
+  out = bytearray()
+  while True:
+    bits = value & 0x7F
+    value >>= 7
+    if value == 0:
+      out.append(0x80 | bits)
+      return bytes(out)
+    out.append(bits)
+    value -= 1
+
+def makeUps(old, new, runs):
+  """UPS patch turning old into new, which only differ in the (offset, bytes) runs"""
+  out = [b'UPS1', upsNumber(len(old)), upsNumber(len(new))]
+  position = 0
+  for offset, data in mergeRuns(runs):
+    before = bytes(old[offset:offset+len(data)]).ljust(len(data), b'\0')
+    xor = bytes(a ^ b for a, b in zip(before, data))
+    # a hunk ends at its first 0 (unchanged byte), so runs are split there
+    for match in re.finditer(rb'[^\0]+', xor):
+      start = offset + match.start()
+      out.append(upsNumber(start - position))
+      out.append(match.group())
+      out.append(b'\0')
+      position = start + len(match.group()) + 1
+  patch = b''.join(out) + struct.pack('<II', zlib.crc32(old), zlib.crc32(new))
+  return patch + struct.pack('<I', zlib.crc32(patch))
+
+def mergeRuns(runs):
+  """sorts runs, joining the ones that touch"""
+  merged = []
+  for offset, data in sorted(runs):
+    if merged and offset == merged[-1][0] + len(merged[-1][1]):
+      merged[-1] = (merged[-1][0], merged[-1][1] + data)
+    else:
+      merged.append((offset, data))
+  return merged
@@ -0,0 +1,162 @@
+import array, hashlib, os, struct, sys, time
+import romview
+
+# On-disk layout (all little-endian):
+#   header: magic, format version, number of file records, number of ROM records
+#   file record: size, mtime (ns), content digest, path length, then the utf-8 path
+#   ROM record: content digest, last use (ns), number of targets
+#     then per target: value, number of offsets, then the offsets as 32 bit words
+MAGIC = b'NMPC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHII')
+FILE_RECORD = struct.Struct('<QQ20sH')
+ROM_RECORD = struct.Struct('<20sQI')
+TARGET_RECORD = struct.Struct('<II')
+
+MAX_ROMS = 8 # ROMs kept in the cache, least recently used ones are dropped first
+MAX_TARGETS = 4096 # targets kept per ROM
+MAX_FILES = 64 # remembered path -> digest records
+
+def cacheDirectory():
+  """returns the per-user cache directory of the tools, NMM2CSV_CACHE overrides it"""
+  if os.environ.get('NMM2CSV_CACHE'):
+    return os.environ['NMM2CSV_CACHE']
+  if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+    return os.path.join(os.environ['LOCALAPPDATA'], 'NMM2CSV')
+  base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(base, 'nmm2csv')
+
+def contentDigest(path):
+  """sha1 of a file's contents"""
+  return hashlib.sha1(romview.openRom(path).data).digest()
+
+def toWords(values):
+  words = array.array(romview.WORD_TYPE, values)
+  if sys.byteorder != 'little':
+    words.byteswap()
+  return words.tobytes()
+
+def fromWords(data):
+  words = array.array(romview.WORD_TYPE)
+  words.frombytes(data)
+  if sys.byteorder != 'little':
+    words.byteswap()
+  return tuple(words)
+
+class PointerCache:
+  """Pointer search results keyed by ROM content.
+  ROMs are identified by the sha1 of their contents; the digest of a path is
+  only recomputed when its size or mtime changes."""
+
+  def __init__(self, path):
+    self.path = path # None keeps the cache in memory only
+    self.files = {} # abspath -> (size, mtime_ns, digest)
+    self.roms = {} # digest -> {value: offsets}
+    self.lastUse = {} # digest -> ns
+    self.hits = 0
+    self.misses = 0
+    self.dirty = False
+    if path is not None and os.path.exists(path):
+      try:
+        with open(path, 'rb') as f:
+          self.read(f.read())
+      except (ValueError, struct.error, UnicodeDecodeError):
+        # corrupt or outdated cache, start over
+        self.files, self.roms, self.lastUse = {}, {}, {}
+
+  def read(self, data):
+    magic, version, fileCount, romCount = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+      raise ValueError("not a pointer cache")
+    pos = HEADER.size
+    for i in range(fileCount):
+      size, mtime, digest, length = FILE_RECORD.unpack_from(data, pos)
+      pos += FILE_RECORD.size
+      self.files[data[pos:pos+length].decode('utf-8')] = (size, mtime, digest)
+      pos += length
+    for i in range(romCount):
+      digest, lastUse, targetCount = ROM_RECORD.unpack_from(data, pos)
+      pos += ROM_RECORD.size
+      targets = {}
+      for j in range(targetCount):
+        value, offsetCount = TARGET_RECORD.unpack_from(data, pos)
+        pos += TARGET_RECORD.size
+        targets[value] = fromWords(data[pos:pos+4*offsetCount])
+        pos += 4*offsetCount
+      self.roms[digest] = targets
+      self.lastUse[digest] = lastUse
+
+  def write(self):
+    """saves the cache if it changed since it was loaded"""
+    if self.path is None or not self.dirty:
+      return
+    self.evict()
+    out = [HEADER.pack(MAGIC, FORMAT_VERSION, len(self.files), len(self.roms))]
+    for name, (size, mtime, digest) in self.files.items():
+      encoded = name.encode('utf-8')
+      out.append(FILE_RECORD.pack(size, mtime, digest, len(encoded)))
+      out.append(encoded)
+    for digest, targets in self.roms.items():
+      out.append(ROM_RECORD.pack(digest, self.lastUse[digest], len(targets)))
+      for value, offsets in targets.items():
+        out.append(TARGET_RECORD.pack(value, len(offsets)))
+        out.append(toWords(offsets))
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+    temp = self.path + '.tmp'
+    with open(temp, 'wb') as f:
+      f.write(b''.join(out))
+    os.replace(temp, self.path) # never leave a half-written cache behind
+    self.dirty = False
+
+  def evict(self):
+    """drops the least recently used ROMs and forgets paths of ROMs that aren't cached"""
+    byAge = sorted(self.roms, key = lambda digest: self.lastUse[digest], reverse = True)
+    for digest in byAge[MAX_ROMS:]:
+      del self.roms[digest]
+      del self.lastUse[digest]
+    for name in [name for name, record in self.files.items() if record[2] not in self.roms]:
+      del self.files[name]
+    for name in list(self.files)[:-MAX_FILES]:
+      del self.files[name]
+
+  def digest(self, romFileName):
+    """returns the content digest of a ROM, reusing the last one if size and mtime didn't change"""
+    name = os.path.abspath(romFileName)
+    stat = os.stat(name)
+    record = self.files.get(name)
+    if record is None or record[:2] != (stat.st_size, stat.st_mtime_ns):
+      record = (stat.st_size, stat.st_mtime_ns, contentDigest(name))
+      self.files.pop(name, None)
+      self.files[name] = record # most recent last
+      self.dirty = True
+    return record[2]
+
+  def lookup(self, digest, value):
+    """returns the cached offsets of value in the ROM, or None"""
+    targets = self.roms.get(digest)
+    if targets is not None and value in targets:
+      self.hits += 1
+      self.touch(digest)
+      return targets[value]
+    self.misses += 1
+    return None
+
+  def store(self, digest, value, offsets):
+    targets = self.roms.setdefault(digest, {})
+    if len(targets) >= MAX_TARGETS:
+      del targets[next(iter(targets))] # oldest first
+    targets[value] = tuple(offsets)
+    self.touch(digest)
+    self.dirty = True
+
+  def touch(self, digest):
+    """marks a ROM as used; only saved along with new entries, so runs that only hit don't rewrite the cache"""
+    self.lastUse[digest] = time.time_ns()
+
+  def clear(self):
+    self.files, self.roms, self.lastUse = {}, {}, {}
+    self.dirty = True
+
+  def stats(self):
+    """hit/miss counts of the lookups made so far"""
+    return {'hits': self.hits, 'misses': self.misses, 'roms': len(self.roms)}
@@ -0,0 +1,117 @@
+"""Index of every word of a ROM that could be a pointer into the ROM, sorted by target.
+
+Built in one pass over the ROM and saved under the ROM's content digest, so
+later runs answer "which words point to X" and "which words point into
+[start, end)" (e.g. to the rows of a table) with a binary search, without
+scanning the ROM again.
+"""
+
+import array, bisect, os, struct
+import romview
+from pointercache import toWords
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# On-disk layout (all little-endian):
+#   header: magic, format version, number of pointers
+#   then the targets, sorted, as 32 bit words, and the offsets of the words holding them, in the same order
+MAGIC = b'NMPM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHxxII') # the last word is padding, so the arrays start at a multiple of 16
+
+ROM_START = 0x08000000
+ROM_END = 0x0A000000 # pointers go up to 0x09FFFFFF, the 32 MB a ROM can map
+
+MAP_DIRECTORY = 'pointermaps'
+MAX_MAPS = 8 # maps kept on disk, least recently used ones are deleted first
+
+def toPointer(offset):
+  """pointer value of a ROM offset (offsets already given as pointers are kept)"""
+  return offset | ROM_START if offset < ROM_START else offset
+
+def buildArrays(words):
+  """(targets, offsets) of every word of a ROM in the pointer range, sorted by target then offset"""
+  if numpy is not None:
+    view = numpy.frombuffer(words, dtype = numpy.uint32)
+    index = numpy.flatnonzero((view >= ROM_START) & (view < ROM_END))
+    targets = view[index]
+    order = numpy.argsort(targets, kind = 'stable') # keeps offsets ascending within a target
+    return targets[order], (index[order] << 2).astype(numpy.uint32)
+  pairs = sorted((x, i << 2) for i, x in enumerate(words) if ROM_START <= x < ROM_END)
+  return array.array(romview.WORD_TYPE, [x for x, i in pairs]), array.array(romview.WORD_TYPE, [i for x, i in pairs])
+
+class PointerMap:
+  """Sorted (target, offset) pairs of the pointers of one ROM"""
+
+  def __init__(self, targets, offsets, view = None):
+    self.targets = targets
+    self.offsets = offsets
+    self.view = view # RomView the arrays were mapped from, if loaded from disk
+    if numpy is not None:
+      self.targets = numpy.frombuffer(targets, dtype = numpy.uint32)
+      self.offsets = numpy.frombuffer(offsets, dtype = numpy.uint32)
+
+  def __len__(self):
+    return len(self.targets)
+
+  def bounds(self, low, high):
+    """indices of the first target >= low and of the first one >= high"""
+    if numpy is not None:
+      return tuple(numpy.searchsorted(self.targets, [low, high]).tolist())
+    return bisect.bisect_left(self.targets, low), bisect.bisect_left(self.targets, high)
+
+  def offsetsOf(self, value):
+    """offsets of the words equal to a pointer value, ascending"""
+    start, end = self.bounds(value, value + 1)
+    return tuple(self.offsets[start:end].tolist())
+
+  def references(self, start, end):
+    """(offset, target) of every pointer into the ROM offsets [start, end), sorted by target"""
+    first, last = self.bounds(toPointer(start), toPointer(end))
+    return list(zip(self.offsets[first:last].tolist(), self.targets[first:last].tolist()))
+
+  def write(self, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+      f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self.targets), 0))
+      f.write(toWords(self.targets.tolist()))
+      f.write(toWords(self.offsets.tolist()))
+    os.replace(temp, path)
+
+def build(romFileName):
+  """builds the pointer map of a ROM"""
+  return PointerMap(*buildArrays(romview.openRom(romFileName).words()))
+
+def load(path):
+  """maps a saved pointer map, None if it's missing, corrupt or from another version"""
+  try:
+    view = romview.RomView(path)
+    magic, version, count, padding = HEADER.unpack_from(view.data, 0)
+  except (OSError, struct.error):
+    return None
+  words = view.words()
+  first = HEADER.size >> 2
+  if magic != MAGIC or version != FORMAT_VERSION or len(words) != first + 2*count:
+    view.close()
+    return None
+  return PointerMap(words[first:first+count], words[first+count:first+2*count], view)
+
+def getMapPath(directory, digest):
+  return os.path.join(directory, MAP_DIRECTORY, digest.hex() + '.map')
+
+def evict(directory):
+  """deletes the least recently used maps past MAX_MAPS"""
+  folder = os.path.join(directory, MAP_DIRECTORY)
+  try:
+    paths = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.map')]
+  except OSError:
+    return
+  for path in sorted(paths, key = os.path.getmtime, reverse = True)[MAX_MAPS:]:
+    try:
+      os.remove(path)
+    except OSError:
+      pass # still mapped by another process
@@ -0,0 +1,198 @@
+"""Index of the NMMs and CSVs of a project folder, so n2c and c2ea don't walk the whole tree on every run.
+
+The index (.nmm2csv-index in the folder) remembers every directory with its
+mtime, and the NMMs and CSVs in it with their size and mtime. Refreshing it
+stats the directories, and only lists again those whose mtime changed (a file
+was added, removed or renamed in them). Folders matching an exclude pattern,
+e.g. graphics or build output, are never entered, nor are folders holding a
+.nmm2csv-ignore file. Symbolic links to folders aren't followed.
+"""
+
+import fnmatch, json, os, time
+
+INDEX_NAME = '.nmm2csv-index'
+IGNORE_NAME = '.nmm2csv-ignore' # folders holding this file are skipped, like n2c batch output
+FORMAT_VERSION = 1
+EXTENSIONS = ('.nmm', '.csv')
+DEFAULT_EXCLUDE = ('.*',) # hidden files and folders, which glob's ** skips too
+
+# directories whose mtime is this close to a scan are listed again by the next one,
+# since something may still change in them within the same mtime (FAT has 2 second mtimes)
+RACY_NS = 2 * 10**9
+
+# patterns and full rescans asked for on the command line, see findFiles
+INCLUDE = ()
+EXCLUDE = ()
+RESCAN = False
+
+def matches(path, patterns):
+  """whether a relative path (with / separators) or its name matches one of the fnmatch patterns"""
+  name = path.rpartition('/')[2]
+  return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def getStamp(path):
+  """[size, mtime] of a file, None if it doesn't exist"""
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return [stat.st_size, stat.st_mtime_ns]
+
+def getEntryNamesFile(nmmPath):
+  """entry name file an NMM names (line 6), relative to its folder; None if it has none or can't be read"""
+  try:
+    with open(nmmPath, 'r') as f:
+      lines = [line.rstrip() for line in f if line.rstrip() and line[0] != '#'] # as NightmareTable.stripText
+  except (OSError, UnicodeDecodeError):
+    return None
+  return lines[5] if len(lines) > 5 and lines[5] != "NULL" else None
+
+class ProjectIndex:
+  """NMMs and CSVs under a folder, with include and exclude fnmatch patterns
+  (matched against paths relative to the folder, with / separators, and against names).
+  Excluded folders are pruned; with include patterns, only the files matching one are indexed."""
+
+  def __init__(self, folder, include = (), exclude = ()):
+    self.folder = folder
+    self.path = os.path.join(folder, INDEX_NAME)
+    self.include = sorted(include)
+    self.exclude = sorted(DEFAULT_EXCLUDE + tuple(exclude))
+    self.directories = {} # relative path ('' for the folder) -> {'mtime', 'dirs', 'files': {name: stamp}}
+    self.entryNames = {} # relative NMM path -> [NMM stamp, relative entry name file path or None]
+    self.listed = 0 # directories listed by the last refresh
+    self.dirty = False # whether the index needs writing (writing it changes the mtime of the folder)
+    try:
+      with open(self.path, 'r') as f:
+        data = json.load(f)
+      # other patterns give other files: start over
+      if data.get('version') == FORMAT_VERSION and data['include'] == self.include and data['exclude'] == self.exclude:
+        self.directories = data['directories']
+        self.entryNames = data['entryNames']
+    except (FileNotFoundError, ValueError, KeyError, AttributeError):
+      pass
+
+  def listDirectory(self, relative):
+    """{'dirs', 'files'} of a directory, without what the patterns leave out"""
+    entry = {'mtime': None, 'dirs': [], 'files': {}}
+    with os.scandir(os.path.join(self.folder, relative)) as it:
+      items = list(it)
+    if any(item.name == IGNORE_NAME for item in items):
+      return entry
+    for item in items:
+      path = relative + '/' + item.name if relative else item.name
+      if matches(path, self.exclude):
+        continue
+      if item.is_dir(follow_symlinks = False):
+        entry['dirs'].append(item.name)
+      elif os.path.normcase(item.name).endswith(EXTENSIONS) and (not self.include or matches(path, self.include)):
+        entry['files'][item.name] = None # stamped by refresh
+    entry['dirs'].sort()
+    return entry
+
+  def refresh(self, rescan = False):
+    """brings the index up to date, listing only the directories that changed (all of them with rescan)"""
+    start = time.time_ns()
+    old = {} if rescan else self.directories
+    self.directories = {}
+    self.listed = 0
+    pending = ['']
+    while pending:
+      relative = pending.pop()
+      try:
+        mtime = os.stat(os.path.join(self.folder, relative)).st_mtime_ns
+      except OSError:
+        continue # removed since its parent was listed
+      entry = old.get(relative)
+      if entry is None or entry['mtime'] != mtime:
+        try:
+          listing = self.listDirectory(relative)
+        except OSError:
+          continue
+        self.listed += 1
+        if entry is None or listing['dirs'] != entry['dirs'] or listing['files'].keys() != entry['files'].keys():
+          self.dirty = True
+        else:
+          # only the mtime changed (e.g. by writing this index), not worth writing it again
+          listing['files'] = entry['files']
+        entry = listing
+      entry['mtime'] = mtime if mtime < start - RACY_NS else None
+      self.directories[relative] = entry
+      pending.extend(relative + '/' + name if relative else name for name in entry['dirs'])
+
+    if set(old) != set(self.directories):
+      self.dirty = True
+
+    # files edited in place don't change the mtime of their directory
+    entryNames = {}
+    for relative, entry in self.directories.items():
+      for name in entry['files']:
+        path = relative + '/' + name if relative else name
+        stamp = getStamp(os.path.join(self.folder, path))
+        if entry['files'][name] != stamp:
+          entry['files'][name] = stamp
+          self.dirty = True
+        if path.endswith('.nmm'):
+          known = self.entryNames.get(path)
+          if known is None or known[0] != stamp:
+            names = getEntryNamesFile(os.path.join(self.folder, path))
+            known = [stamp, relative + '/' + names if relative and names != None else names]
+            self.dirty = True
+          entryNames[path] = known
+    self.entryNames = entryNames
+    return self
+
+  def write(self):
+    if not self.dirty:
+      return
+    data = {'version': FORMAT_VERSION, 'include': self.include, 'exclude': self.exclude,
+      'directories': self.directories, 'entryNames': self.entryNames}
+    temp = self.path + '.tmp'
+    try:
+      with open(temp, 'w') as f:
+        json.dump(data, f, sort_keys = True)
+      os.replace(temp, self.path)
+      self.dirty = False
+    except OSError:
+      pass # read-only folder: the next run lists everything again
+
+  def files(self, extension):
+    """relative paths (with / separators) of the indexed files with extension, sorted"""
+    return sorted((relative + '/' + name if relative else name)
+      for relative, entry in self.directories.items() for name in entry['files'] if os.path.normcase(name).endswith(extension))
+
+  def pairs(self):
+    """(NMM, CSV) relative paths of every table, either one None if that file is missing, sorted"""
+    nmms = set(path[:-4] for path in self.files('.nmm'))
+    csvs = set(path[:-4] for path in self.files('.csv'))
+    return [(base + '.nmm' if base in nmms else None, base + '.csv' if base in csvs else None) for base in sorted(nmms | csvs)]
+
+  def stamp(self, path):
+    """[size, mtime] of an indexed file when the index was last refreshed"""
+    relative, slash, name = path.rpartition('/')
+    return self.directories[relative]['files'][name]
+
+  def getEntryNames(self, nmmPath):
+    """relative path of the entry name file of an indexed NMM, None if it has none"""
+    return self.entryNames[nmmPath][1]
+
+def loadIndex(folder):
+  """the project index of folder (None: the current directory), refreshed with INCLUDE, EXCLUDE and RESCAN"""
+  index = ProjectIndex(folder if folder != None else '.', INCLUDE, EXCLUDE).refresh(RESCAN)
+  index.write()
+  return index
+
+def toPath(folder, path):
+  """path of a file of the index of folder, joined like glob joins it"""
+  if path == None:
+    return None
+  path = path.replace('/', os.sep)
+  return path if folder == None else os.path.join(folder, path)
+
+def findFiles(folder, extension):
+  """The files with extension under folder (None: the current directory), sorted, like
+  glob(folder + '/**/*' + extension, recursive = True) but read from the refreshed project index."""
+  return [toPath(folder, path) for path in loadIndex(folder).files(extension)]
+
+def findTables(folder):
+  """(NMM, CSV) paths of the tables under folder, like findFiles; either is None where that file is missing"""
+  return [(toPath(folder, nmmPath), toPath(folder, csvPath)) for nmmPath, csvPath in loadIndex(folder).pairs()]
@@ -0,0 +1,157 @@
+"""Compares two ROMs table by table, using the NMMs of a folder as templates.
+
+The region of each table is compared as a whole first, then row by row, and only
+the rows that differ are decoded. Changed cells are reported by entry name and
+column description, as text or JSON.
+"""
+
+import nightmare, projectindex, romview, tabledecode, stats, sys, os, json
+
+from n2c import getRowName
+
+def getChangedRows(nmm, old, new):
+    """indices of the rows of a table whose bytes differ between the ROMs"""
+    start, end = nmm.offset, nmm.offset + nmm.size
+
+    if old[start:end] == new[start:end]:
+        return []
+
+    rows = tabledecode.changedRows(nmm, old, new)
+
+    if rows == None:
+        # no numpy, or the table runs past the end of a ROM
+        rows = []
+
+        for row in range(nmm.rowNum):
+            rowStart = start + row*nmm.rowLength
+
+            if old[rowStart:rowStart+nmm.rowLength] != new[rowStart:rowStart+nmm.rowLength]:
+                rows.append(row)
+
+    return rows
+
+def getCell(entry, rom, rowOffset):
+    """cell of a column as n2c writes it, None if the ROM ends before it"""
+    data = rom[rowOffset+entry.offset:rowOffset+entry.offset+entry.length]
+
+    if len(data) < entry.length:
+        return None
+
+    return entry.format(entry.decode(data))
+
+def diffTable(nmm, old, new):
+    """Returns a {'row', 'name', 'cells'} dict for each changed row, cells being {'column', 'old', 'new'} dicts"""
+    rows = []
+
+    for row in getChangedRows(nmm, old, new):
+        rowOffset = nmm.offset + row*nmm.rowLength
+        cells = []
+
+        for entry in nmm.columns:
+            before, after = getCell(entry, old, rowOffset), getCell(entry, new, rowOffset)
+
+            if before != after:
+                cells.append({'column': entry.description, 'old': before, 'new': after})
+
+        if cells: # else only bytes no column covers changed
+            rows.append({'row': row, 'name': getRowName(nmm, row), 'cells': cells})
+
+    return rows
+
+def diffFolder(folder, oldPath, newPath):
+    """Compares every table of the NMMs under folder.
+    Returns a {'nmm', 'table', 'offset', 'rows'} dict for each table that changed, and the number of NMMs that couldn't be parsed."""
+    old = romview.openRom(oldPath).data
+    new = romview.openRom(newPath).data
+
+    tables = []
+    failures = 0
+
+    with stats.phase('scan'):
+        nmmFiles = projectindex.findFiles(folder, '.nmm')
+
+    for nmmFile in nmmFiles:
+        with stats.table(nmmFile):
+            try:
+                nmm = nightmare.loadTable(nmmFile)
+
+            except Exception as e:
+                print("ERROR: couldn't parse `{}`: {}".format(nmmFile, e), file = sys.stderr)
+                failures += 1
+                continue
+
+            with stats.phase('decode'):
+                rows = diffTable(nmm, old, new)
+
+            stats.count('rows', nmm.rowNum)
+            stats.count('bytes', nmm.size)
+
+        if rows:
+            tables.append({'nmm': os.path.relpath(nmmFile, folder), 'table': nmm.description, 'offset': hex(nmm.offset), 'rows': rows})
+
+    return tables, failures
+
+def formatText(tables):
+    """diff as lines of text, one per changed cell"""
+    lines = []
+
+    for table in tables:
+        lines.append("{} ({}, {}): {} row(s) changed".format(table['nmm'], table['table'], table['offset'], len(table['rows'])))
+
+        for row in table['rows']:
+            for cell in row['cells']:
+                lines.append("  {} [{}] {}: {} -> {}".format(
+                    row['name'], hex(row['row']), cell['column'],
+                    cell['old'] if cell['old'] != None else '-', cell['new'] if cell['new'] != None else '-'))
+
+    return '\n'.join(lines)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Compare two ROMs table by table, using NMM files as templates.')
+
+    parser.add_argument('old', help = 'ROM to compare from.')
+    parser.add_argument('new', help = 'ROM to compare to.')
+    parser.add_argument('-f', '--folder', default = '.', help = 'folder to search for NMMs in (default: current directory).')
+    parser.add_argument('--json', action = 'store_true', help = 'write the changes as JSON.')
+    parser.add_argument('-o', '--output', metavar = 'FILE', help = 'write the changes to FILE instead of the standard output.')
+    parser.add_argument('--schema-cache', action = 'store_true', help = 'keep parsed NMMs in a cache file between runs.')
+    parser.add_argument('--stats', action = 'store_true', help = 'print the time spent on each table.')
+
+    args = parser.parse_args()
+
+    stats.enable(args.stats)
+
+    if args.schema_cache:
+        import pointercache
+        nightmare.useSchemaCache(os.path.join(pointercache.cacheDirectory(), nightmare.SCHEMA_CACHE_FILE))
+
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            sys.exit("ERROR: ROM `{}` doesn't exist!".format(path))
+
+    tables, failures = diffFolder(args.folder, args.old, args.new)
+
+    if args.json:
+        text = json.dumps({'old': args.old, 'new': args.new, 'tables': tables}, indent = 1)
+
+    else:
+        text = formatText(tables) if tables else "No table changed."
+
+    if args.output != None:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    else:
+        print(text)
+
+    nightmare.writeSchemaCache()
+
+    stats.report(file = sys.stderr if args.json else None) # keep the JSON on the standard output valid
+
+    # like diff: 0 if nothing changed, 1 if something did, 2 if some NMMs couldn't be read
+    sys.exit(2 if failures > 0 else (1 if tables else 0))
+
+if __name__ == '__main__':
+    main()
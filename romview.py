@@ -0,0 +1,72 @@
+import array, mmap, os, sys
+
+# array/memoryview format of an unsigned 32 bit integer on this platform
+WORD_TYPE = 'I' if array.array('I').itemsize == 4 else 'L'
+
+class RomView:
+  """Read-only, memory-mapped view of a ROM file.
+  data is a memoryview of the whole file, so slicing it never copies."""
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as rom:
+      stat = os.fstat(rom.fileno())
+      self.size = stat.st_size
+      self.mtime = stat.st_mtime_ns
+      if self.size > 0:
+        self.map = mmap.mmap(rom.fileno(), 0, access = mmap.ACCESS_READ)
+        self.data = memoryview(self.map)
+      else: # empty files can't be mapped
+        self.map = None
+        self.data = memoryview(b'')
+    self._words = None
+
+  def words(self):
+    """returns the ROM as a sequence of little-endian 32 bit words (a trailing partial word is ignored)"""
+    if self._words is None:
+      data = self.data[:self.size & ~3]
+      if sys.byteorder == 'little':
+        self._words = data.cast(WORD_TYPE)
+      else: # can't view little-endian words directly, make a swapped copy
+        self._words = array.array(WORD_TYPE, data.tobytes())
+        self._words.byteswap()
+    return self._words
+
+  def close(self):
+    """releases the mapping; the views handed out before must not be used anymore"""
+    if self._words is not None and isinstance(self._words, memoryview):
+      self._words.release()
+    self._words = None
+    self.data.release()
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+
+openRoms = {}
+
+def release(view):
+  """closes a shared view unless slices of it are still held, which then keep the mapping until they're gone"""
+  try:
+    view.close()
+  except BufferError:
+    pass
+
+def openRom(path):
+  """returns the shared RomView of path, mapping it again if the file changed since"""
+  key = os.path.abspath(path)
+  view = openRoms.get(key)
+  if view is not None:
+    stat = os.stat(key)
+    if (stat.st_size, stat.st_mtime_ns) != (view.size, view.mtime):
+      release(view) # rebuilt
+      view = None
+  if view is None:
+    view = openRoms[key] = RomView(path)
+  return view
+
+def closeRoms():
+  """Releases every shared view, e.g. between the builds of watch mode:
+  Windows doesn't let other programs (like EA) rewrite a file while it's mapped."""
+  for view in openRoms.values():
+    release(view)
+  openRoms.clear()
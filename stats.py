@@ -0,0 +1,206 @@
+"""Per-table timings and counters, for --stats.
+
+Work is timed in phases (scan, parse, names, rom, pointers, decode, encode, write...)
+and counted (rows, cells, bytes...) against the table being worked on; work
+done for several tables at once goes to SHARED. A phase inside another one
+only counts towards itself, so the phases of a table add up to at most its
+total. Everything here does nothing until enable is called.
+"""
+
+import contextlib, time
+
+SHARED = '(shared)'
+
+# phases in the order they are shown
+PHASES = ('scan', 'check', 'parse', 'names', 'rom', 'pointers', 'read', 'decode', 'encode', 'write')
+
+class Recorder:
+  """Times and counts of the tables of a run"""
+
+  def __init__(self):
+    self.tables = {} # name -> {'seconds': total, 'phases': {phase: seconds}, 'counts': {name: count}}
+    self.current = SHARED
+    self.stack = [] # [start, time spent in nested phases] of the open phases
+
+  def record(self, name):
+    return self.tables.setdefault(name, {'seconds': 0.0, 'phases': {}, 'counts': {}})
+
+  @contextlib.contextmanager
+  def table(self, name):
+    previous, self.current = self.current, name
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(name)['seconds'] += time.perf_counter() - start
+      self.current = previous
+
+  def begin(self):
+    self.stack.append([time.perf_counter(), 0.0])
+
+  def end(self, name):
+    start, nested = self.stack.pop()
+    elapsed = time.perf_counter() - start
+    phases = self.record(self.current)['phases']
+    phases[name] = phases.get(name, 0.0) + elapsed - nested
+    if self.stack:
+      self.stack[-1][1] += elapsed
+    elif self.current == SHARED: # not inside a table, so nothing else counts its total
+      self.record(SHARED)['seconds'] += elapsed
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    self.begin()
+    try:
+      yield
+    finally:
+      self.end(name)
+
+  def timed(self, iterable, name):
+    """iterates over iterable, timing the work of getting each item as phase name"""
+    iterator = iter(iterable)
+    while True:
+      self.begin()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      finally:
+        self.end(name)
+      yield item
+
+  def count(self, name, amount):
+    counts = self.record(self.current)['counts']
+    counts[name] = counts.get(name, 0) + amount
+
+  def merge(self, tables):
+    """adds the tables recorded by another process"""
+    for name, other in tables.items():
+      mine = self.record(name)
+      mine['seconds'] += other['seconds']
+      for key in ('phases', 'counts'):
+        for item, value in other[key].items():
+          mine[key][item] = mine[key].get(item, 0) + value
+
+  def take(self):
+    """returns the tables recorded so far and starts over, to send them from a worker"""
+    tables, self.tables = self.tables, {}
+    return tables
+
+  def slowest(self, names):
+    """the one of names that took the longest"""
+    return max(names, key = lambda name: self.tables.get(name, {'seconds': 0.0})['seconds'])
+
+  def totals(self):
+    total = {'seconds': 0.0, 'phases': {}, 'counts': {}}
+    for name, table in self.tables.items():
+      total['seconds'] += table['seconds']
+      for key in ('phases', 'counts'):
+        for item, value in table[key].items():
+          total[key][item] = total[key].get(item, 0) + value
+    return total
+
+  def summary(self):
+    """the tables, slowest first, as a text table"""
+    totals = self.totals()
+    phases = [phase for phase in PHASES if phase in totals['phases']]
+    phases.extend(sorted(phase for phase in totals['phases'] if phase not in PHASES))
+    counts = sorted(totals['counts'])
+
+    names = sorted(self.tables, key = lambda name: self.tables[name]['seconds'], reverse = True)
+    width = max([len(name) for name in names] + [5])
+    header = ["{:<{}}".format("table", width), "{:>9}".format("total")]
+    header.extend("{:>9}".format(phase) for phase in phases)
+    header.extend("{:>{}}".format(name, max(len(name), 8)) for name in counts)
+    lines = [' '.join(header)]
+
+    def line(name, table):
+      cells = ["{:<{}}".format(name, width), "{:>8.3f}s".format(table['seconds'])]
+      cells.extend("{:>8.3f}s".format(table['phases'][phase]) if phase in table['phases'] else "{:>9}".format("-") for phase in phases)
+      cells.extend("{:>{}}".format(table['counts'].get(name, '-'), max(len(name), 8)) for name in counts)
+      return ' '.join(cells)
+
+    lines.extend(line(name, self.tables[name]) for name in names)
+    lines.append(line("total", totals))
+    return '\n'.join(lines)
+
+  def toJson(self):
+    return {'tables': self.tables, 'total': self.totals()}
+
+class Disabled:
+  """Stand-in for Recorder when stats are off"""
+
+  def table(self, name):
+    return contextlib.nullcontext()
+
+  def phase(self, name):
+    return contextlib.nullcontext()
+
+  def timed(self, iterable, name):
+    return iterable
+
+  def count(self, name, amount):
+    pass
+
+  def take(self):
+    return {}
+
+  def merge(self, tables):
+    pass
+
+  def slowest(self, names):
+    return names[0]
+
+recorder = Disabled()
+
+def enable(collect = True):
+  """starts recording from scratch (also the initializer of worker processes, which may have inherited the stats of their parent)"""
+  global recorder
+  if collect:
+    recorder = Recorder()
+
+def enabled():
+  return isinstance(recorder, Recorder)
+
+def table(name):
+  return recorder.table(name)
+
+def phase(name):
+  return recorder.phase(name)
+
+def timed(iterable, name):
+  return recorder.timed(iterable, name)
+
+def count(name, amount = 1):
+  recorder.count(name, amount)
+
+def take():
+  return recorder.take()
+
+def merge(tables):
+  recorder.merge(tables)
+
+def slowest(names):
+  return recorder.slowest(names)
+
+def report(jsonPath = None, file = None):
+  """prints the summary (to file, default: the standard output), and writes the stats to jsonPath if given"""
+  if not enabled():
+    return
+  print(recorder.summary(), file = file)
+  if jsonPath != None:
+    import json
+    with open(jsonPath, 'w') as f:
+      json.dump(recorder.toJson(), f, indent = 1, sort_keys = True)
+    print("Wrote stats to `{}`".format(jsonPath), file = file)
+
+def profile(func, path, top = 15):
+  """runs func under cProfile, saves the profile to path and prints its top functions"""
+  import cProfile, pstats, io
+  profiler = cProfile.Profile()
+  profiler.runcall(func)
+  profiler.dump_stats(path)
+  out = io.StringIO()
+  pstats.Stats(profiler, stream = out).sort_stats('cumulative').print_stats(top)
+  print(out.getvalue())
+  print("Wrote profile to `{}`".format(path))
@@ -0,0 +1,72 @@
+"""Vectorized decoding of whole NMM tables with numpy.
+
+Every column of a table is decoded at once: plain 1/2/4/8 byte fields through
+a structured dtype laid over the table region, other widths by combining the
+bytes of a strided (rows, rowLength) view. Cells come out exactly as the
+per-cell path in n2c.genTableRows makes them.
+"""
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+PLAIN_WIDTHS = (1, 2, 4, 8)
+
+def columnFormat(entry):
+  """numpy format of an entry that maps onto a plain integer type"""
+  return '<{}{}'.format('i' if entry.signed else 'u', entry.length)
+
+def tableDtype(nmm):
+  """structured dtype of one row, with a field for every column of a plain width"""
+  names, formats, offsets = [], [], []
+  for index, entry in enumerate(nmm.columns):
+    if entry.length in PLAIN_WIDTHS:
+      names.append('c{}'.format(index))
+      formats.append(columnFormat(entry))
+      offsets.append(entry.offset)
+  return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': nmm.rowLength})
+
+def decodeOdd(rowBytes, entry):
+  """returns the values of a column whose width isn't a plain integer type, as a list"""
+  if entry.length > 8: # too wide for numpy integers
+    signed = entry.signed
+    return [int.from_bytes(cell, 'little', signed = signed) for cell in map(bytes, rowBytes[:, entry.offset:entry.offset+entry.length])]
+  values = numpy.zeros(len(rowBytes), dtype = numpy.uint64)
+  for i in range(entry.length):
+    values |= rowBytes[:, entry.offset+i].astype(numpy.uint64) << numpy.uint64(8*i)
+  if entry.signed and entry.length > 0:
+    values = values.astype(numpy.int64)
+    values[values >= 1 << (8*entry.length - 1)] -= 1 << (8*entry.length)
+  return values.tolist()
+
+def formatColumn(entry, values):
+  if entry.base == 16:
+    return list(map(hex, values))
+  return values
+
+def decodeTable(nmm, rom):
+  """Returns the cells of every column of the table as a list of lists,
+  or None if the table can't be decoded in bulk (no numpy, or the table runs past the end of the ROM)."""
+  if numpy is None or nmm.rowLength <= 0 or len(rom) < nmm.offset + nmm.size:
+    return None
+  region = numpy.frombuffer(rom, dtype = numpy.uint8, count = nmm.size, offset = nmm.offset)
+  records = region.view(tableDtype(nmm))
+  rowBytes = region.reshape(nmm.rowNum, nmm.rowLength)
+  columns = []
+  for index, entry in enumerate(nmm.columns):
+    if entry.length in PLAIN_WIDTHS:
+      values = records['c{}'.format(index)].tolist()
+    else:
+      values = decodeOdd(rowBytes, entry)
+    columns.append(formatColumn(entry, values))
+  return columns
+
+def changedRows(nmm, old, new):
+  """Returns the indices of the rows of the table whose bytes differ between two ROMs, comparing all rows at once,
+  or None if that can't be done (no numpy, or the table runs past the end of either ROM)."""
+  if numpy is None or nmm.rowLength <= 0 or min(len(old), len(new)) < nmm.offset + nmm.size:
+    return None
+  a = numpy.frombuffer(old, dtype = numpy.uint8, count = nmm.size, offset = nmm.offset).reshape(nmm.rowNum, nmm.rowLength)
+  b = numpy.frombuffer(new, dtype = numpy.uint8, count = nmm.size, offset = nmm.offset).reshape(nmm.rowNum, nmm.rowLength)
+  return numpy.flatnonzero((a != b).any(axis = 1)).tolist()
@@ -0,0 +1,386 @@
+"""Local JSON-RPC server giving editors and scripts fast access to the tables of a project.
+
+The ROM and the NMMs are loaded once, and each table is read from its CSV (or
+ripped from the ROM if it has none) the first time it is used. Cells can then be
+read and written in memory; changed tables are written back to CSV, and to
+events, when asked to with flush.
+
+Requests are JSON-RPC 2.0, one per line (or a batch: an array of them) over
+localhost TCP or a Unix socket. Methods (rows are indices or entry names,
+columns descriptions or indices):
+
+  tables()                                   names, sizes and columns of the tables
+  getCell(table, row, column)                cell as in the CSV
+  getRow(table, row)                         {"name", "cells"}
+  getTable(table, start=0, stop=None)        rows start to stop
+  setCell(table, row, column, value)         value is a number or a cell as in the CSV
+  setRow(table, row, cells)
+  flush(tables=None, events=False)           writes the changed tables, returns the files written
+  revert(table)                              drops the changes of a table
+"""
+
+import nightmare, projectindex, romview, c2ea, n2c, sys, csv, os, json, stat, threading, socket, socketserver
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+class RpcError(Exception):
+    """Raised by a method for a request that can't be served, sent back as a JSON-RPC error"""
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class Table:
+    """Cells of one table, as the text of its CSV"""
+
+    def __init__(self, csvPath, nmm, rom):
+        self.csvPath = csvPath
+        self.nmm = nmm
+        self.encoders = [c2ea.compileEncoder(entry) for entry in nmm.columns]
+        self.dirty = False
+        self._names = None
+
+        if os.path.exists(csvPath):
+            with open(csvPath, 'r') as f:
+                rows = list(csv.reader(f))
+
+        else:
+            rows = [[str(cell) for cell in row] for row in n2c.genTableRows(nmm, rom)]
+
+        self.header = rows[0] if rows else [hex(nmm.offset)] + [entry.description for entry in nmm.columns]
+        self.names = [row[0] if row else '' for row in rows[1:]]
+        self.rows = [row[1:len(nmm.columns)+1] for row in rows[1:]]
+
+    def rowIndex(self, row):
+        if isinstance(row, str):
+            if self._names is None:
+                self._names = {}
+                for index, name in enumerate(self.names):
+                    self._names.setdefault(name, index) # the first of rows sharing a name
+            if row not in self._names:
+                raise RpcError(INVALID_PARAMS, "no row `{}`".format(row))
+            return self._names[row]
+        if not isinstance(row, int) or not (-len(self.rows) <= row < len(self.rows)):
+            raise RpcError(INVALID_PARAMS, "no row {}".format(row))
+        return row % len(self.rows)
+
+    def columnIndex(self, column):
+        if isinstance(column, int) and 0 <= column < len(self.nmm.columns):
+            return column
+        for index, entry in enumerate(self.nmm.columns):
+            if entry.description == column:
+                return index
+        raise RpcError(INVALID_PARAMS, "no column {}".format(json.dumps(column)))
+
+    def toCell(self, index, value):
+        """cell text of a value written to a column, raises RpcError if it doesn't fit"""
+        entry = self.nmm.columns[index]
+        cell = str(entry.format(value)) if isinstance(value, int) and not isinstance(value, bool) else value
+        if not isinstance(cell, str) or cell.strip() == '':
+            raise RpcError(INVALID_PARAMS, "{}: cells are numbers or non-blank strings".format(entry.description))
+        cell = cell.strip()
+        try:
+            self.encoders[index](cell)
+        except OverflowError as e:
+            raise RpcError(INVALID_PARAMS, "{}: {}".format(entry.description, e))
+        return cell
+
+    def getRow(self, index):
+        return {'name': self.names[index], 'cells': self.rows[index]}
+
+    def write(self):
+        """writes the table to its CSV"""
+        temp = self.csvPath + '.tmp'
+        with open(temp, 'w') as f:
+            wr = csv.writer(f, quoting = csv.QUOTE_ALL, lineterminator = '\n')
+            wr.writerow(self.header)
+            wr.writerows([name] + cells for name, cells in zip(self.names, self.rows))
+        os.replace(temp, self.csvPath)
+        self.dirty = False
+
+class TableStore:
+    """The tables of the NMMs under a folder, loaded when first used"""
+
+    def __init__(self, folder, romPath, incbin = False):
+        self.folder = folder
+        self.romPath = romPath
+        self.rom = romview.openRom(romPath).data
+        self.incbin = incbin
+        self.lock = threading.Lock()
+        self.nmmFiles = {}
+        self.tables = {}
+
+        for nmmFile in projectindex.findFiles(folder, '.nmm'):
+            self.nmmFiles[os.path.splitext(os.path.relpath(nmmFile, folder))[0].replace(os.sep, '/')] = nmmFile
+
+    def getTable(self, name):
+        if name not in self.nmmFiles:
+            raise RpcError(INVALID_PARAMS, "no table `{}`".format(name))
+        if name not in self.tables:
+            nmmFile = self.nmmFiles[name]
+            try:
+                nmm = nightmare.loadTable(nmmFile)
+            except (AssertionError, ValueError, IndexError) as e:
+                raise RpcError(SERVER_ERROR, "couldn't parse `{}`: {}".format(nmmFile, e))
+            self.tables[name] = Table(nmmFile[:-4] + '.csv', nmm, self.rom)
+        return self.tables[name]
+
+    # Methods
+
+    def listTables(self):
+        result = []
+        for name, nmmFile in self.nmmFiles.items():
+            try:
+                nmm = nightmare.loadTable(nmmFile)
+            except (AssertionError, ValueError, IndexError):
+                continue
+            result.append({'name': name, 'offset': nmm.offset, 'rows': nmm.rowNum, 'columns': [entry.description for entry in nmm.columns]})
+        return result
+
+    def getCell(self, table, row, column):
+        table = self.getTable(table)
+        return table.rows[table.rowIndex(row)][table.columnIndex(column)]
+
+    def getRow(self, table, row):
+        table = self.getTable(table)
+        return table.getRow(table.rowIndex(row))
+
+    def getRows(self, table, start = 0, stop = None):
+        table = self.getTable(table)
+        return [table.getRow(index) for index in range(len(table.rows))[start:stop]]
+
+    def setCell(self, table, row, column, value):
+        table = self.getTable(table)
+        index, columnIndex = table.rowIndex(row), table.columnIndex(column)
+        table.rows[index][columnIndex] = table.toCell(columnIndex, value)
+        table.dirty = True
+        return table.rows[index][columnIndex]
+
+    def setRow(self, table, row, cells):
+        table = self.getTable(table)
+        index = table.rowIndex(row)
+        if not isinstance(cells, list) or len(cells) != len(table.nmm.columns):
+            raise RpcError(INVALID_PARAMS, "a row has {} cells".format(len(table.nmm.columns)))
+        table.rows[index] = [table.toCell(column, value) for column, value in enumerate(cells)]
+        table.dirty = True
+        return table.getRow(index)
+
+    def flush(self, tables = None, events = False):
+        written = []
+        for name in (tables if tables != None else list(self.tables)):
+            table = self.getTable(name)
+            if table.dirty:
+                table.write()
+                written.append(table.csvPath)
+            if events:
+                eventPath = table.csvPath[:-4] + '.event'
+                try:
+                    c2ea.process(table.csvPath, self.nmmFiles[name], eventPath, self.romPath, blank = 'error', incbin = self.incbin)
+                except c2ea.INPUT_ERRORS as e:
+                    raise RpcError(SERVER_ERROR, str(e))
+                written.append(eventPath)
+        if c2ea.TABLE_INLINED:
+            from c2eaPfinder import writeCache
+            writeCache()
+        return written
+
+    def revert(self, table):
+        if table in self.tables:
+            del self.tables[table]
+        return True
+
+    def getMethods(self):
+        return {
+            'tables': self.listTables,
+            'getCell': self.getCell,
+            'getRow': self.getRow,
+            'getTable': self.getRows,
+            'setCell': self.setCell,
+            'setRow': self.setRow,
+            'flush': self.flush,
+            'revert': self.revert,
+        }
+
+def getError(requestId, code, message):
+    return {'jsonrpc': '2.0', 'id': requestId, 'error': {'code': code, 'message': message}}
+
+def handleRequest(store, methods, request):
+    """response to one JSON-RPC request, None for notifications"""
+    if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or not isinstance(request.get('method'), str):
+        return getError(request.get('id') if isinstance(request, dict) else None, INVALID_REQUEST, "not a JSON-RPC 2.0 request")
+    requestId = request.get('id')
+    method = methods.get(request['method'])
+    params = request.get('params', {})
+    try:
+        if method == None:
+            raise RpcError(METHOD_NOT_FOUND, "no method `{}`".format(request['method']))
+        with store.lock:
+            if isinstance(params, list):
+                result = method(*params)
+            elif isinstance(params, dict):
+                result = method(**params)
+            else:
+                raise RpcError(INVALID_PARAMS, "params are an array or an object")
+    except RpcError as e:
+        response = getError(requestId, e.code, str(e))
+    except TypeError as e:
+        response = getError(requestId, INVALID_PARAMS, str(e))
+    except Exception as e:
+        response = getError(requestId, SERVER_ERROR, "{}: {}".format(type(e).__name__, e))
+    else:
+        response = {'jsonrpc': '2.0', 'id': requestId, 'result': result}
+    return response if 'id' in request else None
+
+def handleLine(store, methods, line):
+    """response line (without the newline) to a request line, None if there is nothing to answer"""
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return json.dumps(getError(None, PARSE_ERROR, "not JSON"))
+    if isinstance(message, list):
+        if not message:
+            return json.dumps(getError(None, INVALID_REQUEST, "empty batch"))
+        responses = [response for response in (handleRequest(store, methods, request) for request in message) if response != None]
+        return json.dumps(responses) if responses else None
+    response = handleRequest(store, methods, message)
+    return json.dumps(response) if response != None else None
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        if self.connection.family == socket.AF_INET:
+            # answers go out at once, not after the next request
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                response = handleLine(self.server.store, self.server.methods, line)
+                if response != None:
+                    self.wfile.write(response.encode('utf-8') + b'\n')
+
+class TcpServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+def isSocket(path):
+    """whether path is a Unix socket (a symbolic link to one isn't)"""
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+def makeServer(store, port = 0, socketPath = None):
+    """Server for the store on localhost TCP (port 0: any free port) or on a Unix socket.
+    A socket left at socketPath by an earlier server is replaced; raises FileExistsError if something else is there."""
+    if socketPath != None:
+        if isSocket(socketPath):
+            os.remove(socketPath)
+        elif os.path.lexists(socketPath):
+            raise FileExistsError("`{}` exists and isn't a socket".format(socketPath))
+        server = UnixServer(socketPath, RequestHandler)
+    else:
+        server = TcpServer(('127.0.0.1', port), RequestHandler)
+    server.store = store
+    server.methods = store.getMethods()
+    return server
+
+class Client:
+    """Minimal client: call('getCell', table = 'Item Table', row = 1, column = 'Might'),
+    or batch([('getCell', {...}), ...]) for several requests in one round trip"""
+
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.connect(address)
+        self.file = self.socket.makefile('rb')
+        self.nextId = 0
+
+    def send(self, message):
+        self.socket.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        return json.loads(self.file.readline())
+
+    def request(self, method, params):
+        self.nextId += 1
+        return {'jsonrpc': '2.0', 'id': self.nextId, 'method': method, 'params': params}
+
+    def call(self, method, **params):
+        response = self.send(self.request(method, params))
+        if 'error' in response:
+            raise RpcError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def batch(self, calls):
+        """results (or RpcErrors) of (method, params) calls, in order"""
+        requests = [self.request(method, params) for method, params in calls]
+        byId = {response['id']: response for response in self.send(requests)}
+        return [byId[request['id']].get('result') if 'error' not in byId[request['id']] else
+                RpcError(byId[request['id']]['error']['code'], byId[request['id']]['error']['message']) for request in requests]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Serve the tables of a project over JSON-RPC, for editors and scripts.')
+
+    parser.add_argument('rom', help = 'reference ROM.')
+    parser.add_argument('-f', '--folder', default = '.', help = 'folder to search for NMMs in (default: current directory).')
+    parser.add_argument('-p', '--port', type = int, default = 8765, help = 'localhost TCP port to listen on (default: 8765).')
+    parser.add_argument('--socket', metavar = 'PATH', help = 'listen on this Unix socket instead.')
+    parser.add_argument('--incbin', action = 'store_true', help = 'write events as c2ea -incbin does when flushing.')
+    parser.add_argument('--schema-cache', action = 'store_true', help = 'keep parsed NMMs in a cache file between runs.')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.rom):
+        sys.exit("ERROR: ROM `{}` doesn't exist!".format(args.rom))
+
+    if args.socket != None and not hasattr(socketserver, 'UnixStreamServer'):
+        sys.exit("ERROR: Unix sockets aren't available here, use --port.")
+
+    if args.schema_cache:
+        import pointercache
+        nightmare.useSchemaCache(os.path.join(pointercache.cacheDirectory(), nightmare.SCHEMA_CACHE_FILE))
+
+    c2ea.INTERACTIVE = False # there's nobody to ask
+
+    store = TableStore(args.folder, args.rom, args.incbin)
+    try:
+        server = makeServer(store, args.port, args.socket)
+
+    except FileExistsError as e:
+        sys.exit("ERROR: " + str(e))
+
+    print("Serving {} tables on {}, press Ctrl+C to stop.".format(len(store.nmmFiles), args.socket if args.socket != None else "127.0.0.1:{}".format(server.server_address[1])))
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+    finally:
+        server.server_close()
+        nightmare.writeSchemaCache()
+
+        if args.socket != None and isSocket(args.socket):
+            os.remove(args.socket)
+
+        if any(table.dirty for table in store.tables.values()):
+            print("Warning: changes that weren't flushed were dropped.")
+
+if __name__ == '__main__':
+    main()
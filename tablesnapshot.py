@@ -0,0 +1,189 @@
+"""Columnar binary snapshots of ripped tables (.tbin), written by n2c next to the CSVs.
+
+A snapshot holds the cells of every column as one contiguous little-endian array,
+the row names as written to the CSV and a fingerprint of the NMM it was ripped
+with. Files are memory-mapped, so loading one only reads its header; columns
+of a plain width come out as numpy arrays (or memoryviews without numpy).
+
+  import tablesnapshot
+  with tablesnapshot.load('Item Table.tbin') as table:
+    might = table.column('Might')
+"""
+
+import hashlib, mmap, os, struct, sys
+import nightmare, tabledecode
+
+# On-disk layout (all little-endian):
+#   header: magic, format version, number of columns, NMM fingerprint, table offset, rows, row length,
+#     size and mtime (ns) of the csv written with it, length of the names
+#   column record: position of its cells, offset in the row, width, data type, description length, then the utf-8 description
+#   then the names (utf-8, one per line), and the cells of each column, starting at multiples of 8
+MAGIC = b'NMTB'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHH20sIIIQQI')
+COLUMN_RECORD = struct.Struct('<QHH4sH')
+
+EXTENSION = '.tbin'
+
+# memoryview formats of the plain widths
+VIEW_FORMATS = {(1, False): 'B', (1, True): 'b', (2, False): 'H', (2, True): 'h', (4, False): 'I', (4, True): 'i', (8, False): 'Q', (8, True): 'q'}
+
+def getSnapshotPath(csvPath):
+  return os.path.splitext(csvPath)[0] + EXTENSION
+
+def fingerprint(nmm):
+  """sha1 of what the layout of a table depends on in its NMM"""
+  schema = (nmm.offset, nmm.rowNum, nmm.rowLength, [(entry.description, entry.offset, entry.length, entry.dataType) for entry in nmm.columns])
+  return hashlib.sha1(repr(schema).encode('utf-8')).digest()
+
+def getColumnData(nmm, entry, rom):
+  """cells of a column of the table, one after the other"""
+  if tabledecode.numpy is not None and nmm.rowLength > 0:
+    region = tabledecode.numpy.frombuffer(rom, dtype = tabledecode.numpy.uint8, count = nmm.size, offset = nmm.offset)
+    return region.reshape(nmm.rowNum, nmm.rowLength)[:, entry.offset:entry.offset+entry.length].tobytes()
+  start = nmm.offset + entry.offset
+  return b''.join(rom[row:row+entry.length] for row in range(start, start + nmm.size, nmm.rowLength))
+
+def write(path, nmm, rom, names, csvPath):
+  """Writes the snapshot of the table of nmm in rom, with the row names written to csvPath.
+  Call after writing the csv: the snapshot is only used while the csv is unchanged.
+  Returns False (writing nothing) if the table runs past the end of the ROM."""
+  if len(rom) < nmm.offset + nmm.size:
+    return False
+  csvStat = os.stat(csvPath)
+  encodedNames = '\n'.join(map(str, names)).encode('utf-8')
+  descriptions = [entry.description.encode('utf-8') for entry in nmm.columns]
+  position = HEADER.size + sum(COLUMN_RECORD.size + len(description) for description in descriptions) + len(encodedNames)
+  records, chunks = [], []
+  for entry, description in zip(nmm.columns, descriptions):
+    padding = -position % 8
+    chunks.append(bytes(padding))
+    position += padding
+    records.append(COLUMN_RECORD.pack(position, entry.offset, entry.length, entry.dataType.encode('ascii'), len(description)) + description)
+    data = getColumnData(nmm, entry, rom)
+    chunks.append(data)
+    position += len(data)
+  header = HEADER.pack(MAGIC, FORMAT_VERSION, len(nmm.columns), fingerprint(nmm), nmm.offset, nmm.rowNum, nmm.rowLength,
+    csvStat.st_size, csvStat.st_mtime_ns, len(encodedNames))
+  temp = path + '.tmp'
+  with open(temp, 'wb') as f:
+    f.write(header)
+    f.writelines(records)
+    f.write(encodedNames)
+    f.writelines(chunks)
+  os.replace(temp, path)
+  return True
+
+class Snapshot:
+  """A memory-mapped table snapshot. Close it (or use it in a with block) before the file is written again."""
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as f:
+      self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    self.data = memoryview(self.map)
+    try:
+      magic, version, columnCount, self.fingerprint, self.offset, self.rowNum, self.rowLength, \
+        self.csvSize, self.csvMtime, namesLength = HEADER.unpack_from(self.data, 0)
+      if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("`{}` isn't a table snapshot".format(path))
+      pos = HEADER.size
+      columns, self.positions = [], []
+      for i in range(columnCount):
+        position, offset, length, dataType, descriptionLength = COLUMN_RECORD.unpack_from(self.data, pos)
+        pos += COLUMN_RECORD.size
+        description = bytes(self.data[pos:pos+descriptionLength]).decode('utf-8')
+        pos += descriptionLength
+        columns.append(nightmare.NightmareEntry([description, offset, length, dataType.decode('ascii'), "NULL"]))
+        self.positions.append(position)
+      self.columns = tuple(columns)
+      self.names = bytes(self.data[pos:pos+namesLength]).decode('utf-8').split('\n') if self.rowNum else []
+    except (struct.error, UnicodeDecodeError, AssertionError) as e:
+      self.close()
+      raise ValueError("`{}` is corrupt: {}".format(path, e))
+    except ValueError:
+      self.close()
+      raise
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    """releases the mapping; the arrays handed out before must not be used anymore"""
+    if self.map is not None:
+      self.data.release()
+      self.map.close()
+      self.map = None
+
+  def getIndex(self, column):
+    """index of a column given by index or description"""
+    if isinstance(column, int):
+      return column
+    for index, entry in enumerate(self.columns):
+      if entry.description == column:
+        return index
+    raise KeyError(column)
+
+  def raw(self, column):
+    """bytes of the cells of a column, one after the other"""
+    index = self.getIndex(column)
+    position = self.positions[index]
+    return self.data[position:position + self.rowNum * self.columns[index].length]
+
+  def column(self, column):
+    """Values of a column: a numpy array (a memoryview without numpy) for plain widths, else a list.
+    Arrays share the mapped file, they are only valid until the snapshot is closed."""
+    entry = self.columns[self.getIndex(column)]
+    data = self.raw(column)
+    if entry.length in tabledecode.PLAIN_WIDTHS:
+      if tabledecode.numpy is not None:
+        return tabledecode.numpy.frombuffer(data, dtype = tabledecode.columnFormat(entry))
+      if sys.byteorder == 'little':
+        return data.cast(VIEW_FORMATS[entry.length, entry.signed])
+    return [entry.decode(data[i:i+entry.length]) for i in range(0, len(data), entry.length)]
+
+  def cells(self, column):
+    """cells of a column as n2c writes them to the CSV"""
+    entry = self.columns[self.getIndex(column)]
+    values = self.column(column)
+    return [str(value) for value in tabledecode.formatColumn(entry, values.tolist() if hasattr(values, 'tolist') else list(values))]
+
+  def rows(self):
+    """(name, cells) of every row, as c2ea reads them from the CSV"""
+    return zip(self.names, zip(*[self.cells(index) for index in range(len(self.columns))]))
+
+  def rowBytes(self):
+    """the cells of every row one after the other, as c2ea encodes them"""
+    raws = [self.raw(index) for index in range(len(self.columns))]
+    if tabledecode.numpy is not None:
+      numpy = tabledecode.numpy
+      arrays = [numpy.frombuffer(raw, dtype = numpy.uint8).reshape(self.rowNum, entry.length) for raw, entry in zip(raws, self.columns)]
+      return numpy.hstack(arrays).tobytes() if arrays else b''
+    lengths = [entry.length for entry in self.columns]
+    return b''.join(raw[row*length:(row+1)*length] for row in range(self.rowNum) for raw, length in zip(raws, lengths))
+
+def load(path):
+  """opens a snapshot, raises ValueError if it isn't one"""
+  return Snapshot(path)
+
+def loadFresh(csvPath, nmm):
+  """The snapshot of a csv if it was written along with the csv as it is now, for the table of nmm.
+  None if there is none, or the csv was edited since, or the NMM changed."""
+  path = getSnapshotPath(csvPath)
+  try:
+    snapshotStat, csvStat = os.stat(path), os.stat(csvPath)
+  except OSError:
+    return None
+  if snapshotStat.st_mtime_ns < csvStat.st_mtime_ns:
+    return None # a snapshot is only ever written after its csv
+  try:
+    snapshot = Snapshot(path)
+  except (OSError, ValueError):
+    return None
+  if (snapshot.csvSize, snapshot.csvMtime) != (csvStat.st_size, csvStat.st_mtime_ns) or snapshot.fingerprint != fingerprint(nmm):
+    snapshot.close()
+    return None
+  return snapshot
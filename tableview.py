@@ -0,0 +1,110 @@
+"""Lazy, random-access view of an NMM table in a memory-mapped ROM.
+
+Nothing is decoded up front: rows are found by index or entry name in O(1),
+and only the bytes of the cells read are decoded.
+
+  import tableview
+  items = tableview.open('Item Table.nmm', 'rom.gba')
+  items[0x3A]['Might']
+  for row in items.select('Might', 'Weight')[0x10:0x20]:
+    print(row.name, row.values())
+"""
+
+import nightmare, romview
+
+from n2c import getRowName
+
+class Row:
+  """One row of a TableView"""
+  __slots__ = ('view', 'index')
+
+  def __init__(self, view, index):
+    self.view = view
+    self.index = index
+
+  @property
+  def name(self):
+    return getRowName(self.view.nmm, self.index)
+
+  def __getitem__(self, column):
+    return self.view.cell(self.index, column)
+
+  def values(self):
+    """values of the columns of the view"""
+    return [self.view.decode(self.index, entry) for entry in self.view.columns]
+
+  def cells(self):
+    """cells of the columns of the view as n2c writes them"""
+    return [entry.format(value) for entry, value in zip(self.view.columns, self.values())]
+
+  def __iter__(self):
+    return iter(self.values())
+
+  def __repr__(self):
+    return "Row({}, {})".format(hex(self.index), self.name)
+
+class TableView:
+  """Rows (a range of indices) and columns of the table of an NMM in a ROM.
+  Indexing with a number or entry name gives a Row, with a slice another TableView."""
+
+  def __init__(self, nmm, rom, rows = None, columns = None):
+    self.nmm = nmm
+    self.rom = rom
+    self.rows = rows if rows is not None else range(nmm.rowNum)
+    self.columns = columns if columns is not None else nmm.columns
+    self._names = None
+
+  def __len__(self):
+    return len(self.rows)
+
+  def rowIndex(self, key):
+    """index in the table of a row of the view, given by position or entry name; raises KeyError or IndexError"""
+    if isinstance(key, str):
+      if self._names is None:
+        self._names = {}
+        for index, name in enumerate(self.nmm.entryNames[:self.nmm.rowNum]):
+          self._names.setdefault(name, index) # the first of rows sharing a name
+      index = self._names.get(key)
+      if index is None or index not in self.rows:
+        raise KeyError(key)
+      return index
+    return self.rows[key]
+
+  def getColumn(self, column):
+    """entry of a column given by description or index (in the whole table)"""
+    if isinstance(column, int):
+      return self.nmm.columns[column]
+    for entry in self.nmm.columns:
+      if entry.description == column:
+        return entry
+    raise KeyError(column)
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      return TableView(self.nmm, self.rom, self.rows[key], self.columns)
+    return Row(self, self.rowIndex(key))
+
+  def __iter__(self):
+    return (Row(self, index) for index in self.rows)
+
+  def select(self, *columns):
+    """view of only these columns (descriptions or indices), in this order"""
+    return TableView(self.nmm, self.rom, self.rows, tuple(self.getColumn(column) for column in columns))
+
+  def decode(self, index, entry):
+    """value of a cell, from the bytes the ROM has of it (like n2c for tables past its end)"""
+    start = self.nmm.offset + index*self.nmm.rowLength + entry.offset
+    return entry.decode(self.rom[start:start+entry.length])
+
+  def cell(self, row, column):
+    """value of the cell of a row (position or entry name) and column (description or index)"""
+    return self.decode(self.rowIndex(row), self.getColumn(column))
+
+  def column(self, column):
+    """values of a column over the rows of the view"""
+    entry = self.getColumn(column)
+    return [self.decode(index, entry) for index in self.rows]
+
+def open(nmmPath, romPath):
+  """view of the whole table of an NMM in a ROM"""
+  return TableView(nightmare.loadTable(nmmPath), romview.openRom(romPath).data)
@@ -0,0 +1,43 @@
+"""Checks that csv2rom writes the bytes c2ea's events assemble to.
+
+Run with: python -m unittest test_csv2rom (or pytest)
+"""
+
+import os, tempfile, unittest
+import c2ea, csv2rom, nightmare
+
+def writeNmm(path, rowLength, columns):
+  """writes an NMM with (description, offset, length, type) columns and loads it"""
+  lines = ["1", "Test table", "0x100", "3", str(rowLength), "NULL", "NULL", ""]
+  for description, offset, length, dataType in columns:
+    lines += [description, str(offset), str(length), dataType, "NULL", ""]
+  with open(path, 'w') as f:
+    f.write('\n'.join(lines) + '\n')
+  return nightmare.NightmareTable(path)
+
+def eventBytes(nmm, rows):
+  """bytes EA assembles from the rows c2ea writes: the cells of each row one after the other"""
+  encoders = [c2ea.compileEncoder(entry) for entry in nmm.columns]
+  return b''.join(encode(cell)[1] for name, cells in rows for encode, cell in zip(encoders, cells))
+
+class EncodeRowsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.addCleanup(self.directory.cleanup)
+    self.path = os.path.join(self.directory.name, 'table.nmm')
+
+  def testSameBytesAsEvents(self):
+    # a gap (filled by ##UNKNOWN##), odd widths and a signed field
+    nmm = writeNmm(self.path, 10, [("Word", 0, 4, "NEHU"), ("Short", 4, 2, "NEDS"), ("Odd", 7, 3, "NEDU")])
+    rows = [("Row {}".format(row), [hex(row * 0x1111), str(-row), "0x0", str(row * 1000)]) for row in range(3)]
+    self.assertEqual(bytes(csv2rom.encodeRows('table.csv', nmm, rows, None)), eventBytes(nmm, rows))
+
+  def testOverlappingColumns(self):
+    nmm = writeNmm(self.path, 4, [("Word", 0, 4, "NEHU"), ("Low half", 0, 2, "NEHU")])
+    rows = [("Row 0", ["0x12345678", "0x5678"])]
+    with self.assertRaisesRegex(c2ea.CellError, "columns overlap"):
+      csv2rom.encodeRows('table.csv', nmm, rows, None)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,65 @@
+"""Checks that n2c writes the same CSVs with the numpy decoder (tabledecode) as cell by cell.
+
+Run with: python -m unittest test_tabledecode (or pytest)
+"""
+
+import csv, io, os, random, tempfile, unittest
+import n2c, nightmare, tabledecode
+
+TYPES = ["HEXA", "NEHU", "NEDS", "NEDU", "NDHU", "NDDU"]
+WIDTHS = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 12, 16]
+
+def makeNmm(rng, path, offset, rowNum):
+  """writes a random NMM (odd widths, signed fields, overlapping and zero-width columns) and loads it"""
+  rowLength = rng.randrange(1, 41)
+  lines = ["1", "Random table", hex(offset), str(rowNum), str(rowLength), "NULL", "NULL", ""]
+  for index in range(rng.randrange(1, 9)):
+    columnOffset = rng.randrange(rowLength)
+    length = rng.choice([width for width in WIDTHS if columnOffset + width <= rowLength])
+    lines += ["Column {}".format(index), str(columnOffset), str(length), rng.choice(TYPES), "NULL", ""]
+  with open(path, 'w') as f:
+    f.write('\n'.join(lines) + '\n')
+  return nightmare.NightmareTable(path)
+
+def toCsv(rows):
+  """CSV text of rows, written the way n2c.ripModule writes it"""
+  out = io.StringIO()
+  csv.writer(out, quoting = csv.QUOTE_ALL, lineterminator = '\n').writerows(rows)
+  return out.getvalue()
+
+@unittest.skipIf(tabledecode.numpy is None, "numpy isn't installed")
+class DecodeTableTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.addCleanup(self.directory.cleanup)
+
+  def checkLayouts(self, seed, count, pastEnd):
+    rng = random.Random(seed)
+    path = os.path.join(self.directory.name, 'table.nmm')
+    bulk = 0
+    for layout in range(count):
+      rom = rng.randbytes(rng.randrange(0x100, 0x1000))
+      rowNum = rng.randrange(0, 60)
+      offset = rng.randrange(len(rom) - 0x40 if pastEnd else len(rom) // 2)
+      nmm = makeNmm(rng, path, offset, rowNum)
+      if not pastEnd and offset + nmm.size > len(rom):
+        rom += rng.randbytes(offset + nmm.size - len(rom))
+      if tabledecode.decodeTable(nmm, rom) is not None:
+        bulk += 1
+      expected = toCsv([next(n2c.genTableRows(nmm, rom))] + list(n2c.genTableRowsSlow(nmm, rom)))
+      self.assertEqual(toCsv(n2c.genTableRows(nmm, rom)), expected, "layout {} of seed {}".format(layout, seed))
+    return bulk
+
+  def testRandomLayouts(self):
+    self.assertEqual(self.checkLayouts(1, 300, pastEnd = False), 300) # every table was decoded in bulk
+
+  def testTablesPastTheEnd(self):
+    self.checkLayouts(2, 200, pastEnd = True)
+
+  def testEmptyRom(self):
+    nmm = makeNmm(random.Random(3), os.path.join(self.directory.name, 'table.nmm'), 0, 4)
+    self.assertEqual(toCsv(n2c.genTableRows(nmm, b'')), toCsv([next(n2c.genTableRows(nmm, b''))] + list(n2c.genTableRowsSlow(nmm, b''))))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,91 @@
+"""Polling file watcher for the watch modes of n2c and c2ea.
+
+The tools keep running between builds, so the parsed NMMs and the pointer
+cache stay in memory and only the tables affected by a save are redone. The
+ROMs are unmapped between builds, so other programs can rewrite them.
+"""
+
+import os, time
+import projectindex, romview
+
+def getStamp(path):
+  """(size, mtime) of a file, None if it doesn't exist"""
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return (stat.st_size, stat.st_mtime_ns)
+
+class FolderWatcher:
+  """Tells which files under a folder with one of the given extensions (of projectindex.EXTENSIONS),
+  the entry name files of its NMMs (with entryNames) or the extra files were changed, added or removed
+  since the last poll. Paths are normalized.
+  The folder is polled through its project index, so only the directories that changed are listed
+  and the include and exclude patterns apply."""
+
+  def __init__(self, folder, extensions, extra = (), entryNames = False):
+    self.folder = folder
+    self.extensions = tuple(extension.lower() for extension in extensions)
+    self.extra = [os.path.normpath(path) for path in extra]
+    self.entryNames = entryNames
+    self.index = projectindex.ProjectIndex(folder, projectindex.INCLUDE, projectindex.EXCLUDE)
+    self.stamps = self.scan()
+
+  def scan(self):
+    self.index.refresh()
+    self.index.write()
+    stamps = {}
+    for extension in self.extensions:
+      for relative in self.index.files(extension):
+        stamp = self.index.stamp(relative) # None if removed since it was listed
+        stamps[os.path.normpath(os.path.join(self.folder, relative))] = tuple(stamp) if stamp != None else None
+    if self.entryNames:
+      for relative in self.index.files('.nmm'):
+        names = self.index.getEntryNames(relative)
+        if names != None:
+          path = os.path.normpath(os.path.join(self.folder, names))
+          stamps[path] = getStamp(path)
+    for path in self.extra:
+      stamps[path] = getStamp(path)
+    return stamps
+
+  def poll(self):
+    """returns the set of paths that changed since the last poll"""
+    stamps = self.scan()
+    changed = set(path for path in stamps.keys() | self.stamps.keys() if stamps.get(path) != self.stamps.get(path))
+    self.stamps = stamps
+    return changed
+
+  def wait(self, interval, settle = 0.05):
+    """Blocks until files change, then until they stop changing (editors often save in steps).
+    Returns the paths that changed."""
+    changed = self.poll()
+    while not changed:
+      time.sleep(interval)
+      changed = self.poll()
+    while True:
+      time.sleep(settle)
+      more = self.poll()
+      if not more:
+        return changed
+      changed |= more
+
+def watch(watcher, build, interval, inputErrors = (), showInputError = print):
+  """Calls build with the changed paths whenever files change, until interrupted with Ctrl+C.
+  Errors are reported and the watch goes on, so a bad save doesn't need a restart."""
+  print("Watching `{}` for changes, press Ctrl+C to stop.".format(watcher.folder))
+  try:
+    while True:
+      romview.closeRoms() # don't keep the ROMs mapped while waiting
+      changed = watcher.wait(interval)
+      start = time.perf_counter()
+      try:
+        build(changed)
+      except inputErrors as e:
+        showInputError(e)
+      except Exception:
+        import traceback
+        traceback.print_exc()
+      print("Done in {:.0f} ms.".format((time.perf_counter() - start) * 1000))
+  except KeyboardInterrupt:
+    print("Stopped watching.")